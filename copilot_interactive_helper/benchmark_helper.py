@@ -0,0 +1,2106 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for Copilot Helper
+
+Drives the helper's hot paths against stubbed script runners and stand-in
+processes, so the numbers can be reproduced on any machine (including Linux
+CI, where osascript and launchctl do not exist). Every scenario prints its
+measurements and exits non-zero when it misses its budget.
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import json
+import logging
+import os
+import pwd
+import random
+import re
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from copilot_helper import (
+    SCRIPT_TEMPLATES, AppleScriptBackend, AsyncMonitorEngine, AuditStore, CompiledScriptCache,
+    ControlClient, ControlError, ControlServer, CopilotHelper, DecisionCache, DialogWindow, FakeSessionSource,
+    GUISession, Histogram, IncrementalScanner, LogPipeline, LoginWindowSessionSource, Metrics, PollingScheduler,
+    RuleTable, ScriptHostWorker, SessionResolver, SimulatedDesktop, TraceRecorder,
+    aggregate_audit, format_status, normalize_button, open_audit, open_trace, parse_dialog_snapshot,
+    query_audit, read_config_cached, replay_trace
+)
+
+
+# Stand-in for osascript. With "-e SCRIPT" it echoes the script and exits (spawn
+# mode); without arguments it speaks the script host's JSON-lines protocol,
+# echoing each script, or the arguments of compiled-file requests.
+STAND_IN_OSASCRIPT = r'''
+import json, sys
+
+if "-e" in sys.argv:
+    print(sys.argv[sys.argv.index("-e") + 1])
+    sys.exit(0)
+
+for line in sys.stdin:
+    request = json.loads(line)
+    output = request.get("script") or " ".join(request.get("args", []))
+    sys.stdout.write(json.dumps({"id": request["id"], "ok": True, "output": output}) + "\n")
+    sys.stdout.flush()
+'''
+
+
+class CountingRunner:
+    """Stand-in for subprocess.run that records every command it is given"""
+
+    def __init__(self, responder=None):
+        self.calls = []
+        self.responder = responder or (lambda cmd: "not_found")
+
+    def __call__(self, cmd, **kwargs):
+        self.calls.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, stdout=self.responder(cmd), stderr="")
+
+
+class FakeSessionResolver(SessionResolver):
+    """Session resolver whose lookups are charged as the subprocesses they replace"""
+
+    def lookup_user(self):
+        self.command_runner(["python3", "-c", "SCDynamicStoreCopyConsoleUser"])
+        return "tester"
+
+    def lookup_uid(self, user):
+        self.command_runner(["id", "-u", user])
+        return "501"
+
+
+# Stand-in for a slow osascript running a compiled template: every script
+# takes 50 ms, scripts given the "Pathological" process hang for 2 s, snapshots
+# of Terminal report a dialog and anything that is not a snapshot is a click
+# that succeeds.
+SLOW_OSASCRIPT = r'''
+import json, os, sys, time
+
+template = os.path.basename(sys.argv[1]).rsplit("-", 1)[0]
+args = sys.argv[2:]
+time.sleep(2.0 if "Pathological" in " ".join(args) else 0.05)
+if template != "dialog_snapshot":
+    print("clicked")
+elif "Terminal" in json.loads(args[0]):
+    print(json.dumps([["Terminal", "Confirm", 1, ["Cancel", "Continue"]]]))
+else:
+    print("[]")
+'''
+
+
+class StubCompiler:
+    """Stand-in for osacompile that copies the source to the output file"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self, cmd, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise FileNotFoundError(cmd[0])
+        shutil.copyfile(cmd[-1], cmd[cmd.index("-o") + 1])
+        return subprocess.CompletedProcess(cmd, 0, stdout="", stderr="")
+
+
+def make_helper(runner, resolver=None, script_host_factory=None, script_cache=None, backend=None, clock=None,
+                **config):
+    """Build a helper with a throwaway config file, script cache and stubbed runner"""
+    workdir = tempfile.mkdtemp(prefix="copilot_helper_bench_")
+    config_file = os.path.join(workdir, "config.json")
+    config = dict(CopilotHelper.isolated_config(workdir), **config)
+    # Stubbed desktops have no real processes behind them
+    config.setdefault("process_prefilter", False)
+    # Stubbed runners are not real spawns, and the benchmark's own CPU is not the monitor's
+    config.setdefault("cpu_budget_percent", 0)
+    config.setdefault("spawn_budget_per_minute", 0)
+    # Scan every target every tick unless a benchmark is measuring the scan schedule
+    config.setdefault("frequency_schedule", False)
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+    script_cache = script_cache or CompiledScriptCache(os.path.join(workdir, "scripts"),
+                                                       compiler=StubCompiler())
+    return CopilotHelper(config_file, session_resolver=resolver, command_runner=runner,
+                         script_host_factory=script_host_factory, script_cache=script_cache, backend=backend,
+                         clock=clock)
+
+
+def osascript_tail(cmd):
+    """Arguments given to osascript by a launchctl command line"""
+    return cmd[cmd.index("/usr/bin/osascript") + 1:]
+
+
+def template_call(cmd):
+    """Split an osascript command line into (template name, arguments)
+
+    Works for compiled files and for templates run from source; the name is
+    None for anything else.
+    """
+    if "/usr/bin/osascript" not in cmd:
+        return None, []
+    tail = osascript_tail(cmd)
+    if tail[0] == "-l":
+        names = [name for name, template in SCRIPT_TEMPLATES.items() if template.source == tail[3]]
+        return (names[0] if names else None), tail[4:]
+    return os.path.basename(tail[0]).rsplit("-", 1)[0], tail[1:]
+
+
+def write_stand_in(source):
+    """Write a stand-in executable to a temp file and return its command line"""
+    fd, path = tempfile.mkstemp(prefix="copilot_helper_stand_in_", suffix=".py")
+    with os.fdopen(fd, "w") as f:
+        f.write(source)
+    return [sys.executable, path]
+
+
+class SimClock:
+    """Manually advanced clock for simulated-time benchmarks"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def synthetic_snapshot(windows, processes=None, seed=0):
+    """Build DIALOG_SNAPSHOT_SCRIPT-style output with the given number of windows"""
+    rng = random.Random(seed)
+    processes = processes or [f"App {i}" for i in range(max(1, windows // 10))]
+    button_sets = [["Cancel", "Continue"], ["Don't Save", "Cancel", "Save"], ["OK"],
+                   ["Deny", "Allow"], ["Close", "Minimize", "Zoom"]]
+    rows = []
+    for i in range(windows):
+        rows.append([rng.choice(processes), f"Window {i}", i % 10 + 1, rng.choice(button_sets)])
+    return json.dumps(rows)
+
+
+def stand_in_runner(stand_in):
+    """subprocess.run replacement that swaps launchctl/osascript for the stand-in"""
+    def run(cmd, **kwargs):
+        return subprocess.run(stand_in + osascript_tail(cmd), **kwargs)
+    return run
+
+
+def run_probe_tick(helper):
+    """Run one monitor tick's worth of probes without sleeping"""
+    buttons = helper.get_all_buttons_to_click()
+    for process_name in helper.common_processes:
+        helper.click_button_in_process(process_name, buttons)
+
+
+class UncachedSessionResolver(SessionResolver):
+    """The lookups as they were before the resolver: python3 and `id -u` spawned on every call"""
+
+    def lookup_user(self):
+        return self._lookup_user_subprocess()
+
+    def lookup_uid(self, user):
+        result = self.command_runner(["id", "-u", user], capture_output=True, text=True)
+        return result.stdout.strip()
+
+
+def user_owned_console():
+    """A stand-in for /dev/console owned by a non-root user, as it is while someone is logged in"""
+    fd, path = tempfile.mkstemp(prefix="copilot_helper_console_")
+    os.close(fd)
+    if os.getuid() == 0:
+        os.chown(path, next(entry.pw_uid for entry in pwd.getpwall() if entry.pw_uid != 0), -1)
+    return path
+
+
+def bench_session(ticks):
+    """Subprocess spawns per tick with the per-call lookups the resolver replaced and with the resolver"""
+    print("🔑 Session resolver: subprocess spawns per tick")
+
+    console = user_owned_console()
+    user = pwd.getpwuid(os.stat(console).st_uid).pw_name
+    uid = str(os.stat(console).st_uid)
+
+    def respond(cmd):
+        return {"python3": user, "id": uid}.get(cmd[0], "not_found")
+
+    results = {}
+    for label, resolver_class in (("uncached", UncachedSessionResolver), ("cached", SessionResolver)):
+        runner = CountingRunner(respond)
+        resolver = resolver_class(ttl=0.0 if resolver_class is UncachedSessionResolver else 30.0,
+                                  command_runner=runner)
+        resolver.CONSOLE_DEVICE = console
+        helper = make_helper(runner, resolver, script_host="spawn")
+        for _ in range(ticks):
+            run_probe_tick(helper)
+        results[label] = len(runner.calls) / ticks
+        lookups = sum(1 for cmd in runner.calls if cmd[0] in ("python3", "id"))
+        print(f"  {label:>9}: {results[label]:.1f} spawns/tick ({resolver.resolutions} session resolutions, "
+              f"{lookups} lookup spawns over {ticks} ticks)")
+    os.unlink(console)
+
+    ratio = results["uncached"] / results["cached"]
+    print(f"  reduction: {ratio:.2f}x")
+    return ratio >= 3.0
+
+
+def bench_batching(ticks):
+    """Click-script invocations per tick for each batching scope"""
+    print("📦 Batched click engine: script invocations per tick")
+
+    probe = make_helper(CountingRunner(), script_host="spawn")
+    legacy = len(probe.common_processes) * len(probe.get_all_buttons_to_click())
+    print(f"  per (process, button) probing: {legacy} scripts/tick")
+
+    results = {}
+    for scope in ("process", "tick"):
+        runner = CountingRunner(lambda cmd: "")
+        helper = make_helper(runner, FakeSessionResolver(command_runner=lambda *a, **k: None),
+                             scan_mode="batched", batch_scope=scope, script_host="spawn")
+        helper.is_running = True
+        for _ in range(ticks):
+            helper.run_tick()
+        results[scope] = len(runner.calls) / ticks
+        print(f"  batch_scope={scope:<7}: {results[scope]:.1f} scripts/tick "
+              f"({legacy / results[scope]:.0f}x fewer)")
+
+    return results["tick"] <= 1 and results["process"] <= len(probe.common_processes)
+
+
+def bench_script_host(ticks):
+    """Per-call latency of spawn-per-script versus the persistent script host"""
+    print("🧵 Script host: per-call latency, spawn mode vs worker mode")
+
+    stand_in = write_stand_in(STAND_IN_OSASCRIPT)
+    calls = ticks * 5
+    latencies = {}
+    for mode in ("spawn", "worker"):
+        helper = make_helper(stand_in_runner(stand_in),
+                             FakeSessionResolver(command_runner=lambda *a, **k: None),
+                             script_host_factory=lambda uid: ScriptHostWorker(stand_in),
+                             script_host=mode)
+        samples = []
+        for i in range(calls):
+            started = time.perf_counter()
+            success, output = helper.run_applescript_as_user(f"probe {i}")
+            samples.append(time.perf_counter() - started)
+            if not success or output != f"probe {i}":
+                print(f"  {mode}: unexpected response {output!r}")
+                return False
+        helper.stop_script_host()
+        latencies[mode] = statistics.mean(samples[1:]) * 1000
+        print(f"  {mode:>6}: {latencies[mode]:.3f} ms/call over {calls} calls")
+    print(f"  speedup: {latencies['spawn'] / latencies['worker']:.0f}x")
+    return latencies["worker"] * 5 < latencies["spawn"]
+
+
+def bench_snapshot(ticks):
+    """Scripts per tick with one snapshot per tick, and parser cost on large snapshots"""
+    print("📸 Snapshot scan: scripts per tick and parser throughput")
+
+    dialog = json.dumps([["Terminal", "Confirm", 1, ["Cancel", "Continue"]]])
+    results = {}
+    for label, snapshot in (("idle", "[]"), ("dialog", dialog)):
+        def respond(cmd, snapshot=snapshot):
+            return snapshot if template_call(cmd)[0] == "dialog_snapshot" else "clicked"
+        runner = CountingRunner(respond)
+        helper = make_helper(runner, FakeSessionResolver(command_runner=lambda *a, **k: None),
+                             script_host="spawn", incremental_scan=False, click_dedup_ttl=0.0)
+        clicks = sum(helper.run_tick() for _ in range(ticks))
+        results[label] = len(runner.calls) / ticks
+        print(f"  {label:>6} ticks: {results[label]:.1f} scripts/tick ({clicks} clicks)")
+
+    parse_ok = True
+    for windows in (100, 500, 2000):
+        text = synthetic_snapshot(windows)
+        rounds = max(10, 20000 // windows)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            parsed = parse_dialog_snapshot(text)
+        per_parse = (time.perf_counter() - started) / rounds * 1000
+        parse_ok = parse_ok and len(parsed) == windows and per_parse < windows * 0.01
+        print(f"  parse {windows:>5} windows: {per_parse:.3f} ms ({len(text) / 1024:.0f} KiB)")
+
+    return results["idle"] == 1 and results["dialog"] == 2 and parse_ok
+
+
+def replay_desktop(total_windows, churn, ticks, seed=0):
+    """Yield per-tick desktops ({process: [(title, buttons)]}) with `churn` windows replaced each tick"""
+    rng = random.Random(seed)
+    processes = [f"App {i}" for i in range(max(1, total_windows // 10))]
+    desktop = {name: [] for name in processes}
+    for i in range(total_windows):
+        desktop[processes[i % len(processes)]].append((f"Window {i}", ("Cancel", "Continue")))
+
+    serial = total_windows
+    for _ in range(ticks):
+        for _ in range(churn):
+            windows = desktop[rng.choice(processes)]
+            slot = rng.randrange(len(windows))
+            windows[slot] = (f"Window {serial}", windows[slot][1])
+            serial += 1
+        yield desktop
+
+
+def bench_incremental(ticks):
+    """Deep-scan work per tick as a function of churn, replayed against a synthetic desktop"""
+    print("🔁 Incremental scanner: deep-scanned windows per tick vs churn")
+
+    ok = True
+    for total in (100, 1000):
+        for churn in (0, 1, 10):
+            frames = replay_desktop(total, churn, ticks + 1)
+            state = {"desktop": next(frames), "deep": 0}
+
+            def list_titles(names):
+                return {name: [title for title, _ in state["desktop"][name]] for name in names}
+
+            def deep_scan(wanted):
+                state["deep"] += sum(len(indexes) for indexes in wanted.values())
+                return [DialogWindow(name, state["desktop"][name][i - 1][0], i, state["desktop"][name][i - 1][1])
+                        for name, indexes in wanted.items() for i in indexes]
+
+            scanner = IncrementalScanner(list_titles, deep_scan, clock=lambda: 0.0)
+            names = list(state["desktop"])
+            scanner.scan(names)  # warm-up: the first tick deep-scans everything
+            state["deep"] = 0
+            for desktop in frames:
+                state["desktop"] = desktop
+                found = scanner.scan(names)
+                ok = ok and len(found) == total
+            per_tick = state["deep"] / ticks
+            ok = ok and per_tick <= churn
+            print(f"  {total:>5} windows, churn {churn:>2}/tick: {per_tick:5.1f} deep-scanned/tick "
+                  f"(hits {scanner.hits}, misses {scanner.misses})")
+    return ok
+
+
+def bench_prefilter(ticks):
+    """Processes probed per tick when only 1 of the 9 targets is alive, using the real process table"""
+    print("🔎 Process prefilter: probes per tick with 1 of 9 targets alive")
+
+    sleeper = subprocess.Popen(["sleep", "60"])
+    try:
+        results = {}
+        for prefilter in (False, True):
+            probed = []
+
+            def respond(cmd):
+                probed.append(template_call(cmd))
+                return ""
+            helper = make_helper(CountingRunner(respond),
+                                 FakeSessionResolver(command_runner=lambda *a, **k: None),
+                                 script_host="spawn", scan_mode="batched", batch_scope="process",
+                                 process_prefilter=prefilter)
+            helper.common_processes = helper.common_processes[:8] + ["sleep"]
+            helper.is_running = True
+
+            started = time.perf_counter()
+            for _ in range(ticks):
+                helper.run_tick()
+            elapsed = (time.perf_counter() - started) / ticks * 1000
+            results[prefilter] = len(probed) / ticks
+            print(f"  prefilter {'on ' if prefilter else 'off'}: {results[prefilter]:.1f} probes/tick, "
+                  f"{elapsed:.2f} ms/tick of helper overhead")
+
+        helper.common_processes = helper.common_processes[:8]
+        idle_calls = len(probed)
+        helper.run_tick()
+        print(f"  no target alive: {len(probed) - idle_calls} probes")
+
+        table = helper.process_table
+        started = time.perf_counter()
+        for _ in range(ticks):
+            names = table.snapshot()
+        per_snapshot = (time.perf_counter() - started) / ticks * 1000
+        print(f"  process table snapshot: {per_snapshot:.2f} ms ({len(names)} processes)")
+    finally:
+        sleeper.kill()
+        sleeper.wait()
+
+    return results[False] == 9 and results[True] == 1 and len(probed) == idle_calls
+
+
+def burst_arrivals(horizon, seed=0):
+    """Dialog arrival times: a burst of approvals every ~10 minutes plus stray singletons"""
+    rng = random.Random(seed)
+    arrivals = []
+    start = 30.0
+    while start < horizon:
+        offset = 0.0
+        for _ in range(rng.randint(3, 8)):
+            arrivals.append(start + offset)
+            offset += rng.uniform(0.5, 3.0)
+        start += rng.uniform(400, 800)
+    arrivals.extend(rng.uniform(0, horizon) for _ in range(6))
+    return sorted(arrivals)
+
+
+def simulate_policy(scheduler, clock, arrivals, horizon, scan_cost=0.05, click_pause=0.0):
+    """Drive a scheduler in simulated time; return (ticks, detection latencies)"""
+    ticks = 0
+    latencies = []
+    next_arrival = 0
+    while clock.now < horizon:
+        ticks += 1
+        detected = False
+        if (next_arrival < len(arrivals) and arrivals[next_arrival] <= clock.now
+                and not scheduler.is_cooling_down("Terminal")):
+            latencies.append(clock.now - arrivals[next_arrival])
+            scheduler.record_click("Terminal")
+            next_arrival += 1
+            detected = True
+        scheduler.record_tick(detected)
+        clock.now += scan_cost + scheduler.next_interval() + (click_pause if detected else 0.0)
+    return ticks, latencies
+
+
+def bench_scheduler(ticks):
+    """Detection latency vs scan cost for polling policies, in simulated time"""
+    print("⏱️  Polling scheduler: one simulated hour of bursty approvals")
+
+    horizon = 3600.0
+    arrivals = burst_arrivals(horizon)
+    policies = [
+        ("fixed 0.5s + sleep(1)", dict(max_interval=0.5, idle_backoff=1.0, burst_interval=0.5,
+                                       burst_window=0.0, click_cooldown=0.0), 1.0),
+        ("fixed 0.1s", dict(base_interval=0.1, max_interval=0.1, idle_backoff=1.0,
+                            burst_window=0.0, click_cooldown=0.0), 0.0),
+        ("adaptive (default)", dict(), 0.0),
+        ("adaptive, 4s ceiling", dict(max_interval=4.0), 0.0),
+    ]
+
+    results = {}
+    for label, settings, click_pause in policies:
+        clock = SimClock()
+        scheduler = PollingScheduler(clock=clock, **settings)
+        tick_count, latencies = simulate_policy(scheduler, clock, arrivals, horizon,
+                                                click_pause=click_pause)
+        results[label] = (tick_count, latencies)
+        print(f"  {label:<22} {tick_count:>6} ticks/h   latency mean {statistics.mean(latencies):.2f}s "
+              f"p50 {percentile(latencies, 0.5):.2f}s p95 {percentile(latencies, 0.95):.2f}s "
+              f"({len(latencies)}/{len(arrivals)} dialogs)")
+
+    legacy_ticks, legacy_latencies = results["fixed 0.5s + sleep(1)"]
+    adaptive_ticks, adaptive_latencies = results["adaptive (default)"]
+    return (adaptive_ticks * 2 < legacy_ticks
+            and statistics.mean(adaptive_latencies) <= statistics.mean(legacy_latencies))
+
+
+def bench_async_engine(ticks):
+    """Tick latency with one hung process: serial threaded engine vs asyncio engine"""
+    print("⚡ Async engine: tick latency with one pathological process among 9")
+
+    stand_in = write_stand_in(SLOW_OSASCRIPT)
+    ticks = min(ticks, 5)
+    targets = ["Terminal", "iTerm2", "osascript", "System Settings", "SecurityAgent",
+               "UserNotificationCenter", "CoreServicesUIAgent", "loginwindow", "Pathological"]
+    results = {}
+
+    helper = make_helper(stand_in_runner(stand_in), FakeSessionResolver(command_runner=lambda *a, **k: None),
+                         script_host="spawn", scan_mode="batched", batch_scope="process",
+                         click_cooldown=0.0, click_dedup_ttl=0.0)
+    helper.common_processes = targets
+    helper.is_running = True
+    samples = []
+    for _ in range(ticks):
+        started = time.perf_counter()
+        helper.run_tick()
+        samples.append(time.perf_counter() - started)
+    results["thread"] = samples
+
+    helper.backend = AppleScriptBackend(helper, command_builder=lambda uid, name, args: stand_in + osascript_tail(
+        helper.build_template_command(uid, name, args)))
+    engine = AsyncMonitorEngine(helper, concurrency=4, tick_deadline=0.5)
+    clicks = 0
+    samples = []
+    for _ in range(ticks):
+        started = time.perf_counter()
+        clicks += asyncio.run(engine.run_tick())
+        samples.append(time.perf_counter() - started)
+    results["async"] = samples
+
+    for label, samples in results.items():
+        print(f"  {label:>6}: p50 {percentile(samples, 0.5) * 1000:.0f} ms, "
+              f"max {max(samples) * 1000:.0f} ms per tick")
+    print(f"  async: {clicks} clicks, {engine.cancelled_probes} probes cancelled at the 0.5 s deadline, "
+          f"Pathological {helper.health.state('Pathological')}")
+
+    # Cancelled probes count as timeouts, so the straggler is quarantined after a few ticks; the timing
+    # check is relative and loose on purpose (the cancellation itself is covered by the unit tests)
+    expected_cancels = min(ticks, helper.health.timeout_threshold)
+    return (clicks == ticks and engine.cancelled_probes == expected_cancels
+            and percentile(results["async"], 0.5) * 2 < percentile(results["thread"], 0.5))
+
+
+class HangingRunner:
+    """Stubbed runner in simulated time: scripts naming "Hung App" time out after 10 s"""
+
+    def __init__(self, clock, responder=None):
+        self.clock = clock
+        self.responder = responder or (lambda cmd: "")
+        self.timeouts = 0
+        self.healthy_calls = 0
+
+    def __call__(self, cmd, **kwargs):
+        if any("Hung App" in part for part in cmd):
+            self.timeouts += 1
+            self.clock.now += 10.0
+            raise subprocess.TimeoutExpired(cmd, 10)
+        self.healthy_calls += 1
+        self.clock.now += 0.05
+        return subprocess.CompletedProcess(cmd, 0, stdout=self.responder(cmd), stderr="")
+
+
+def bench_circuit_breaker(ticks):
+    """Timeouts paid over ten simulated minutes with one hung process, with and without quarantine"""
+    print("🚧 Circuit breaker: one hung process among 9, ten simulated minutes")
+
+    horizon = 600.0
+    results = {}
+    for label, settings in (("no breaker", dict(circuit_failure_threshold=10 ** 9,
+                                                circuit_timeout_threshold=10 ** 9)),
+                            ("breaker", dict())):
+        clock = SimClock()
+        runner = HangingRunner(clock)
+        helper = make_helper(runner, FakeSessionResolver(command_runner=lambda *a, **k: None), clock=clock,
+                             script_host="spawn", scan_mode="batched", batch_scope="process", **settings)
+        helper.common_processes = helper.common_processes[:8] + ["Hung App"]
+        helper.is_running = True
+
+        tick_count = 0
+        while clock.now < horizon:
+            helper.scheduler.record_tick(helper.run_tick() > 0)
+            clock.now += helper.scheduler.next_interval()
+            tick_count += 1
+        results[label] = runner
+        print(f"  {label:>10}: {tick_count:>4} ticks, {runner.timeouts:>3} timeouts paid, "
+              f"{runner.healthy_calls / (horizon / 60):.0f} healthy probes/min, "
+              f"Hung App {helper.health.state('Hung App')}")
+
+    return results["breaker"].timeouts * 5 < results["no breaker"].timeouts
+
+
+def bench_script_cache(ticks):
+    """Compiles per template, reuse across restarts and lookup cost, with a stubbed osacompile"""
+    print("🗜️  Compiled script cache: compiles, reuse and lookup cost")
+
+    cache_dir = tempfile.mkdtemp(prefix="copilot_helper_scripts_")
+    hostile = 'Confirm" & (do shell script "touch /tmp/pwned") & "'
+    calls = []
+
+    def respond(cmd):
+        name, args = template_call(cmd)
+        calls.append((name, args, osascript_tail(cmd)[0] != "-l"))
+        if name == "dialog_snapshot":
+            return json.dumps([["Terminal", hostile, 1, ["Cancel", "Continue"]]])
+        if name == "window_titles":
+            return json.dumps({"Terminal": [hostile]})
+        return "clicked"
+
+    def run(compiler, cache_dir):
+        del calls[:]
+        helper = make_helper(CountingRunner(respond), FakeSessionResolver(command_runner=lambda *a, **k: None),
+                             script_cache=CompiledScriptCache(cache_dir, compiler=compiler),
+                             script_host="spawn", click_cooldown=0.0, click_dedup_ttl=0.0)
+        helper.common_processes = ["Terminal"]
+        helper.check_accessibility_permissions()
+        return sum(helper.run_tick() for _ in range(ticks))
+
+    compiler = StubCompiler()
+    clicks = run(compiler, cache_dir)
+    used = {name for name, _, _ in calls}
+    compiled_runs = sum(1 for _, _, compiled in calls if compiled)
+    print(f"  {ticks} ticks: {len(calls)} script runs ({compiled_runs} from cache), "
+          f"{compiler.calls} compiles for {len(used)} templates, {clicks} clicks")
+
+    # Names travel as argv: the hostile title reaches the click verbatim, never the source
+    clicked = [args for name, args, _ in calls if name == "click_button"]
+    sources = "".join(open(os.path.join(cache_dir, entry)).read() for entry in os.listdir(cache_dir))
+    contained = bool(clicked) and all(args[2] == hostile for args in clicked) and "pwned" not in sources
+    print(f"  hostile window title passed as an argument: {'ok' if contained else 'FAILED'}")
+
+    restarted = StubCompiler()
+    run(restarted, cache_dir)
+    print(f"  restart with a warm cache: {restarted.calls} compiles")
+
+    cache = CompiledScriptCache(cache_dir, compiler=StubCompiler())
+    template = SCRIPT_TEMPLATES["click_button"]
+    started = time.perf_counter()
+    rounds = 10000
+    for _ in range(rounds):
+        cache.lookup(template)
+    per_lookup = (time.perf_counter() - started) / rounds * 1e6
+    print(f"  cached lookup: {per_lookup:.1f} µs")
+
+    # Version bumps, pruning and the fallback without osacompile are covered by the unit tests
+    return (compiler.calls == len(used) and compiled_runs == len(calls) and contained
+            and restarted.calls == 0 and clicks == ticks and per_lookup < 50)
+
+
+def bench_control_plane(ticks):
+    """Status latency over the control socket vs a fresh CLI instance, plus remote stop"""
+    print("🔌 Control plane: status over the Unix socket vs a fresh helper instance")
+
+    def respond(cmd):
+        name, _ = template_call(cmd)
+        return {"accessibility_check": "accessible", "window_titles": "{}"}.get(name, "[]")
+
+    workdir = tempfile.mkdtemp(prefix="copilot_helper_ctl_")
+    socket_path = os.path.join(workdir, "helper.sock")
+    helper = make_helper(CountingRunner(respond), FakeSessionResolver(command_runner=lambda *a, **k: None),
+                         script_host="spawn", enabled=True)
+    helper.start()
+    ok = helper.serve_control(socket_path) is not None
+
+    client = ControlClient(socket_path)
+    samples = []
+    for _ in range(ticks * 10):
+        started = time.perf_counter()
+        report = client.request("status")
+        samples.append(time.perf_counter() - started)
+    ok = ok and report["running"]
+    print(f"  socket status: p50 {percentile(samples, 0.5) * 1000:.2f} ms, "
+          f"p95 {percentile(samples, 0.95) * 1000:.2f} ms over {len(samples)} requests")
+
+    rival = ControlServer(socket_path, {})
+    try:
+        rival.start()
+        refused = False
+    except ControlError:
+        refused = True
+    print(f"  second daemon on a live socket: {'refused' if refused else 'NOT refused'}")
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "copilot_helper.py")
+    env = dict(os.environ, HOME=workdir)
+    cli = {}
+    for label, path in (("thin client", socket_path), ("fresh helper", os.path.join(workdir, "none.sock"))):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, script, "status", "--socket", path],
+                                capture_output=True, text=True, env=env).stdout
+        cli[label] = (time.perf_counter() - started, output)
+        print(f"  CLI status via {label:<12}: {cli[label][0] * 1000:.0f} ms, "
+              f"{'Running: Yes' if 'Running: Yes' in output else 'Running: No'}")
+    ok = ok and "Running: Yes" in cli["thin client"][1] and "Running: No" in cli["fresh helper"][1]
+
+    stats = client.request("stats")
+    stopped = client.request("stop")
+    # The daemon replies first and stops on another thread
+    stopped = stopped and wait_until(lambda: not helper.is_running, timeout=5.0) is not None
+    print(f"  remote stop: {'ok' if stopped else 'FAILED'} "
+          f"after {stats['ticks']} ticks, {stats['control_requests']} control requests")
+    helper.stop_control()
+
+    # `stop` from the CLI against a real daemon process, which exits as soon as it has stopped
+    daemon_config = os.path.join(workdir, "daemon.json")
+    with open(daemon_config, "w") as f:
+        json.dump(dict(CopilotHelper.isolated_config(workdir), enabled=True, ui_backend="simulated"), f)
+    daemon_socket = os.path.join(workdir, "daemon.sock")
+    replies = []
+    for _ in range(3):
+        daemon = subprocess.Popen([sys.executable, script, "start", "--config", daemon_config,
+                                   "--socket", daemon_socket], stdout=subprocess.DEVNULL, env=env)
+        wait_until(lambda: ControlClient(daemon_socket, timeout=0.5).ping(), timeout=10.0)
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, script, "stop", "--config", daemon_config, "--socket", daemon_socket],
+                                capture_output=True, text=True, env=env).stdout.strip()
+        replies.append((output, time.perf_counter() - started))
+        daemon.wait(timeout=10)
+    cli_stopped = all(output == "Copilot Helper stopped" for output, _ in replies)
+    print(f"  CLI stop of a daemon process: {sum(output == 'Copilot Helper stopped' for output, _ in replies)}/3 "
+          f"confirmed, slowest reply {max(elapsed for _, elapsed in replies) * 1000:.0f} ms"
+          f"{'' if cli_stopped else f', got {replies[0][0]!r}'}")
+
+    # A socket file left behind by a crashed daemon does not block the next one
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    replacement = ControlServer(socket_path, {"status": lambda request: "fresh"})
+    replacement.start()
+    recovered = ControlClient(socket_path).request("status") == "fresh"
+    replacement.stop()
+    print(f"  stale socket replaced: {'ok' if recovered else 'FAILED'}")
+
+    return (ok and refused and stopped and cli_stopped and recovered
+            and percentile(samples, 0.95) < 0.01)
+
+
+def bench_hot_reload(ticks):
+    """Tick gaps while the config file is edited under a running monitor, vs stop/sleep(1)/start"""
+    print("♻️  Hot reload: tick gaps across config edits of a running monitor")
+
+    def respond(cmd):
+        name, _ = template_call(cmd)
+        if name == "dialog_snapshot":
+            return json.dumps([["Terminal", "Confirm", 1, ["Cancel", "Trust"]]])
+        return {"accessibility_check": "accessible", "window_titles": json.dumps({"Terminal": ["Confirm"]})
+                }.get(name, "clicked")
+
+    interval = 0.02
+    helper = make_helper(CountingRunner(respond), FakeSessionResolver(command_runner=lambda *a, **k: None),
+                         script_host="spawn", enabled=True, incremental_scan=False, check_interval=interval,
+                         max_interval=interval, burst_interval=interval, click_cooldown=0.0,
+                         config_watch_interval=0.05)
+    helper.common_processes = ["Terminal"]
+    stamps = []
+    run_tick = helper.run_tick
+
+    def timed_tick(snapshot=None):
+        stamps.append(time.perf_counter())
+        return run_tick(snapshot)
+    helper.run_tick = timed_tick
+    compiled = []
+    get_buttons = helper.get_all_buttons_to_click
+    helper.get_all_buttons_to_click = lambda config=None: compiled.append(1) or get_buttons(config)
+
+    helper.start()
+    edits = max(4, ticks // 2)
+    configure_times = []
+    for i in range(edits):
+        time.sleep(0.15)
+        if i % 2:
+            # In-process configure, as the CLI does for its own instance
+            started = time.perf_counter()
+            helper.configure("check_interval", str(interval))
+            configure_times.append(time.perf_counter() - started)
+        else:
+            # Direct edit of the file, picked up by the watcher
+            config = json.load(open(helper.config_file))
+            config["custom_positive_buttons"] = ["Trust"] if i % 4 == 0 else []
+            with open(helper.config_file, "w") as f:
+                json.dump(config, f)
+    time.sleep(0.15)
+    clicks = helper.click_count
+    generation = helper.snapshot.generation
+    helper.stop()
+
+    gaps = [later - earlier for earlier, later in zip(stamps, stamps[1:])]
+    missed = sum(1 for gap in gaps if gap > interval * 5)
+    print(f"  {edits} edits over {len(stamps)} ticks: max gap {max(gaps) * 1000:.0f} ms, {missed} missed ticks, "
+          f"generation {generation}, button list compiled {len(compiled)} times, {clicks} clicks")
+    print(f"  configure() on a running monitor: {max(configure_times) * 1000:.1f} ms")
+
+    # The restart the old configure() did, for comparison
+    del stamps[:]
+    helper.start()
+    time.sleep(0.1)
+    helper.stop()
+    time.sleep(1)
+    helper.start()
+    time.sleep(0.1)
+    helper.stop()
+    legacy_gap = max(later - earlier for earlier, later in zip(stamps, stamps[1:]))
+    print(f"  stop/sleep(1)/start: {legacy_gap * 1000:.0f} ms blind window")
+
+    return (missed == 0 and generation == edits + 1 and len(compiled) == edits
+            and clicks > 0 and max(configure_times) < 0.05 and legacy_gap > 1.0)
+
+
+def synthetic_rules(count):
+    """Ordered button rules: mostly literals, with every 20th a glob and every 50th a regex"""
+    rules = []
+    for i in range(count):
+        if i % 50 == 0:
+            rules.append(f"re:choice {i}( now)?")
+        elif i % 20 == 0:
+            rules.append(f"glob:Option {i} *")
+        else:
+            rules.append(f"Action {i}")
+    return rules
+
+
+def synthetic_dialogs(windows, rule_count, seed=0):
+    """Windows whose buttons hit literal, glob and regex rules at any depth, or nothing"""
+    rng = random.Random(seed)
+    makers = [lambda i: f"action  {i}", lambda i: f"Option {i} later", lambda i: f"Choice {i} NOW",
+              lambda i: f"Unrelated {i}"]
+    return [DialogWindow("App", f"Window {n}", 1,
+                         tuple(rng.choice(makers)(rng.randrange(rule_count)) for _ in range(4)))
+            for n in range(windows)]
+
+
+def naive_choose(rules, buttons):
+    """The nested loop the rule engine replaces: every rule in order against every button"""
+    keys = [normalize_button(button) for button in buttons]
+    for literal, pattern in rules:
+        for button, key in zip(buttons, keys):
+            if (pattern.fullmatch(key) if pattern else literal == key):
+                return button
+    return None
+
+
+def bench_rule_engine(ticks):
+    """Per-window resolution cost of the compiled rule engine vs a nested loop, for thousands of rules"""
+    print("📐 Rule engine: per-window resolution with thousands of rules")
+
+    ok = True
+    for count in (100, 1000, 5000):
+        rules = synthetic_rules(count)
+        started = time.perf_counter()
+        table = RuleTable(rules)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        naive_rules = []
+        for rule in rules:
+            if rule.startswith("re:"):
+                naive_rules.append((None, re.compile(rule[3:], re.IGNORECASE)))
+            elif rule.startswith("glob:"):
+                naive_rules.append((None, re.compile(fnmatch.translate(rule[5:]), re.IGNORECASE)))
+            else:
+                naive_rules.append((normalize_button(rule), None))
+
+        windows = synthetic_dialogs(2000, count)
+        started = time.perf_counter()
+        compiled = [table.choose(window.buttons) for window in windows]
+        compiled_us = (time.perf_counter() - started) / len(windows) * 1e6
+        sample = windows[:200]
+        started = time.perf_counter()
+        naive = [naive_choose(naive_rules, window.buttons) for window in sample]
+        naive_us = (time.perf_counter() - started) / len(sample) * 1e6
+
+        agree = compiled[:len(sample)] == naive
+        matched = sum(1 for button in compiled if button)
+        ok = ok and agree and (count < 1000 or compiled_us * 10 < naive_us)
+        print(f"  {count:>5} rules: compile {compile_ms:6.1f} ms, {compiled_us:7.1f} µs/window "
+              f"vs nested loop {naive_us:9.1f} µs/window ({naive_us / compiled_us:.0f}x), "
+              f"{matched}/{len(windows)} matched, decisions {'agree' if agree else 'DIFFER'}")
+
+    return ok
+
+
+def bench_decision_cache(ticks):
+    """Repeat deep scans and clicks over ten simulated minutes, with and without the decision cache"""
+    print("🗂️  Decision cache: repeat work on windows that were already decided")
+
+    # Twenty windows nothing should be clicked in, and one approval dialog
+    # that stays up after every click
+    desktop = {name: [(f"{name} log {i}", ["Help", "Details"]) for i in range(5)]
+               for name in ("Terminal", "iTerm2", "osascript", "SecurityAgent")}
+    desktop["iTerm2"].append(("Confirm", ["Cancel", "Continue"]))
+    horizon, step = 600.0, 0.5
+
+    results = {}
+    for label, size in (("no cache", 0), ("cached", 1024)):
+        counts = {"deep": 0, "clicks": 0}
+
+        def respond(cmd):
+            name, args = template_call(cmd)
+            if name == "window_titles":
+                return json.dumps({p: [t for t, _ in desktop.get(p, [])] for p in json.loads(args[0])})
+            if name == "dialog_snapshot":
+                wanted = json.loads(args[1])
+                counts["deep"] += sum(1 for p, indexes in wanted.items() for i in indexes
+                                      if desktop[p][i - 1][0] != "Confirm")
+                return json.dumps([[p, desktop[p][i - 1][0], i, desktop[p][i - 1][1]]
+                                   for p, indexes in wanted.items() for i in indexes])
+            counts["clicks"] += 1
+            return "clicked"
+
+        clock = SimClock()
+        helper = make_helper(CountingRunner(respond), FakeSessionResolver(command_runner=lambda *a, **k: None),
+                             clock=clock, script_host="spawn", decision_cache_size=size, log_level="WARNING")
+        while clock.now < horizon:
+            helper.run_tick()
+            clock.now += step
+        results[label] = dict(counts)
+        cache = helper.decisions.stats()
+        print(f"  {label:>8}: {counts['deep']:4d} ignorable windows deep-scanned, {counts['clicks']:4d} clicks on the lingering "
+              f"dialog ({cache['hits']} hits, {cache['misses']} misses, {cache['entries']} entries)")
+
+    cache = DecisionCache(capacity=1000, clock=lambda: 0.0)
+    windows = [DialogWindow(f"App {i % 50}", f"Window {i}", 1, ("Help", "Details")) for i in range(100000)]
+    started = time.perf_counter()
+    for window in windows:
+        if cache.get(window) is None:
+            cache.record(window, DecisionCache.IGNORE)
+    per_op = (time.perf_counter() - started) / len(windows) * 1e6
+    stats = cache.stats()
+    print(f"  {len(windows)} distinct windows into 1000 slots: {stats['entries']} entries, "
+          f"{stats['evictions']} evictions, {per_op:.2f} µs per lookup+record")
+
+    plain, cached = results["no cache"], results["cached"]
+    return (cached["deep"] * 5 <= plain["deep"]
+            and cached["clicks"] <= horizon / helper.decisions.click_ttl + 1 and cached["clicks"] < plain["clicks"])
+
+
+class StalledFileHandler(logging.FileHandler):
+    """File handler on a disk that takes a millisecond per write"""
+
+    def emit(self, record):
+        time.sleep(0.001)
+        super().emit(record)
+
+
+def bench_logging(ticks):
+    """Logging cost on the monitor thread: queue vs direct file writes, DEBUG on/off, repeats and rotation"""
+    print("📝 Logging pipeline: caller-side cost, lazy formatting, repeat suppression and rotation")
+
+    workdir = tempfile.mkdtemp(prefix="copilot_helper_logs_")
+    calls = 500
+    results = {}
+    for label in ("direct", "queued"):
+        path = os.path.join(workdir, f"{label}.log")
+        logger = logging.getLogger(f"copilot_helper_bench.{label}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        if label == "direct":
+            handler = StalledFileHandler(path)
+            logger.addHandler(handler)
+        else:
+            pipeline = LogPipeline([StalledFileHandler(path)], repeat_window=0.0)
+            pipeline.start(logger)
+        started = time.perf_counter()
+        for i in range(calls):
+            logger.info("Successfully clicked '%s' in %s (%d)", "Continue", "Terminal", i)
+        results[label] = (time.perf_counter() - started) / calls * 1e6
+        if label == "direct":
+            logger.removeHandler(handler)
+            handler.close()
+        else:
+            pipeline.stop()
+        with open(path) as f:
+            written = sum(1 for _ in f)
+        print(f"  {label:>6} on a stalled disk: {results[label]:7.1f} µs per call on the caller, {written} lines written")
+        results[label + "_lines"] = written
+
+    # Whole monitor ticks: batched mode with a failing click script logs at DEBUG every tick
+    tick_us = {}
+    for level in ("INFO", "DEBUG"):
+        helper = make_helper(lambda cmd, **kwargs: subprocess.CompletedProcess(cmd, 1, stdout="", stderr="boom"),
+                             FakeSessionResolver(command_runner=lambda *a, **k: None),
+                             script_host="spawn", scan_mode="batched", log_level=level)
+        helper.setup_logging()
+        helper.is_running = True
+        rounds = max(ticks, 200)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            helper.run_tick()
+        tick_us[level] = (time.perf_counter() - started) / rounds * 1e6
+    print(f"  tick overhead: {tick_us['INFO']:.1f} µs/tick with DEBUG off, {tick_us['DEBUG']:.1f} µs/tick with DEBUG on")
+
+    # A disabled debug call with lazy arguments never builds the message
+    quiet = logging.getLogger("copilot_helper_bench.quiet")
+    quiet.setLevel(logging.INFO)
+    targets = [f"App {i}" for i in range(50)]
+    rounds = 20000
+    started = time.perf_counter()
+    for _ in range(rounds):
+        quiet.debug(f"Snapshot of {targets} failed")
+    eager_ns = (time.perf_counter() - started) / rounds * 1e9
+    started = time.perf_counter()
+    for _ in range(rounds):
+        quiet.debug("Snapshot of %s failed", targets)
+    lazy_ns = (time.perf_counter() - started) / rounds * 1e9
+    print(f"  disabled debug call: f-string {eager_ns:.0f} ns, lazy %-args {lazy_ns:.0f} ns")
+
+    clock = SimClock()
+    path = os.path.join(workdir, "repeats.log")
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    pipeline = LogPipeline([handler], repeat_window=10.0)
+    pipeline.repeats.clock = clock
+    logger = logging.getLogger("copilot_helper_bench.repeats")
+    logger.propagate = False
+    pipeline.start(logger)
+    for _ in range(10000):
+        logger.warning("Quarantining %s after repeated scan failures", "Hung App")
+    clock.now = 11.0
+    logger.warning("Quarantining %s after repeated scan failures", "Hung App")
+    pipeline.stop()
+    with open(path) as f:
+        lines = f.read().splitlines()
+    suppressed_ok = len(lines) == 2 and lines[1].endswith("(repeated 9999 more times)")
+    print(f"  10001 identical warnings: {len(lines)} lines written, "
+          f"{pipeline.repeats.suppressed} suppressed ({'ok' if suppressed_ok else 'FAILED'})")
+
+    limit = 64 * 1024
+    path = os.path.join(workdir, "rotating.log")
+    pipeline = LogPipeline.from_config(path, {"log_max_bytes": limit, "log_backup_count": 2, "log_repeat_window": 0},
+                                       console=False)
+    logger = logging.getLogger("copilot_helper_bench.rotating")
+    logger.propagate = False
+    pipeline.start(logger)
+    for i in range(20000):
+        logger.warning("Ignoring unreadable config file change: %d", i)
+    pipeline.stop()
+    files = [name for name in os.listdir(workdir) if name.startswith("rotating.log")]
+    total = sum(os.path.getsize(os.path.join(workdir, name)) for name in files)
+    rotated_ok = len(files) == 3 and total <= 3 * limit
+    print(f"  ~1 MiB through a {limit // 1024} KiB x 3 rotation: {len(files)} files, {total / 1024:.0f} KiB on disk")
+
+    return (results["queued"] * 10 < results["direct"] and results["queued_lines"] == results["direct_lines"] == calls
+            and lazy_ns < eager_ns and suppressed_ok and rotated_ok)
+
+
+def parse_prometheus(text):
+    """Map 'name{labels}' to float for every sample line of a Prometheus text file"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            key, value = line.rsplit(" ", 1)
+            samples[key] = float(value)
+    return samples
+
+
+def bench_metrics(ticks):
+    """Instrumentation cost with metrics off and on, exported counters, percentile accuracy and child CPU"""
+    print("📊 Metrics: instrumentation overhead, Prometheus export and percentiles")
+
+    metrics = Metrics(enabled=False)
+    rounds = 100000
+    started = time.perf_counter()
+    for _ in range(rounds):
+        metrics.observe("click_seconds", 0.01, "Terminal")
+        metrics.count("clicks_total", "Terminal")
+    disabled_ns = (time.perf_counter() - started) / rounds / 2 * 1e9
+    print(f"  disabled count/observe: {disabled_ns:.0f} ns per call")
+
+    dialog = json.dumps([["Terminal", "Confirm", 1, ["Cancel", "Continue"]]])
+
+    def respond(cmd):
+        return dialog if template_call(cmd)[0] == "dialog_snapshot" else "clicked"
+
+    tick_us = {}
+    for enabled in (False, True):
+        helper = make_helper(CountingRunner(respond), FakeSessionResolver(command_runner=lambda *a, **k: None),
+                             script_host="spawn", incremental_scan=False, click_cooldown=0.0,
+                             click_dedup_ttl=0.0, metrics=enabled, metrics_interval=3600.0,
+                             metrics_file=os.path.join(tempfile.mkdtemp(prefix="copilot_helper_metrics_"), "m.prom"))
+        helper.setup_logging()  # Ticks of a running daemon log their clicks
+        helper.common_processes = ["Terminal"]
+        rounds = max(ticks, 500)
+        clicks = 0
+        started = time.perf_counter()
+        for _ in range(rounds):
+            tick_started = time.perf_counter()
+            clicks += helper.run_tick()
+            helper.record_tick_metrics(tick_started)
+        tick_us[enabled] = (time.perf_counter() - started) / rounds * 1e6
+    overhead = tick_us[True] / tick_us[False] - 1
+    print(f"  tick cost: {tick_us[False]:.1f} µs off, {tick_us[True]:.1f} µs on ({overhead * 100:+.0f}%)")
+
+    helper.export_metrics()
+    with open(helper.config["metrics_file"]) as f:
+        samples = parse_prometheus(f.read())
+    exported = (samples["copilot_helper_ticks_total"] == rounds
+                and samples['copilot_helper_clicks_total{process="Terminal"}'] == clicks
+                and samples['copilot_helper_scripts_total{mode="spawn"}'] == 2 * rounds
+                and samples['copilot_helper_tick_seconds_bucket{le="+Inf"}'] == rounds
+                and samples['copilot_helper_script_seconds_count{script="dialog_snapshot"}'] == rounds
+                and 'copilot_helper_child_cpu_seconds_total{mode="user"}' in samples)
+    # Counters past a million keep every increment
+    large = Metrics(enabled=True)
+    large.count("ticks_total", amount=1234567)
+    large.count("ticks_total")
+    exported = exported and parse_prometheus(large.render())["copilot_helper_ticks_total"] == 1234568
+    summary = helper.stats()["metrics"]["histograms"]["script_seconds"]["dialog_snapshot"]
+    print(f"  exported {len(samples)} samples: {'ok' if exported else 'FAILED'}; dialog_snapshot "
+          f"p50 {summary['p50'] * 1e6:.1f} µs, p95 {summary['p95'] * 1e6:.1f} µs, p99 {summary['p99'] * 1e6:.1f} µs")
+
+    rng = random.Random(0)
+    values = [rng.lognormvariate(-4, 1) for _ in range(20000)]
+    histogram = Histogram()
+    for value in values:
+        histogram.observe(value)
+    errors = {q: abs(histogram.percentile(q) / percentile(values, q) - 1) for q in (0.5, 0.95, 0.99)}
+    accurate = all(error < 0.15 for error in errors.values())
+    print("  percentile error on 20000 lognormal samples: " +
+          ", ".join(f"p{int(q * 100)} {error * 100:.1f}%" for q, error in errors.items()))
+
+    clock = SimClock()
+    helper = make_helper(HangingRunner(clock, lambda cmd: "[]"), FakeSessionResolver(command_runner=lambda *a, **k: None),
+                         script_host="spawn", incremental_scan=False, metrics=True)
+    helper.common_processes = ["Hung App"]
+    helper.run_tick()
+    timeouts = helper.metrics.summary()["counters"]
+    # The combined snapshot times out, then so does the retry that isolates the culprit
+    timed = (timeouts["script_timeouts_total"]["dialog_snapshot"] == 2
+             and "script_timeout_seconds_total" in timeouts)
+    print(f"  timeout path: {timeouts['script_timeouts_total']} timeouts counted ({'ok' if timed else 'FAILED'})")
+
+    before = Metrics.child_cpu()
+    for _ in range(3):
+        subprocess.run([sys.executable, "-c", "sum(range(3000000))"], check=True)
+    after = Metrics.child_cpu()
+    child_cpu = after["user"] + after["system"] - before["user"] - before["system"]
+    print(f"  child CPU after three CPU-bound children: {child_cpu * 1000:.0f} ms")
+
+    return disabled_ns < 500 and overhead < 0.5 and exported and accurate and timed and child_cpu > 0
+
+
+def sim_helper(desktop, clock, **config):
+    """Helper running unchanged against a simulated desktop, with every component on the simulated clock"""
+    config.setdefault("process_prefilter", True)
+    return make_helper(None, backend=desktop, clock=clock, script_host="spawn", **config)
+
+
+def dialog_arrivals(horizon, processes, seed=0):
+    """(time, process, title, buttons, expected button) for a mixed stream of dialogs"""
+    rng = random.Random(seed)
+    kinds = [(["Cancel", "Continue"], "Continue"), (["Deny", "Allow"], "Allow"), (["OK"], "OK"),
+             (["Don't Save", "Cancel", "Save"], None)]
+    arrivals, now, serial = [], 0.0, 0
+    while True:
+        now += rng.expovariate(1 / 3.0)
+        if now >= horizon:
+            return arrivals
+        buttons, expected = rng.choice(kinds)
+        arrivals.append((now, rng.choice(processes), f"Dialog {serial}", buttons, expected))
+        serial += 1
+
+
+def bench_simulated_desktop(ticks):
+    """The threaded and async engines against an in-memory desktop with latency and a hung process"""
+    print("🖥️  Simulated desktop: time-to-click over ten simulated minutes, healthy and with one hung process")
+
+    processes = ["Terminal", "iTerm2", "osascript", "SecurityAgent"]
+    horizon = 600.0
+    threaded_ok = True
+    for label, hung in (("healthy", False), ("hung", True)):
+        clock = SimClock()
+
+        def advance(seconds):
+            clock.now += seconds
+
+        desktop = SimulatedDesktop(latency=0.02, timeout=10.0, clock=clock, sleep=advance)
+        for name in processes + ["CoreServicesUIAgent"]:
+            desktop.launch(name)
+        desktop.hang("CoreServicesUIAgent", hung)
+        helper = sim_helper(desktop, clock)
+
+        pending = dialog_arrivals(horizon, processes)
+        expected = {title: (arrived, button) for arrived, _, title, _, button in pending}
+        pending.reverse()
+        tick_count = 0
+        while clock.now < horizon:
+            while pending and pending[-1][0] <= clock.now:
+                _, process, title, buttons, _ = pending.pop()
+                desktop.open_window(process, title, buttons)
+            helper.run_tick()
+            tick_count += 1
+            helper.scheduler.record_tick(False)
+            advance(helper.scheduler.next_interval())
+
+        latencies, wrong = [], 0
+        for clicked_at, _, title, button in desktop.clicks:
+            arrived, want = expected[title]
+            latencies.append(clicked_at - arrived)
+            wrong += button != want
+        clickable = sum(1 for _, want in expected.values() if want)
+        left = sum(len(desktop.windows(name)) for name in processes)
+        timeouts = helper.health.snapshot().get("CoreServicesUIAgent", {}).get("total_timeouts", 0)
+        print(f"  {label:>7}: {len(desktop.clicks)}/{clickable} of {len(expected)} dialogs clicked, {wrong} wrong, "
+              f"{left} left open; time to click p50 {percentile(latencies, 0.5):.2f} s, "
+              f"p95 {percentile(latencies, 0.95):.2f} s; {desktop.queries / tick_count:.2f} queries/tick, "
+              f"{timeouts} timeouts")
+        threaded_ok = (threaded_ok and len(desktop.clicks) == clickable and wrong == 0
+                       and left == len(expected) - clickable)
+        if not hung:
+            threaded_ok = threaded_ok and percentile(latencies, 0.95) <= helper.scheduler.max_interval + 0.5
+
+    # The async engine runs in real time: hung probes are cut off at the tick deadline
+    desktop = SimulatedDesktop(latency=0.005, timeout=1.0)
+    for name in processes + ["CoreServicesUIAgent"]:
+        desktop.launch(name)
+    desktop.hang("CoreServicesUIAgent")
+    helper = make_helper(None, backend=desktop, script_host="spawn", process_prefilter=True, click_cooldown=0.0)
+    engine = AsyncMonitorEngine(helper, concurrency=4, tick_deadline=0.2)
+    rounds = min(ticks, 5)
+
+    async def drive():
+        samples = []
+        for i in range(rounds):
+            desktop.open_window(processes[i % len(processes)], f"Async {i}", ["Cancel", "Continue"])
+            started = time.perf_counter()
+            await engine.run_tick()
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    samples = asyncio.run(drive())
+    print(f"  async engine: {len(desktop.clicks)}/{rounds} clicked, max tick {max(samples) * 1000:.0f} ms, "
+          f"{engine.cancelled_probes} probes cancelled")
+    async_ok = len(desktop.clicks) == rounds and max(samples) < 0.5
+
+    return threaded_ok and async_ok
+
+
+def bench_record_replay(ticks):
+    """Record a simulated session, replay it under the same and a changed config, stream a large trace"""
+    print("🎞️  Record/replay: ten simulated minutes recorded, replayed, and a large trace streamed")
+
+    workdir = tempfile.mkdtemp(prefix="copilot_helper_trace_")
+    processes = ["Terminal", "iTerm2", "osascript", "SecurityAgent"]
+    horizon = 600.0
+
+    def simulate(trace_path=None):
+        clock = SimClock()
+
+        def advance(seconds):
+            clock.now += seconds
+
+        desktop = SimulatedDesktop(latency=0.02, clock=clock, sleep=advance)
+        for name in processes:
+            desktop.launch(name)
+        helper = sim_helper(desktop, clock, log_level="WARNING")
+        if trace_path:
+            helper.recorder = TraceRecorder(trace_path, clock=clock)
+        pending = dialog_arrivals(horizon, processes, seed=7)
+        pending.reverse()
+        tick_count, busy = 0, 0.0
+        while clock.now < horizon:
+            while pending and pending[-1][0] <= clock.now:
+                _, process, title, buttons, _ = pending.pop()
+                desktop.open_window(process, title, buttons)
+            started = time.perf_counter()
+            helper.run_tick()
+            busy += time.perf_counter() - started
+            tick_count += 1
+            helper.scheduler.record_tick(False)
+            advance(helper.scheduler.next_interval())
+        if trace_path:
+            helper.stop_recording()
+        return tick_count, busy, len(desktop.clicks)
+
+    plain_ticks, plain_busy, _ = simulate()
+    trace = os.path.join(workdir, "session.ndjson.gz")
+    recorded_ticks, recorded_busy, clicks = simulate(trace)
+    with open_trace(trace) as f:
+        raw_bytes = sum(len(line) for line in f)
+    overhead = (recorded_busy / recorded_ticks - plain_busy / plain_ticks) * 1e6
+    print(f"  recorded {recorded_ticks} ticks, {clicks} clicks: {raw_bytes / recorded_ticks:.0f} B/tick NDJSON, "
+          f"{os.path.getsize(trace) / recorded_ticks:.1f} B/tick gzipped; "
+          f"recording adds {overhead:.0f} µs/tick")
+
+    def replay(**config):
+        helper = make_helper(None, script_host="spawn", process_prefilter=True, log_level="WARNING", **config)
+        return replay_trace(helper, trace)
+
+    same = replay()
+    print(f"  same config: {same['replayed_clicks']}/{same['recorded_clicks']} clicks, "
+          f"{same['diff_ticks']} ticks differ, {same['ticks_per_second']:.0f} ticks/s, "
+          f"tick p50 {same['tick_us']['p50']:.0f} µs, p95 {same['tick_us']['p95']:.0f} µs")
+    changed = replay(process_rules={"Terminal": {"allow": False}})
+    print(f"  Terminal disallowed: {changed['diff_ticks']} ticks differ, "
+          f"{changed['replayed_clicks']}/{changed['recorded_clicks']} clicks; first: {changed['diffs'][:1]}")
+
+    # A long trace with a fresh window list on every line must stream in bounded memory
+    big = os.path.join(workdir, "long.ndjson")
+    lines = 20000
+    with open_trace(big, "w") as f:
+        f.write(json.dumps({"trace": 1, "version": "bench", "started": 0.0}) + "\n")
+        for i in range(lines):
+            windows = [[processes[j % len(processes)], f"Window {i}-{j}", j // len(processes) + 1, ["Save"]]
+                       for j in range(8)]
+            f.write(json.dumps({"t": i * 0.5, "targets": processes, "windows": windows}) + "\n")
+    size = os.path.getsize(big)
+    helper = make_helper(None, script_host="spawn", process_prefilter=True, log_level="WARNING",
+                         decision_cache_size=256)
+    tracemalloc.start()
+    streamed = replay_trace(helper, big)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  long trace: {streamed['ticks']} ticks, {size / 1e6:.1f} MB on disk, "
+          f"peak {peak / 1e6:.2f} MB traced while replaying")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    return (same["diff_ticks"] == 0 and same["replayed_clicks"] == clicks > 0
+            and changed["diff_ticks"] > 0 and changed["replayed_clicks"] < clicks
+            and streamed["ticks"] == lines and peak < size / 4
+            and overhead < 200)
+
+
+def bench_startup(ticks):
+    """Import time and wall clock of read-only CLI commands, and what they leave on disk"""
+    print("🚀 Startup: import cost and wall clock of `status` and `--help` with no daemon running")
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "copilot_helper.py")
+    workdir = tempfile.mkdtemp(prefix="copilot_helper_startup_")
+    # As run by the installed wrapper: python3 -m, so the compiled module is reused
+    env = dict(os.environ, HOME=workdir, PYTHONPATH=os.path.dirname(script))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    rounds = max(5, min(ticks, 20))
+
+    def wall(*args):
+        samples = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            result = subprocess.run([sys.executable, *args], capture_output=True, text=True, env=env)
+            samples.append(time.perf_counter() - started)
+        return statistics.median(samples), result.stdout
+
+    subprocess.run([sys.executable, "-c", "import copilot_helper"], env=env, check=True)
+    # -X importtime lists every module the status command loads, with its cumulative cost
+    trace = subprocess.run([sys.executable, "-X", "importtime", "-m", "copilot_helper", "status"],
+                           capture_output=True, text=True, env=env).stderr
+    loaded = {}
+    for line in trace.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        loaded[name.strip()] = int(cumulative)
+    deferred = ["asyncio", "gzip", "hashlib", "logging.handlers", "multiprocessing", "socketserver", "sqlite3",
+                "subprocess", "tempfile"]
+    eager = [name for name in deferred if name in loaded]
+    module_ms = min(int(line.split("|")[1]) for line in [
+        subprocess.run([sys.executable, "-X", "importtime", "-c", "import copilot_helper"],
+                       capture_output=True, text=True, env=env).stderr.splitlines()[-1]
+        for _ in range(3)
+    ]) / 1000
+    deferred_ms = wall("-c", "import " + ", ".join(deferred))[0] - wall("-c", "pass")[0]
+
+    baseline, _ = wall("-c", "pass")
+    status, output = wall("-m", "copilot_helper", "status")
+    help_time, _ = wall("-m", "copilot_helper", "--help")
+    uncached, _ = wall(script, "status")
+    left = sorted(os.listdir(workdir))
+    print(f"  import copilot_helper: {module_ms:.1f} ms; modules deferred to the monitor "
+          f"({', '.join(deferred)}) would add {deferred_ms * 1000:.0f} ms; loaded by status: {eager or 'none'}")
+    print(f"  wall clock (median of {rounds}): interpreter {baseline * 1000:.0f} ms, "
+          f"status {status * 1000:.0f} ms, --help {help_time * 1000:.0f} ms "
+          f"(status {uncached * 1000:.0f} ms run as a script, recompiled every time)")
+    print(f"  files created by status: {left or 'none'}")
+
+    # Config parses are reused while the file is unchanged
+    config_file = os.path.join(workdir, "config.json")
+    with open(config_file, "w") as f:
+        json.dump(dict(CopilotHelper.default_config(), process_rules={f"App {i}": {"allow": True}
+                                                                     for i in range(200)}), f)
+    reads = 2000
+    started = time.perf_counter()
+    for _ in range(reads):
+        with open(config_file) as f:
+            json.load(f)
+    parse_us = (time.perf_counter() - started) / reads * 1e6
+    started = time.perf_counter()
+    for _ in range(reads):
+        read_config_cached(config_file)
+    cached_us = (time.perf_counter() - started) / reads * 1e6
+    print(f"  config read: {parse_us:.0f} µs parsed, {cached_us:.1f} µs from the parse cache")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    return (not eager and not left and "Running: No" in output
+            and status - baseline < 0.1 and cached_us < parse_us)
+
+
+# Stand-in for an osascript child that burns CPU: argv[1] seconds of busy loop
+CPU_BURNER = r'''
+import sys, time
+end = time.process_time() + float(sys.argv[1])
+while time.process_time() < end:
+    pass
+'''
+
+
+def bench_budget(ticks):
+    """CPU and spawn budgets against real CPU-burning children (the control loop itself is unit-tested)"""
+    print("🔋 Budget governor: CPU and spawn ceilings against CPU-burning stand-in children")
+
+    # Every probe spawns a Python process that burns 10 ms of CPU
+    targets = ["Terminal", "iTerm2", "osascript", "SecurityAgent", "loginwindow"]
+    burner = write_stand_in(CPU_BURNER)
+    probes = {}
+
+    def run(cmd, **kwargs):
+        name = next((target for target in targets if target in " ".join(cmd)), "other")
+        probes[name] = probes.get(name, 0) + 1
+        subprocess.run(burner + ["0.01"], capture_output=True)
+        return subprocess.CompletedProcess(cmd, 0, stdout="", stderr="")
+
+    duration = 8.0
+    results = {}
+    for label, budgets in (("ungoverned", {}), ("governed", {"cpu_budget_percent": 25.0,
+                                                              "spawn_budget_per_minute": 600.0})):
+        helper = make_helper(run, FakeSessionResolver(command_runner=lambda *a, **k: None),
+                             script_host="spawn", scan_mode="batched", batch_scope="process",
+                             check_interval=0.05, max_interval=0.05, burst_interval=0.05, budget_window=2.0,
+                             budget_max_stretch=20.0, budget_priority_processes=["Terminal"], **budgets)
+        helper.common_processes = targets
+        probes.clear()
+        helper.is_running = True
+        thread = threading.Thread(target=helper.monitor_and_auto_click, daemon=True)
+        before = os.times()
+        thread.start()
+        time.sleep(duration / 2)
+        # Judge the second half, once the governor has settled
+        middle, probes_middle = os.times(), dict(probes)
+        time.sleep(duration / 2)
+        after = os.times()
+        helper.is_running = False
+        thread.join()
+
+        def cpu_between(a, b):
+            return sum(getattr(b, f) - getattr(a, f) for f in ("user", "system", "children_user", "children_system"))
+
+        late = {name: probes.get(name, 0) - probes_middle.get(name, 0) for name in targets}
+        results[label] = (cpu_between(middle, after) / (duration / 2) * 100,
+                          sum(late.values()) * 60 / (duration / 2), late, helper)
+        print(f"  {label:>10}: {cpu_between(before, after) / duration * 100:.0f}% CPU overall, "
+              f"{results[label][0]:.0f}% and {results[label][1]:.0f} spawns/min in the second half; "
+              f"Terminal probed {late['Terminal']}x, others {sum(late.values()) - late['Terminal']}x")
+    cpu_used, spawn_rate, late, helper = results["governed"]
+    status = [line for line in format_status(helper.status_report()) if line.startswith("Budget:")]
+    print(f"  status: {status[0] if status else 'no budget line'}")
+
+    return (cpu_used <= 25.0 * 1.5 and spawn_rate <= 600 * 1.2 and late["Terminal"] > 0
+            and sum(late.values()) - late["Terminal"] < late["Terminal"]
+            and results["ungoverned"][0] > cpu_used * 1.5 and bool(status))
+
+
+def pid_alive(pid):
+    """Whether a process with this PID exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def wait_until(condition, timeout=10.0):
+    """Poll condition until it holds; seconds waited, or None on timeout"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if condition():
+            return time.perf_counter() - started
+        time.sleep(0.02)
+    return None
+
+
+def bench_multi_session(ticks):
+    """Multi-session: loginwindow discovery, then one worker process per fake GUI session"""
+    print("👥 Multi-session: loginwindow discovery and one worker process per GUI session")
+
+    # Discovery from a ps listing: root's loginwindow is the login screen, not a session
+    loginwindow = "/System/Library/CoreServices/loginwindow.app/Contents/MacOS/loginwindow"
+    listing = [f"0 root {loginwindow}", f"501 alice {loginwindow}", f"502 bob {loginwindow}",
+               "501 alice /System/Applications/Utilities/Terminal.app/Contents/MacOS/Terminal"]
+    listing += [f"{501 + i % 2} {'alice' if i % 2 == 0 else 'bob'} /usr/libexec/agent{i}" for i in range(500)]
+    output = "\n".join(listing) + "\n"
+    source = LoginWindowSessionSource(lambda *a, **k: subprocess.CompletedProcess(a[0], 0, stdout=output, stderr=""))
+    found = source.sessions()
+    started = time.perf_counter()
+    for _ in range(100):
+        source.sessions()
+    discovery_ms = (time.perf_counter() - started) / 100 * 1000
+    discovery_ok = found == [GUISession("alice", "501"), GUISession("bob", "502")]
+    print(f"  discovery: {', '.join(f'{s.user} ({s.uid})' for s in found)} from {len(listing)} processes "
+          f"in {discovery_ms:.2f} ms")
+
+    # Supervision: alice's overrides poll ten times as often as the shared config
+    workdir = tempfile.mkdtemp(prefix="copilot_helper_bench_")
+    config_file = os.path.join(workdir, "config.json")
+    config = dict(CopilotHelper.isolated_config(workdir), **{
+        "enabled": True, "ui_backend": "simulated", "multi_session": True, "session_poll_interval": 0.1,
+        "check_interval": 0.2, "max_interval": 0.2, "cpu_budget_percent": 0, "config_watch_interval": 0.1,
+        "record_file": os.path.join(workdir, "trace.ndjson"),
+        "session_overrides": {"alice": {"check_interval": 0.02, "max_interval": 0.02}}
+    })
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+    sessions = FakeSessionSource([GUISession("alice", "501"), GUISession("bob", "502")])
+    helper = CopilotHelper(config_file, session_source=sessions)
+
+    def workers():
+        return helper.supervisor.snapshot()
+
+    def reporting(*uids):
+        current = workers()
+        return all(uid in current and current[uid]["alive"] and current[uid]["heartbeat_age"] is not None
+                   for uid in uids)
+
+    helper.start()
+    startup = wait_until(lambda: reporting("501", "502"))
+    first = workers()
+    time.sleep(2.0)
+    second = workers()
+    rates = {uid: (second[uid]["ticks"] - first[uid]["ticks"]) / 2.0 for uid in ("501", "502")}
+    pids = {uid: entry["pid"] for uid, entry in second.items()}
+    traces = sorted(name for name in os.listdir(workdir) if name.startswith("trace"))
+    print(f"  two sessions: workers {pids['501']} and {pids['502']} reporting after "
+          f"{startup if startup is None else round(startup * 1000)} ms; "
+          f"alice {rates['501']:.0f} ticks/s with overrides, bob {rates['502']:.0f} ticks/s; traces: {', '.join(traces)}")
+    isolated_ok = (startup is not None and pids["501"] != pids["502"] != os.getpid()
+                   and rates["501"] > rates["502"] * 3 and traces == ["trace-alice.ndjson", "trace-bob.ndjson"])
+
+    # Sessions come and go
+    sessions.login("carol", "503")
+    sessions.logout("502")
+    churn = wait_until(lambda: reporting("501", "503") and "502" not in workers() and not pid_alive(pids["502"]))
+    print(f"  carol logs in, bob logs out: {'timed out' if churn is None else f'{churn * 1000:.0f} ms'} "
+          f"to start and tear down workers")
+
+    # A crashed worker is restarted, the others keep running
+    carol = workers()["503"]["pid"]
+    os.kill(pids["501"], signal.SIGKILL)
+    restart = wait_until(lambda: reporting("501") and workers()["501"]["pid"] != pids["501"])
+    after = workers()
+    print(f"  alice's worker killed: {'not restarted' if restart is None else f'restarted in {restart * 1000:.0f} ms'}"
+          f" ({after['501']['restarts']} restarts), carol's worker untouched: {after['503']['pid'] == carol}")
+
+    # Disabling one user in the config file stops just that worker
+    config["session_overrides"]["carol"] = {"enabled": False}
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+    disabled = wait_until(lambda: "503" not in workers() and not pid_alive(carol))
+    status = [line for line in format_status(helper.status_report()) if line.startswith(("Sessions:", "  "))]
+    print(f"  carol disabled by an override: {'still running' if disabled is None else 'worker stopped'}")
+    for line in status:
+        print(f"  status: {line.strip()}")
+
+    remaining = [entry["pid"] for entry in workers().values()]
+    helper.stop()
+    leftover = [pid for pid in remaining if pid_alive(pid)]
+    print(f"  stop: {len(remaining)} worker(s) stopped, {len(leftover)} left running")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    lifecycle_ok = (churn is not None and restart is not None and after["503"]["pid"] == carol
+                    and disabled is not None and not leftover and len(status) == 2)
+    return discovery_ok and isolated_ok and lifecycle_ok
+
+
+def bench_audit(ticks):
+    """Audit store: caller cost, write throughput, query latency and pruning at millions of rows"""
+    print("🧾 Audit store: two million decisions over 60 days, batched writes, indexed queries, pruning")
+
+    workdir = tempfile.mkdtemp(prefix="copilot_helper_bench_")
+    path = os.path.join(workdir, "audit.db")
+    now = [time.time() - 60 * 86400]
+    store = AuditStore(path, retention_days=0, clock=lambda: now[0])
+    rng = random.Random(0)
+    processes = ["Terminal", "iTerm2", "osascript", "SecurityAgent", "Xcode", "Xcode Helper", "Simulator",
+                 "System Settings", "CoreServicesUIAgent", "UserNotificationCenter", "Finder", "Docker"]
+    titles = ["Allow access to the keychain?", "Run script?", "Install helper tool", "Open downloaded file?",
+              "Terminal wants to control System Events", "Replace existing file?", "Update available"]
+    kinds = [(("Cancel", "Continue"), "Continue"), (("Deny", "Allow"), "Allow"), (("OK",), "OK")]
+
+    # Cost on the monitor loop: queueing only
+    samples = 20000
+    started = time.perf_counter()
+    for i in range(samples):
+        store.record("501", "Terminal", "Run script?", ("Cancel", "Continue"), "Continue", True, 0.2)
+    record_us = (time.perf_counter() - started) / samples * 1e6
+    store.flush()
+
+    # Throughput: two million decisions spread over 60 days, committed by the writer thread.
+    # One chunk of decisions is generated up front and replayed, so the producer costs little more than record()
+    total, chunk = 2_000_000, 50_000
+    step = 60 * 86400 / total
+    decisions = []
+    for _ in range(chunk):
+        buttons, button = rng.choice(kinds)
+        decisions.append((rng.choice(("501", "502")), rng.choice(processes), rng.choice(titles), buttons, button,
+                          rng.random() < 0.97, rng.expovariate(2.0)))
+    started = time.perf_counter()
+    for first in range(0, total, chunk):
+        for decision in decisions:
+            store.record(*decision)
+            now[0] += step
+        store.flush(60.0)
+    elapsed = time.perf_counter() - started
+    rows = store.written
+    size = sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+    print(f"  record(): {record_us:.2f} µs on the caller; {rows - samples} rows written in {elapsed:.1f} s "
+          f"({(rows - samples) / elapsed:,.0f} rows/s end to end, {store.batches} transactions, "
+          f"{store.dropped} dropped), {size / 2**20:.0f} MiB on disk")
+    write_ok = record_us < 10 and store.dropped == 0 and (rows - samples) / elapsed > 50_000
+
+    # Query latency, median of five runs, on a read-only connection like the CLI's
+    connection = open_audit(path)
+    week, day = now[0] - 7 * 86400, now[0] - 86400
+    queries = [
+        ("Xcode* clicks in the last week", "index",
+         lambda: query_audit(connection, since=week, process="Xcode*", limit=50)),
+        ("one process, all time, newest 50", "index",
+         lambda: query_audit(connection, process="Docker", limit=50)),
+        ("'*keychain*' titles in the last day", "index",
+         lambda: query_audit(connection, since=day, title="*keychain*", limit=50)),
+        ("per process, last week", "index",
+         lambda: aggregate_audit(connection, "process", since=week)),
+        ("per day, all time", "rollup",
+         lambda: aggregate_audit(connection, "day", limit=100)),
+        ("per process, all time, raw rows", "scan",
+         lambda: aggregate_audit(connection, "process", title="*")),
+    ]
+    query_ok = True
+    for label, kind, run in queries:
+        timings = []
+        for _ in range(5):
+            started = time.perf_counter()
+            result = run()
+            timings.append(time.perf_counter() - started)
+        ms = statistics.median(timings) * 1000
+        budget = {"index": 50, "rollup": 500, "scan": 5000}[kind]
+        query_ok = query_ok and ms <= budget and bool(result)
+        print(f"  {label:<38} {ms:8.1f} ms ({len(result)} rows)")
+    plan = " ".join(str(row[-1]) for row in connection.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM decisions WHERE ts >= ? AND +process GLOB ? ORDER BY ts DESC LIMIT 50",
+        (week, "Xcode*")))
+    print(f"  plan for a process glob listing: {plan}")
+    query_ok = query_ok and "INDEX decisions_ts" in plan
+
+    # Retention: drop the older half while a reader keeps querying
+    store.retention_days = 30
+    reader_ms = []
+    stop = threading.Event()
+
+    def read():
+        reader_connection = open_audit(path)
+        while not stop.is_set():
+            started = time.perf_counter()
+            query_audit(reader_connection, since=week, process="Terminal", limit=50)
+            reader_ms.append((time.perf_counter() - started) * 1000)
+        reader_connection.close()
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    started = time.perf_counter()
+    pruned = store.prune()
+    prune_s = time.perf_counter() - started
+    stop.set()
+    reader.join()
+    left = connection.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+    connection.close()
+    store.close()
+    print(f"  retention 30 days: {pruned} rows pruned in {prune_s:.1f} s, {left} left; concurrent reader "
+          f"p95 {percentile(reader_ms, 0.95):.1f} ms over {len(reader_ms)} queries")
+    prune_ok = abs(left - rows / 2) < rows * 0.02 and percentile(reader_ms, 0.95) < 100
+
+    # The monitor audits exactly what it clicks
+    clock = SimClock()
+    desktop = SimulatedDesktop(clock=clock)
+    targets = ["Terminal", "iTerm2", "osascript", "SecurityAgent"]
+    for name in targets:
+        desktop.launch(name)
+    helper = sim_helper(desktop, clock)
+    helper.start_audit(os.path.join(workdir, "monitor.db"))
+    pending = dialog_arrivals(300.0, targets)
+    pending.reverse()
+    while clock.now < 300.0:
+        while pending and pending[-1][0] <= clock.now:
+            _, process, title, buttons, _ = pending.pop()
+            desktop.open_window(process, title, buttons)
+        helper.run_tick()
+        clock.now += helper.scheduler.next_interval()
+    audit_path = helper.audit.path
+    helper.stop_audit()
+    connection = open_audit(audit_path)
+    audited = {(row["process"], row["title"], row["button"])
+               for row in query_audit(connection, limit=10_000, clicked=True)}
+    connection.close()
+    clicked = {(process, title, button) for _, process, title, button in desktop.clicks}
+    print(f"  simulated monitor: {len(desktop.clicks)} clicks, {len(audited)} audited, match: {audited == clicked}")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return write_ok and query_ok and prune_ok and audited == clicked and bool(clicked)
+
+
+class ProbeCountingDesktop(SimulatedDesktop):
+    """Simulated desktop that counts the processes each scan lists and the longest gap between their scans"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.probes = 0
+        self.last_probe = {}
+        self.max_gap = {}
+
+    def window_titles(self, process_names):
+        now = self.clock()
+        self.probes += len(process_names)
+        for name in process_names:
+            if name in self.last_probe:
+                self.max_gap[name] = max(self.max_gap.get(name, 0.0), now - self.last_probe[name])
+            self.last_probe[name] = now
+        return super().window_titles(process_names)
+
+
+def skewed_arrivals(horizon, hot, cold, seed=0):
+    """(time, process, title) for dialogs mostly from a few hot processes"""
+    rng = random.Random(seed)
+    arrivals, now = [], 0.0
+    while True:
+        now += rng.expovariate(1 / 20.0)
+        if now >= horizon:
+            return arrivals
+        draw = rng.random()
+        process = hot[0] if draw < 0.7 else hot[1] if draw < 0.98 else rng.choice(cold)
+        arrivals.append((now, process, f"Dialog {len(arrivals)}"))
+
+
+def bench_frequency(ticks):
+    """Frequency-weighted scan schedule: probes per tick and time-to-click with skewed dialog sources"""
+    print("🌡️  Scan schedule: one simulated hour, 12 targets, 98% of dialogs from two of them")
+
+    hot = ["Terminal", "SecurityAgent"]
+    cold = ["iTerm2", "osascript", "CoreServicesUIAgent", "Xcode", "Finder", "Safari", "Mail",
+            "System Settings", "Installer", "Software Update"]
+    horizon = 3600.0
+    arrivals = skewed_arrivals(horizon, hot, cold)
+    workdir = tempfile.mkdtemp(prefix="copilot_helper_bench_")
+    schedule_file = os.path.join(workdir, "schedule.json")
+
+    def simulate(start, **config):
+        clock = SimClock(start)
+
+        def advance(seconds):
+            clock.now += seconds
+
+        desktop = ProbeCountingDesktop(latency=0.02, clock=clock, sleep=advance)
+        for name in hot + cold:
+            desktop.launch(name)
+        helper = sim_helper(desktop, clock, schedule_file=schedule_file, **config)
+        helper.common_processes = hot + cold
+        helper.frequency.load()
+        pending = [(start + at, process, title) for at, process, title in reversed(arrivals)]
+        tick_count = 0
+        while clock.now < start + horizon:
+            while pending and pending[-1][0] <= clock.now:
+                _, process, title = pending.pop()
+                desktop.open_window(process, title, ["Cancel", "Continue"])
+            clicks = helper.run_tick()
+            tick_count += 1
+            helper.scheduler.record_tick(clicks > 0)
+            advance(helper.scheduler.next_interval())
+        helper.frequency.maybe_save(force=True)
+
+        arrived = {title: (at, process) for at, process, title in arrivals}
+        latencies = {"hot": [], "cold": []}
+        for clicked_at, process, title, _ in desktop.clicks:
+            latencies["hot" if process in hot else "cold"].append(clicked_at - start - arrived[title][0])
+        return {"probes": desktop.probes / tick_count, "ticks": tick_count, "clicks": len(desktop.clicks),
+                "hot": latencies["hot"], "cold": latencies["cold"],
+                "staleness": max(desktop.max_gap.values()), "helper": helper}
+
+    ok = True
+    for label, schedule in (("adaptive (default)", {}), ("fixed 0.5s", {"idle_backoff": 1.0})):
+        if os.path.exists(schedule_file):
+            os.unlink(schedule_file)
+        runs = {
+            "off": simulate(0.0, **schedule),
+            "cold start": simulate(0.0, frequency_schedule=True, **schedule),
+            "learned": simulate(horizon, frequency_schedule=True, **schedule),
+        }
+        print(f"  {label}:")
+        for mode, run in runs.items():
+            print(f"    {mode:>10}: {run['probes']:5.2f} processes probed/tick over {run['ticks']} ticks, "
+                  f"{run['clicks']}/{len(arrivals)} clicked; time to click hot p50 {percentile(run['hot'], 0.5):.2f} s "
+                  f"p95 {percentile(run['hot'], 0.95):.2f} s, cold p95 {percentile(run['cold'], 0.95):.2f} s; "
+                  f"longest unscanned {run['staleness']:.2f} s")
+        off, learned = runs["off"], runs["learned"]
+        max_staleness = learned["helper"].frequency.max_staleness
+        ok = (ok and all(run["clicks"] == len(arrivals) for run in runs.values())
+              and learned["probes"] <= off["probes"] * 0.6
+              and percentile(learned["hot"], 0.95) <= percentile(off["hot"], 0.95) + 0.1
+              and all(run["staleness"] <= max_staleness + 0.1 for run in runs.values()))
+
+    status = [line for line in format_status(learned["helper"].status_report()) if line.startswith("Scan schedule:")]
+    print(f"  status: {status[0] if status else 'no schedule line'}")
+    with open(schedule_file) as f:
+        saved = json.load(f)["processes"]
+    print(f"  persisted: {len(saved)} processes in {os.path.getsize(schedule_file)} bytes")
+    shutil.rmtree(workdir, ignore_errors=True)
+    return ok and bool(status) and set(hot) <= set(saved)
+
+
+class ScriptedDesktopRunner:
+    """Stand-in for subprocess.run that answers the script templates from an in-memory desktop
+
+    Every window listing may open a dialog with a fresh title in one of the
+    processes, so caches keep seeing new keys. Dialogs without a button the
+    rules press are closed by the "user" after a while; the rest stay until
+    a click_button call names them and one of their buttons.
+    """
+
+    BUTTON_SETS = [["Cancel", "Continue"], ["Deny", "Allow"], ["OK"], ["Don't Save", "Cancel", "Save"]]
+
+    def __init__(self, open_chance=0.2, dismiss_after=50, seed=0):
+        self.rng = random.Random(seed)
+        self.windows = {}
+        self.open_chance = open_chance
+        self.dismiss_after = dismiss_after
+        self.listings = 0
+        self.opened = 0
+        self.clicks = 0
+
+    def launch(self, process_name):
+        self.windows.setdefault(process_name, [])
+
+    def __call__(self, cmd, **kwargs):
+        name, args = template_call(cmd)
+        if name == "window_titles":
+            output = json.dumps(self.list_titles(json.loads(args[0])))
+        elif name == "dialog_snapshot":
+            output = json.dumps(self.snapshot(json.loads(args[0]), json.loads(args[1])))
+        elif name == "click_button":
+            output = self.click(args[0], int(args[1]), args[2], args[3])
+        elif name == "accessibility_check":
+            output = "accessible"
+        else:
+            output = ""
+        return subprocess.CompletedProcess(cmd, 0, stdout=output, stderr="")
+
+    def list_titles(self, process_names):
+        self.listings += 1
+        if self.rng.random() < self.open_chance:
+            process = self.rng.choice(list(self.windows))
+            self.windows[process].append((f"Dialog {self.opened}", self.rng.choice(self.BUTTON_SETS), self.listings))
+            self.opened += 1
+        for process, windows in self.windows.items():
+            windows[:] = [window for window in windows if self.listings - window[2] < self.dismiss_after]
+        return {name: [title for title, _, _ in self.windows[name]] for name in process_names if name in self.windows}
+
+    def snapshot(self, process_names, wanted):
+        rows = []
+        for name in (process_names or list(self.windows)):
+            for index, (title, buttons, _) in enumerate(self.windows.get(name, []), 1):
+                if wanted is None or index in wanted.get(name, ()):
+                    rows.append([name, title, index, buttons])
+        return rows
+
+    def click(self, process, index, title, button):
+        windows = self.windows.get(process, [])
+        if index > len(windows) or windows[index - 1][0] != title or button not in windows[index - 1][1]:
+            return "not found"
+        del windows[index - 1]
+        self.clicks += 1
+        return "clicked"
+
+
+def process_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        output = subprocess.run(["ps", "-o", "rss=", "-p", str(os.getpid())], capture_output=True, text=True).stdout
+        return int(output.strip() or 0) * 1024
+
+
+def open_fds():
+    """Number of file descriptors this process has open"""
+    for path in ("/proc/self/fd", "/dev/fd"):
+        if os.path.isdir(path):
+            return len(os.listdir(path))
+    return 0
+
+
+def child_processes():
+    """Children of this process, zombies included"""
+    pid = os.getpid()
+    if not os.path.isdir("/proc"):
+        output = subprocess.run(["ps", "-A", "-o", "ppid="], capture_output=True, text=True).stdout
+        # The ps started here is a child too
+        return sum(1 for line in output.split() if line == str(pid)) - 1
+    children = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The parent PID follows the state, after the parenthesised command name
+                children += int(f.read().rsplit(")", 1)[1].split()[1]) == pid
+        except (OSError, ValueError, IndexError):
+            continue
+    return children
+
+
+SOAK_THRESHOLDS = {
+    "rss_mib": 8.0,
+    "traced_mib": 2.0,
+    "fds": 0,
+    "children": 0,
+    "threads": 0,
+    "tick_drift": 1.5,
+}
+
+
+def run_soak(duration, sample_interval, warmup=None, thresholds=None, report=None):
+    """Drive the monitor loop flat out against a scripted desktop and watch for growth
+
+    Samples RSS, traced Python memory, open fds, children and threads every
+    sample_interval seconds and prints them as they come. Growth is measured
+    from the first sample after the warm-up (a quarter of the run by default,
+    while caches fill and the scan schedule learns) to the last one; tick cost
+    drift compares the same two sampling periods. Returns the samples, the
+    growth and a failure message for every threshold exceeded.
+    """
+    thresholds = dict(SOAK_THRESHOLDS, **(thresholds or {}))
+    warmup = duration / 4 if warmup is None else warmup
+    workdir = tempfile.mkdtemp(prefix="copilot_helper_soak_")
+    runner = ScriptedDesktopRunner()
+    helper = make_helper(runner, FakeSessionResolver(command_runner=lambda *a, **k: None), script_host="spawn",
+                         check_interval=0.0, max_interval=0.0, burst_interval=0.0, click_cooldown=0.0,
+                         metrics=True, metrics_interval=1.0, metrics_file=os.path.join(workdir, "metrics.prom"),
+                         frequency_schedule=True, schedule_file=os.path.join(workdir, "schedule.json"))
+    for name in helper.common_processes:
+        runner.launch(name)
+    helper.start_audit(os.path.join(workdir, "audit.db"))
+
+    tracemalloc.start()
+    own_files = tracemalloc.Filter(False, tracemalloc.__file__)
+    helper.is_running = True
+    thread = threading.Thread(target=helper.monitor_and_auto_click, daemon=True)
+    started = time.monotonic()
+    thread.start()
+
+    samples = []
+    baseline = baseline_snapshot = None
+    previous_ticks, previous_at = 0, started
+    while True:
+        time.sleep(max(0.0, started + (len(samples) + 1) * sample_interval - time.monotonic()))
+        now = time.monotonic()
+        ticks = helper.tick_count
+        sample = {
+            "t": round(now - started, 1),
+            "ticks": ticks,
+            "tick_us": (now - previous_at) / max(ticks - previous_ticks, 1) * 1e6,
+            "rss_mib": process_rss() / 2 ** 20,
+            "traced_mib": tracemalloc.get_traced_memory()[0] / 2 ** 20,
+            "fds": open_fds(),
+            "children": child_processes(),
+            "threads": threading.active_count(),
+            "clicks": helper.click_count,
+        }
+        previous_ticks, previous_at = ticks, now
+        samples.append(sample)
+        if baseline is None and now - started >= warmup:
+            baseline = sample
+            baseline_snapshot = tracemalloc.take_snapshot().filter_traces([own_files])
+        if len(samples) == 1:
+            print(f"  {'t (s)':>7} {'ticks':>9} {'tick µs':>8} {'RSS MiB':>8} {'traced MiB':>10} "
+                  f"{'fds':>4} {'children':>8} {'threads':>7} {'clicks':>8}")
+        print(f"  {sample['t']:>7.1f} {ticks:>9} {sample['tick_us']:>8.1f} {sample['rss_mib']:>8.1f} "
+              f"{sample['traced_mib']:>10.2f} {sample['fds']:>4} {sample['children']:>8} "
+              f"{sample['threads']:>7} {sample['clicks']:>8}{'  <- baseline' if sample is baseline else ''}")
+        if now - started >= duration:
+            break
+
+    growers = tracemalloc.take_snapshot().filter_traces([own_files]).compare_to(baseline_snapshot, "lineno")[:5]
+    tracemalloc.stop()
+    helper.is_running = False
+    thread.join(timeout=5)
+    helper.stop_audit()
+
+    last = samples[-1]
+    growth = {key: last[key] - baseline[key] for key in ("rss_mib", "traced_mib", "fds", "children", "threads")}
+    growth["tick_drift"] = last["tick_us"] / baseline["tick_us"]
+    failures = [f"{key} grew by {value:.2f} (limit {thresholds[key]:g})" if key != "tick_drift" else
+                f"tick cost drifted x{value:.2f} (limit x{thresholds[key]:g})"
+                for key, value in growth.items() if value > thresholds[key]]
+    top = [{"where": str(stat.traceback), "size_diff_kib": stat.size_diff / 1024, "count_diff": stat.count_diff}
+           for stat in growers]
+    print("  top allocators since the baseline:")
+    for entry in top:
+        print(f"    {entry['size_diff_kib']:+9.1f} KiB {entry['count_diff']:+7} blocks  {entry['where']}")
+    if report:
+        with open(report, "w") as f:
+            json.dump({"duration": duration, "sample_interval": sample_interval, "thresholds": thresholds,
+                       "samples": samples, "growth": growth, "top_allocators": top, "failures": failures,
+                       "dialogs_opened": runner.opened, "clicks": runner.clicks}, f, indent=2)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {"samples": samples, "growth": growth, "failures": failures, "top_allocators": top,
+            "opened": runner.opened, "clicks": runner.clicks}
+
+
+def print_soak_summary(result):
+    growth = result["growth"]
+    print(f"  {result['samples'][-1]['ticks']} ticks, {result['clicks']} clicks of {result['opened']} dialogs; "
+          f"growth after the baseline: RSS {growth['rss_mib']:+.2f} MiB, traced {growth['traced_mib']:+.2f} MiB, "
+          f"fds {growth['fds']:+d}, children {growth['children']:+d}, threads {growth['threads']:+d}, "
+          f"tick cost x{growth['tick_drift']:.2f}")
+    for failure in result["failures"]:
+        print(f"  ❌ {failure}")
+
+
+SCENARIOS = {
+    "session": bench_session,
+    "batching": bench_batching,
+    "script_host": bench_script_host,
+    "snapshot": bench_snapshot,
+    "incremental": bench_incremental,
+    "prefilter": bench_prefilter,
+    "scheduler": bench_scheduler,
+    "async_engine": bench_async_engine,
+    "circuit_breaker": bench_circuit_breaker,
+    "script_cache": bench_script_cache,
+    "control_plane": bench_control_plane,
+    "hot_reload": bench_hot_reload,
+    "rule_engine": bench_rule_engine,
+    "decision_cache": bench_decision_cache,
+    "logging": bench_logging,
+    "metrics": bench_metrics,
+    "simulated_desktop": bench_simulated_desktop,
+    "record_replay": bench_record_replay,
+    "startup": bench_startup,
+    "budget": bench_budget,
+    "multi_session": bench_multi_session,
+    "audit": bench_audit,
+    "frequency": bench_frequency,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for Copilot Helper")
+    parser.add_argument("--scenario", choices=list(SCENARIOS) + ["all"], default="all",
+                        help="Scenario to run")
+    parser.add_argument("--ticks", type=int, default=20, help="Monitor ticks per scenario")
+    soak = parser.add_argument_group("soak test")
+    soak.add_argument("--soak", type=float, metavar="SECONDS",
+                      help="Only run the monitor loop flat out for this long, watching for leaks and drift")
+    soak.add_argument("--sample-interval", type=float, metavar="SECONDS",
+                      help="Time between samples (default: a twentieth of the run)")
+    soak.add_argument("--warmup", type=float, metavar="SECONDS",
+                      help="Time before the baseline sample (default: a quarter of the run)")
+    soak.add_argument("--report", metavar="PATH", help="Write the time series, top allocators and verdict as JSON")
+    soak.add_argument("--max-rss-growth", type=float, default=SOAK_THRESHOLDS["rss_mib"], metavar="MIB",
+                      help="Most the resident set may grow after the baseline")
+    soak.add_argument("--max-traced-growth", type=float, default=SOAK_THRESHOLDS["traced_mib"], metavar="MIB",
+                      help="Most Python allocations (tracemalloc) may grow after the baseline")
+    soak.add_argument("--max-fd-growth", type=int, default=SOAK_THRESHOLDS["fds"], metavar="N",
+                      help="Most open file descriptors may grow after the baseline")
+    soak.add_argument("--max-child-growth", type=int, default=SOAK_THRESHOLDS["children"], metavar="N",
+                      help="Most child processes (zombies included) may grow after the baseline")
+    soak.add_argument("--max-thread-growth", type=int, default=SOAK_THRESHOLDS["threads"], metavar="N",
+                      help="Most threads may grow after the baseline")
+    soak.add_argument("--max-tick-drift", type=float, default=SOAK_THRESHOLDS["tick_drift"], metavar="RATIO",
+                      help="Largest ratio of late to baseline tick cost")
+
+    args = parser.parse_args()
+
+    if args.soak:
+        print(f"🧪 Soak: the monitor loop flat out for {args.soak:g} s against a scripted desktop")
+        result = run_soak(args.soak, args.sample_interval or max(args.soak / 20, 1.0), warmup=args.warmup,
+                          thresholds={"rss_mib": args.max_rss_growth, "traced_mib": args.max_traced_growth,
+                                      "fds": args.max_fd_growth, "children": args.max_child_growth,
+                                      "threads": args.max_thread_growth, "tick_drift": args.max_tick_drift},
+                          report=args.report)
+        print_soak_summary(result)
+        if result["failures"]:
+            sys.exit(1)
+        print("✅ No growth beyond the thresholds")
+        return
+
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    failed = []
+    for name in names:
+        if not SCENARIOS[name](args.ticks):
+            failed.append(name)
+        print()
+
+    if failed:
+        print(f"❌ Budget missed: {', '.join(failed)}")
+        sys.exit(1)
+    print("✅ All benchmarks within budget")
+
+
+if __name__ == "__main__":
+    main()
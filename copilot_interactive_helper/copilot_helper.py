@@ -18,26 +18,3514 @@ Author: AI Assistant
 License: MIT
 """
 
-import subprocess
 import time
 import threading
+import fnmatch
+import io
 import json
 import logging
 import os
+import pwd
+import queue
+import re
 import signal
+import errno
+import socket
+import stat
 import sys
-from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
+from types import MappingProxyType
+from typing import Callable, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple
+import abc
 import argparse
+import atexit
+import bisect
+import resource
+
+
+class _LazyModule:
+    """Module imported on first attribute access, then bound in its place
+
+    Keeps the CLI's read-only commands from paying for modules only the
+    monitor uses.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr: str):
+        module = __import__(self._name)
+        globals()[self._name] = module
+        return getattr(module, attr)
+
+
+asyncio = _LazyModule("asyncio")
+gzip = _LazyModule("gzip")
+hashlib = _LazyModule("hashlib")
+multiprocessing = _LazyModule("multiprocessing")
+socketserver = _LazyModule("socketserver")
+sqlite3 = _LazyModule("sqlite3")
+subprocess = _LazyModule("subprocess")
+tempfile = _LazyModule("tempfile")
+
+_optional_modules: Dict[str, object] = {}
+
+
+def optional_import(name: str):
+    """Import an optional dependency on first use; None when it is not installed"""
+    if name not in _optional_modules:
+        try:
+            _optional_modules[name] = __import__(name)
+        except ImportError:
+            _optional_modules[name] = None
+    return _optional_modules[name]
+
+
+__version__ = "1.0.0"
+
+
+class SessionResolver:
+    """Resolve the console user and UID once and cache them between calls
+
+    The console owner is re-checked with a single stat() of /dev/console on
+    every call, so a real session change (fast user switching, logout) is
+    picked up immediately without spawning anything. Full resolution only
+    happens when that owner changes, the TTL expires or the cache is
+    invalidated (e.g. after launchctl refuses the cached UID), and normally
+    spawns nothing either: the user is the console's owner (or PyObjC's
+    answer) and the UID comes from the password database.
+    """
+
+    CONSOLE_DEVICE = "/dev/console"
+
+    def __init__(self, ttl: float = 30.0, negative_ttl: float = 2.0,
+                 command_runner: Callable = None, clock: Callable[[], float] = None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.command_runner = command_runner or subprocess.run
+        self.clock = clock or time.monotonic
+        self.resolutions = 0
+        self._lock = threading.Lock()
+        self._session: Optional[Tuple[str, str]] = None
+        self._resolved_at = 0.0
+        self._console_owner: Optional[int] = None
+
+    def resolve(self) -> Tuple[str, str]:
+        """Return (user, uid) for the console session, using the cache when valid"""
+        with self._lock:
+            now = self.clock()
+            owner = self._read_console_owner()
+            if self._session is not None and owner == self._console_owner:
+                ttl = self.ttl if self._session[0] else self.negative_ttl
+                if now - self._resolved_at < ttl:
+                    return self._session
+
+            user = self.lookup_user()
+            uid = self.lookup_uid(user) if user else ""
+            self._session = (user, uid) if uid else ("", "")
+            self._resolved_at = now
+            self._console_owner = owner
+            self.resolutions += 1
+            return self._session
+
+    def cached(self) -> Optional[Tuple[str, str]]:
+        """The last resolved (user, uid), without resolving anything"""
+        return self._session
+
+    def invalidate(self) -> None:
+        """Drop the cached session so the next resolve() starts from scratch"""
+        with self._lock:
+            self._session = None
+
+    def lookup_user(self) -> str:
+        """Look up the console user in-process: with PyObjC, else from the console device's owner"""
+        try:
+            from SystemConfiguration import SCDynamicStoreCopyConsoleUser
+        except ImportError:
+            return self._lookup_user_console()
+
+        username = (SCDynamicStoreCopyConsoleUser(None, None, None) or [None])[0]
+        return "" if username in ("loginwindow", None, "") else str(username)
+
+    def lookup_uid(self, user: str) -> str:
+        """Look up the UID for a user name via the password database"""
+        try:
+            return str(pwd.getpwnam(user).pw_uid)
+        except KeyError:
+            result = self.command_runner(["id", "-u", user], capture_output=True, text=True)
+            return result.stdout.strip() if result.returncode == 0 else ""
+
+    def _lookup_user_console(self) -> str:
+        """Name of the console device's owner, as `stat -f%Su /dev/console` reports it
+
+        root owns the console at the login window, which means no user.
+        Only when the device or the owner's name cannot be read is a system
+        python3 with PyObjC asked instead.
+        """
+        owner = self._read_console_owner()
+        if owner == 0:
+            return ""
+        try:
+            return pwd.getpwuid(owner).pw_name if owner is not None else self._lookup_user_subprocess()
+        except KeyError:
+            return self._lookup_user_subprocess()
+
+    def _lookup_user_subprocess(self) -> str:
+        """Fall back to a system python3 that has PyObjC available"""
+        result = self.command_runner([
+            "python3", "-c",
+            "from SystemConfiguration import SCDynamicStoreCopyConsoleUser; "
+            "import sys; "
+            "username = (SCDynamicStoreCopyConsoleUser(None, None, None) or [None])[0]; "
+            "username = [username,''][username in ['loginwindow', None, '']]; "
+            "sys.stdout.write(username + '\\n');"
+        ], capture_output=True, text=True)
+        return result.stdout.strip()
+
+    def _read_console_owner(self) -> Optional[int]:
+        """Return the UID owning the console device, or None if unavailable"""
+        try:
+            return os.stat(self.CONSOLE_DEVICE).st_uid
+        except OSError:
+            return None
+
+
+class GUISession(NamedTuple):
+    """A logged-in GUI user"""
+    user: str
+    uid: str
+
+
+class PinnedSessionResolver(SessionResolver):
+    """Resolver of a session worker: always the session it was started for
+
+    Fast user switching does not matter to a worker; when its session ends
+    the supervisor stops it, so there is nothing to re-resolve.
+    """
+
+    def __init__(self, session: GUISession):
+        super().__init__()
+        self._session = (session.user, session.uid)
+        self.resolutions = 1
+
+    def resolve(self) -> Tuple[str, str]:
+        return self._session
+
+    def invalidate(self) -> None:
+        pass
+
+
+class SessionSource(abc.ABC):
+    """Where the supervisor learns which GUI sessions exist"""
+
+    @abc.abstractmethod
+    def sessions(self) -> List[GUISession]:
+        """Active GUI sessions, one per UID"""
+
+
+class LoginWindowSessionSource(SessionSource):
+    """GUI sessions found in the process table
+
+    Every logged-in GUI session on macOS, including those in the background
+    after fast user switching, has a loginwindow process owned by its user;
+    the one at the login screen belongs to root and is skipped.
+    """
+
+    PROCESS_NAME = "loginwindow"
+
+    def __init__(self, command_runner: Callable = None):
+        self.command_runner = command_runner or subprocess.run
+
+    def sessions(self) -> List[GUISession]:
+        psutil = optional_import("psutil")
+        if psutil is not None:
+            owners = [(str(p.info["uids"].real), p.info["username"])
+                      for p in psutil.process_iter(["name", "uids", "username"])
+                      if p.info.get("name") == self.PROCESS_NAME and p.info.get("uids")]
+        else:
+            owners = self._owners_ps()
+        found = {uid: user for uid, user in owners if uid != "0" and user}
+        return [GUISession(found[uid], uid) for uid in sorted(found, key=int)]
+
+    def _owners_ps(self) -> List[Tuple[str, str]]:
+        result = self.command_runner(["ps", "-axo", "uid=,user=,comm="], capture_output=True, text=True, timeout=5)
+        if result.returncode != 0:
+            raise OSError(f"ps failed: {result.stderr.strip()}")
+        owners = []
+        for line in result.stdout.splitlines():
+            fields = line.split(None, 2)
+            if len(fields) == 3 and os.path.basename(fields[2].strip()) == self.PROCESS_NAME:
+                owners.append((fields[0], fields[1]))
+        return owners
+
+
+class FakeSessionSource(SessionSource):
+    """Sessions logged in and out by hand, for tests and platforms without loginwindow"""
+
+    def __init__(self, sessions: List[GUISession] = ()):
+        self._lock = threading.Lock()
+        self._sessions = {session.uid: session for session in sessions}
+
+    def login(self, user: str, uid: str) -> None:
+        with self._lock:
+            self._sessions[str(uid)] = GUISession(user, str(uid))
+
+    def logout(self, uid: str) -> None:
+        with self._lock:
+            self._sessions.pop(str(uid), None)
+
+    def sessions(self) -> List[GUISession]:
+        with self._lock:
+            return sorted(self._sessions.values(), key=lambda session: int(session.uid))
+
+# JXA program run by the persistent script host. It reads one JSON request per
+# line from stdin, runs it and writes one JSON response per line to stdout.
+# A request carries either AppleScript/JXA source or the path of a compiled
+# .scpt file, plus optional arguments for the script's run handler. Sources
+# and files are compiled or loaded once and reused for identical requests.
+SCRIPT_HOST_SOURCE = r'''
+ObjC.import('Foundation');
+ObjC.import('OSAKit');
+var compiled = {};
+var compiledCount = 0;
+
+function remember(key, load) {
+    var script = compiled[key];
+    if (!script) {
+        if (compiledCount >= 256) { compiled = {}; compiledCount = 0; }
+        script = load();
+        compiled[key] = script;
+        compiledCount++;
+    }
+    return script;
+}
+
+function runHandler(script, args) {
+    var list = $.NSAppleEventDescriptor.listDescriptor;
+    args.forEach(function (arg, i) {
+        list.insertDescriptorAtIndex($.NSAppleEventDescriptor.descriptorWithString($(String(arg))), i + 1);
+    });
+    var error = Ref();
+    var result = script.executeHandlerWithNameArgumentsError($('run'), $.NSArray.arrayWithObject(list), error);
+    if (!result || result.isNil()) {
+        throw new Error(JSON.stringify(ObjC.deepUnwrap(error[0])) || 'Script error');
+    }
+    return ObjC.unwrap(result.stringValue) || '';
+}
+
+function execute(request) {
+    if (request.file) {
+        var loaded = remember('file:' + request.file, function () {
+            return $.OSAScript.alloc.initWithContentsOfURLError($.NSURL.fileURLWithPath($(request.file)), null);
+        });
+        return runHandler(loaded, request.args || []);
+    }
+    if (request.lang === 'JavaScript') {
+        var value = request.args
+            ? eval('(function () {' + request.script + '\nreturn run;})()')(request.args)
+            : eval(request.script);
+        return value === undefined || value === null ? '' : String(value);
+    }
+    if (request.args) {
+        var handler = remember('run:' + request.script, function () {
+            return $.OSAScript.alloc.initWithSourceLanguage($(request.script), $.OSALanguage.languageForName('AppleScript'));
+        });
+        return runHandler(handler, request.args);
+    }
+    var script = remember(request.script, function () {
+        return $.NSAppleScript.alloc.initWithSource($(request.script));
+    });
+    var error = Ref();
+    var result = script.executeAndReturnError(error);
+    if (!result || result.isNil()) {
+        throw new Error(ObjC.unwrap(error[0].objectForKey('NSAppleScriptErrorMessage')) || 'AppleScript error');
+    }
+    return ObjC.unwrap(result.stringValue) || '';
+}
+
+function respond(stdout, request) {
+    var response;
+    try {
+        response = {id: request.id, ok: true, output: execute(request)};
+    } catch (e) {
+        response = {id: request.id, ok: false, output: String(e)};
+    }
+    stdout.writeData($(JSON.stringify(response) + '\n').dataUsingEncoding($.NSUTF8StringEncoding));
+}
+
+function run() {
+    var stdin = $.NSFileHandle.fileHandleWithStandardInput;
+    var stdout = $.NSFileHandle.fileHandleWithStandardOutput;
+    var pending = '';
+    while (true) {
+        var data = stdin.availableData;
+        if (data.length === 0) { return ''; }
+        pending += $.NSString.alloc.initWithDataEncoding(data, $.NSUTF8StringEncoding).js;
+        var newline;
+        while ((newline = pending.indexOf('\n')) >= 0) {
+            var line = pending.slice(0, newline);
+            pending = pending.slice(newline + 1);
+            if (line.length > 0) { respond(stdout, JSON.parse(line)); }
+        }
+    }
+}
+'''
+
+TIMEOUT_MESSAGE = "AppleScript execution timed out"
+
+
+class ScanError(Exception):
+    """A window scan script failed or timed out"""
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.timed_out = message == TIMEOUT_MESSAGE
+
+
+class ScriptHostWorker:
+    """Supervise a long-lived script host process reached over a stdin/stdout pipe
+
+    Requests and responses are framed as one JSON object per line:
+    {"id", "lang", "script" or "file", "args"} in and {"id", "ok", "output"}
+    out. A request that exceeds its timeout kills the host (it is stuck inside
+    the script), and a host that exits is detected through EOF on its stdout.
+    Either way the next request transparently spawns a fresh host.
+    """
+
+    def __init__(self, command: List[str], timeout: float = 10.0, popen: Callable = None,
+                 max_consecutive_crashes: int = 3):
+        self.command = command
+        self.timeout = timeout
+        self.popen = popen or subprocess.Popen
+        self.max_consecutive_crashes = max_consecutive_crashes
+        self.spawns = 0
+        self.crashes = 0
+        self.consecutive_crashes = 0
+        self.timeouts = 0
+        self._process = None
+        self._responses: Optional[queue.Queue] = None
+        self._stderr_tail: deque = deque(maxlen=20)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    @property
+    def healthy(self) -> bool:
+        """False once the host keeps dying right after being respawned"""
+        return self.consecutive_crashes < self.max_consecutive_crashes
+
+    def request(self, script: str, language: str = "AppleScript", timeout: float = None,
+                args: List[str] = None, file: str = None) -> Tuple[bool, str]:
+        """Run one script (or compiled `file`) in the host and wait for its response"""
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if not self.alive:
+                try:
+                    self._spawn()
+                except OSError as e:
+                    self.crashes += 1
+                    self.consecutive_crashes += 1
+                    return False, f"Script host failed to start: {e}"
+
+            self._next_id += 1
+            request_id = self._next_id
+            frame = {"id": request_id, "lang": language}
+            if file:
+                frame["file"] = file
+            else:
+                frame["script"] = script
+            if args is not None:
+                frame["args"] = list(args)
+            frame = json.dumps(frame)
+            try:
+                self._process.stdin.write(frame + "\n")
+                self._process.stdin.flush()
+            except (BrokenPipeError, OSError, ValueError):
+                self._reap(crashed=True)
+                return False, "Script host exited: " + self.stderr_tail()
+
+            deadline = time.monotonic() + timeout
+            responses = self._responses
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        raise queue.Empty
+                    response = responses.get(timeout=remaining)
+                except queue.Empty:
+                    self.timeouts += 1
+                    self._reap(crashed=False)
+                    return False, TIMEOUT_MESSAGE
+
+                if response is None:
+                    self._reap(crashed=True)
+                    return False, "Script host exited: " + self.stderr_tail()
+                if response.get("id") == request_id:
+                    self.consecutive_crashes = 0
+                    return bool(response.get("ok")), str(response.get("output", "")).strip()
+                # Anything else is a late answer to a request that already timed out
+
+    def stderr_tail(self) -> str:
+        """Return the most recent stderr lines of the host"""
+        return " ".join(self._stderr_tail).strip()
+
+    def stop(self) -> None:
+        """Shut the host down"""
+        with self._lock:
+            self._reap(crashed=False)
+
+    def _spawn(self) -> None:
+        self._stderr_tail.clear()
+        self._process = self.popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, text=True, bufsize=1
+        )
+        self._responses = queue.Queue()
+        self.spawns += 1
+        threading.Thread(target=self._read_stdout, args=(self._process, self._responses),
+                         daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self._process,), daemon=True).start()
+
+    def _reap(self, crashed: bool) -> None:
+        process, self._process = self._process, None
+        if process is None:
+            return
+        if crashed:
+            self.crashes += 1
+            self.consecutive_crashes += 1
+        try:
+            process.kill()
+            process.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        for stream in (process.stdin, process.stdout, process.stderr):
+            try:
+                stream.close()
+            except (OSError, AttributeError):
+                pass
+
+    @staticmethod
+    def _read_stdout(process, responses: queue.Queue) -> None:
+        try:
+            for line in process.stdout:
+                try:
+                    responses.put(json.loads(line))
+                except ValueError:
+                    continue
+        except (OSError, ValueError):
+            pass
+        responses.put(None)
+
+    def _read_stderr(self, process) -> None:
+        try:
+            for line in process.stderr:
+                self._stderr_tail.append(line.strip())
+        except (OSError, ValueError):
+            pass
+
+# Every script the helper runs is a parameterised template: names, titles and
+# indexes arrive as run-handler arguments instead of being interpolated into the
+# source, so each template compiles once and user-controlled strings are never
+# parsed as code.
+
+# JXA snapshot of every window that has buttons. argv[0] is a JSON array of
+# process names, or null for all foreground processes; argv[1] optionally
+# restricts the scan to {process: [window indexes]}.
+# Returns {"windows": rows, "errors": {process: message}}. Each row is
+# [process, window title, window index (1-based), [button names]]; a process
+# whose queries throw is listed in errors instead of failing the whole scan.
+DIALOG_SNAPSHOT_SCRIPT = r'''
+function run(argv) {
+    var targets = JSON.parse(argv[0]);
+    var only = JSON.parse(argv[1]);
+    var systemEvents = Application('System Events');
+    var processes = targets
+        ? targets.filter(function (name) { return systemEvents.processes[name].exists(); })
+                 .map(function (name) { return [name, systemEvents.processes[name]]; })
+        : systemEvents.processes.whose({backgroundOnly: false})()
+                 .map(function (proc) { return [null, proc]; });
+    var rows = [];
+    var errors = {};
+    processes.forEach(function (entry) {
+        var name = entry[0], proc = entry[1];
+        try {
+            name = proc.name();
+            var titles = proc.windows.name();
+            var indexes = only ? (only[name] || []) : titles.map(function (t, i) { return i + 1; });
+            var buttons = only ? null : proc.windows.buttons.name();
+            indexes.forEach(function (index) {
+                try {
+                    var names = buttons ? buttons[index - 1] : proc.windows[index - 1].buttons.name();
+                    var named = (names || []).filter(function (button) { return button; });
+                    if (named.length) {
+                        rows.push([name, titles[index - 1] || '', index, named]);
+                    }
+                } catch (e) {
+                    errors[name] = String(e);
+                }
+            });
+        } catch (e) {
+            if (name) {
+                errors[name] = String(e);
+            }
+        }
+    });
+    return JSON.stringify({windows: rows, errors: errors});
+}
+'''
+
+# JXA listing of window titles per process: {"titles": {process: [titles]},
+# "errors": {process: message}}. argv[0] is a JSON array of process names.
+# This is the cheap first pass of the incremental scanner and never touches
+# buttons.
+WINDOW_TITLES_SCRIPT = r'''
+function run(argv) {
+    var targets = JSON.parse(argv[0]);
+    var systemEvents = Application('System Events');
+    var titles = {};
+    var errors = {};
+    targets.forEach(function (name) {
+        try {
+            var proc = systemEvents.processes[name];
+            if (proc.exists()) {
+                titles[name] = proc.windows.name().map(function (title) { return title || ''; });
+            }
+        } catch (e) {
+            errors[name] = String(e);
+        }
+    });
+    return JSON.stringify({titles: titles, errors: errors});
+}
+'''
+
+# Click one button, provided the window is still where the snapshot saw it.
+# argv is {process, window index, window title, button}; untitled windows
+# (name `missing value`) are reported as "" by the snapshot and compared so.
+CLICK_BUTTON_SCRIPT = '''
+on run argv
+    set {procName, winIndex, winTitle, buttonName} to argv
+    tell application "System Events"
+        try
+            tell process procName
+                set win to window (winIndex as integer)
+                set winName to name of win
+                if winName is missing value then set winName to ""
+                if (winName as text) is not winTitle then return "moved"
+                click (first button of win whose name is buttonName)
+                return "clicked"
+            end tell
+        end try
+        return "not_found"
+    end tell
+end run
+'''
+
+# Walk each process's windows once and click the first candidate found. argv
+# is {process count, process names..., candidate buttons...}. Button names of
+# a window are fetched in a single System Events call and checked against the
+# whole candidate list in order. Returns one "process<TAB>button<TAB>window
+# title" line per click.
+BATCHED_CLICK_SCRIPT = '''
+on run argv
+    set processCount to (item 1 of argv) as integer
+    set targetProcesses to items 2 thru (processCount + 1) of argv
+    set candidateButtons to items (processCount + 2) thru -1 of argv
+    set clickedList to {}
+    tell application "System Events"
+        repeat with procName in targetProcesses
+            try
+                if exists process procName then
+                    tell process procName
+                        set clickedHere to false
+                        repeat with win in windows
+                            try
+                                set buttonNames to name of every button of win
+                                repeat with candidate in candidateButtons
+                                    if buttonNames contains (contents of candidate) then
+                                        click (first button of win whose name is (contents of candidate))
+                                        set winTitle to ""
+                                        try
+                                            set winName to name of win
+                                            if winName is not missing value then set winTitle to winName as text
+                                        end try
+                                        set end of clickedList to (procName as text) & tab & (contents of candidate) & tab & winTitle
+                                        set clickedHere to true
+                                        exit repeat
+                                    end if
+                                end repeat
+                            end try
+                            if clickedHere then exit repeat
+                        end repeat
+                    end tell
+                end if
+            end try
+        end repeat
+    end tell
+    set AppleScript's text item delimiters to linefeed
+    return clickedList as text
+end run
+'''
+
+ACCESSIBILITY_CHECK_SCRIPT = '''
+on run argv
+    tell application "System Events"
+        try
+            set frontApp to name of first application process whose frontmost is true
+            return "accessible"
+        on error
+            return "not_accessible"
+        end try
+    end tell
+end run
+'''
+
+
+class ScriptTemplate(NamedTuple):
+    """A parameterised script, run with its arguments as `osascript <file> args...`"""
+    name: str
+    language: str
+    source: str
+
+
+SCRIPT_TEMPLATES = {
+    template.name: template for template in (
+        ScriptTemplate("dialog_snapshot", "JavaScript", DIALOG_SNAPSHOT_SCRIPT),
+        ScriptTemplate("window_titles", "JavaScript", WINDOW_TITLES_SCRIPT),
+        ScriptTemplate("click_button", "AppleScript", CLICK_BUTTON_SCRIPT),
+        ScriptTemplate("batched_click", "AppleScript", BATCHED_CLICK_SCRIPT),
+        ScriptTemplate("accessibility_check", "AppleScript", ACCESSIBILITY_CHECK_SCRIPT),
+    )
+}
+
+
+class CompiledScriptCache:
+    """Compile script templates once with osacompile into an on-disk .scpt cache
+
+    Files are named <template>-<key>.scpt, where the key hashes the helper
+    version, the language and the template source, so upgrading the helper or
+    editing a template compiles a fresh file and prunes the template's older
+    ones. A template that fails to compile (no osacompile, e.g. off macOS) is
+    remembered and run from source instead, without retrying every tick.
+    """
+
+    COMPILER = "/usr/bin/osacompile"
+
+    def __init__(self, cache_dir: str, version: str = __version__, compiler: Callable = None):
+        self.cache_dir = cache_dir
+        self.version = version
+        self.compiler = compiler or subprocess.run
+        self.compiles = 0
+        self.failures = 0
+        self._keys: Dict[ScriptTemplate, str] = {}
+        self._failed: Set[str] = set()
+
+    def key(self, template: ScriptTemplate) -> str:
+        """Hash identifying one version of one template"""
+        key = self._keys.get(template)
+        if key is None:
+            material = "\0".join((self.version, template.language, template.source))
+            key = self._keys[template] = hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+        return key
+
+    def path_for(self, template: ScriptTemplate) -> str:
+        return os.path.join(self.cache_dir, f"{template.name}-{self.key(template)}.scpt")
+
+    def lookup(self, template: ScriptTemplate) -> Optional[str]:
+        """Return the compiled file for a template, compiling it on first use
+
+        None means the template could not be compiled and should be run
+        from source.
+        """
+        key = self.key(template)
+        if key in self._failed:
+            return None
+        path = self.path_for(template)
+        if os.path.exists(path) or self._compile(template, path):
+            return path
+        self._failed.add(key)
+        return None
+
+    def _compile(self, template: ScriptTemplate, path: str) -> bool:
+        """Compile into a temporary file and move it into place atomically"""
+        suffix = ".js" if template.language == "JavaScript" else ".applescript"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, source_file = tempfile.mkstemp(dir=self.cache_dir, suffix=suffix)
+            with os.fdopen(fd, "w") as f:
+                f.write(template.source)
+        except OSError:
+            self.failures += 1
+            return False
+
+        partial = f"{path}.{os.getpid()}.tmp"
+        try:
+            result = self.compiler(
+                [self.COMPILER, "-l", template.language, "-o", partial, source_file],
+                capture_output=True, text=True, timeout=30
+            )
+            compiled = result.returncode == 0 and os.path.exists(partial)
+            if compiled:
+                os.replace(partial, path)
+        except (OSError, subprocess.SubprocessError):
+            compiled = False
+        finally:
+            for leftover in (source_file, partial):
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+
+        if not compiled:
+            self.failures += 1
+            return False
+        self.compiles += 1
+        self.prune(template)
+        return True
+
+    def prune(self, template: ScriptTemplate) -> int:
+        """Remove compiled files of older versions of a template"""
+        current = os.path.basename(self.path_for(template))
+        try:
+            entries = os.listdir(self.cache_dir)
+        except OSError:
+            return 0
+        removed = 0
+        for entry in entries:
+            if entry.startswith(template.name + "-") and entry.endswith(".scpt") and entry != current:
+                try:
+                    os.remove(os.path.join(self.cache_dir, entry))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+
+class DialogWindow(NamedTuple):
+    """A window with buttons, as seen in one snapshot"""
+    process: str
+    title: str
+    index: int
+    buttons: Tuple[str, ...]
+
+
+class DialogSnapshot(list):
+    """Windows found by one scan, plus the processes that could not be queried
+
+    `errors` maps each such process to its error message. The scan scripts
+    catch errors per process, so one broken application costs only its own
+    windows; the monitor counts these processes as failed probes.
+    """
+
+    def __init__(self, windows: Iterable[DialogWindow] = (), errors: Dict[str, str] = None):
+        super().__init__(windows)
+        self.errors = errors or {}
+
+
+class WindowTitles(dict):
+    """Window titles per process from one listing, plus `errors` for processes that could not be listed"""
+
+    def __init__(self, titles: Mapping[str, List[str]] = (), errors: Dict[str, str] = None):
+        super().__init__(titles)
+        self.errors = errors or {}
+
+
+def scan_errors(result) -> Dict[str, str]:
+    """Per-process errors of a scan result ({} for backends that do not report any)"""
+    return getattr(result, "errors", None) or {}
+
+
+def parse_dialog_snapshot(text: str) -> DialogSnapshot:
+    """Parse DIALOG_SNAPSHOT_SCRIPT output into DialogWindow records
+
+    A bare JSON array of rows (the format before per-process errors) is
+    still accepted.
+    """
+    if not text:
+        return DialogSnapshot()
+    parsed = json.loads(text)
+    errors = {}
+    if isinstance(parsed, dict):
+        rows, errors = parsed.get("windows", []), parsed.get("errors") or {}
+    else:
+        rows = parsed
+    if not isinstance(rows, list) or not isinstance(errors, dict):
+        raise ValueError("dialog snapshot is neither a JSON array nor a windows/errors object")
+    return DialogSnapshot(
+        (DialogWindow(row[0], row[1] or "", row[2], tuple(row[3]))
+         for row in rows
+         if isinstance(row, list) and len(row) == 4),
+        {str(name): str(message) for name, message in errors.items()}
+    )
+
+
+def parse_window_titles(text: str) -> WindowTitles:
+    """Parse WINDOW_TITLES_SCRIPT output; a bare {process: [titles]} object is still accepted"""
+    parsed = json.loads(text or "{}")
+    if not isinstance(parsed, dict):
+        raise ValueError("window list is not a JSON object")
+    if isinstance(parsed.get("titles"), dict):
+        errors = parsed.get("errors") or {}
+        if not isinstance(errors, dict):
+            raise ValueError("window list errors are not a JSON object")
+        return WindowTitles(parsed["titles"], {str(name): str(message) for name, message in errors.items()})
+    return WindowTitles(parsed)
+
+
+def normalize_button(name: str) -> str:
+    """Case- and whitespace-insensitive form of a button name"""
+    return " ".join(name.split()).casefold()
+
+
+def find_candidate_button(candidates: List[str], buttons: Tuple[str, ...]) -> Optional[Tuple[str, str]]:
+    """First candidate present among a window's buttons, as (candidate, button as shown)
+
+    Only case is ignored, as by the batched click script's `contains`:
+    AppleScript considers white space by default, so "Allow " is not "Allow".
+    Stand-in desktops thus click what a real one would.
+    """
+    shown = {}
+    for button in buttons:
+        shown.setdefault(button.casefold(), button)
+    for candidate in candidates:
+        button = shown.get(candidate.casefold())
+        if button is not None:
+            return candidate, button
+    return None
+
+
+class RuleTable:
+    """Ordered button rules for one process, indexed for a single pass over a window's buttons
+
+    Rules are button names in priority order; "re:<regex>" and "glob:<pattern>"
+    rules match by pattern, normalized names included (a glob's runs of
+    spaces then count as one, like a name's). Literal rules live in a dict
+    from name to priority. Pattern rules are indexed by their literal prefix,
+    so a button is only tried against the few patterns that could match it;
+    resolving a window costs a handful of dict lookups per button it has.
+    """
+
+    PATTERN_PREFIXES = ("re:", "glob:")
+    REGEX_LITERAL = re.compile(r"[A-Za-z0-9 ]*")
+
+    def __init__(self, rules: List[str], normalized: bool = True):
+        self.rules = list(dict.fromkeys(rules))
+        self.normalized = normalized
+        self.literals: List[str] = []
+        self.errors: List[str] = []
+        self._exact: Dict[str, int] = {}
+        # Prefix length -> literal prefix -> [(priority, pattern)], plus patterns without a prefix
+        self._prefixed: Dict[int, Dict[str, List[Tuple[int, "re.Pattern"]]]] = {}
+        self._unprefixed: List[Tuple[int, "re.Pattern"]] = []
+        flags = re.IGNORECASE if normalized else 0
+
+        for priority, rule in enumerate(self.rules):
+            if not rule.startswith(self.PATTERN_PREFIXES):
+                self._exact.setdefault(self._key(rule), priority)
+                self.literals.append(rule)
+                continue
+            kind, _, pattern = rule.partition(":")
+            if kind == "glob" and normalized:
+                pattern = normalize_button(pattern)
+            source = fnmatch.translate(pattern) if kind == "glob" else pattern
+            try:
+                compiled = re.compile(source, flags)
+            except re.error as e:
+                self.errors.append(f"Ignoring invalid button rule {rule!r}: {e}")
+                continue
+            prefix = self._literal_prefix(kind, pattern)
+            if normalized:
+                # Keys have single spaces, so a run in a regex's prefix must not move it to a bucket none can reach
+                prefix = re.sub(r"\s+", " ", prefix).casefold()
+            if prefix:
+                self._prefixed.setdefault(len(prefix), {}).setdefault(prefix, []).append((priority, compiled))
+            else:
+                self._unprefixed.append((priority, compiled))
+
+    @classmethod
+    def _literal_prefix(cls, kind: str, pattern: str) -> str:
+        """Text every match of the pattern must start with ("" if unknown)"""
+        if kind == "glob":
+            return re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+        if "|" in pattern:
+            return ""
+        body = pattern[1:] if pattern.startswith("^") else pattern
+        prefix = cls.REGEX_LITERAL.match(body).group()
+        if body[len(prefix):len(prefix) + 1] in ("?", "*", "{"):
+            prefix = prefix[:-1]  # The last character is optional
+        return prefix
+
+    def _key(self, name: str) -> str:
+        return normalize_button(name) if self.normalized else name
+
+    def _pattern_priority(self, key: str) -> Optional[int]:
+        best = None
+        for priority, compiled in self._unprefixed:
+            if compiled.fullmatch(key):
+                best = priority
+                break
+        for length, buckets in self._prefixed.items():
+            for priority, compiled in buckets.get(key[:length], ()):
+                if best is not None and priority >= best:
+                    break
+                if compiled.fullmatch(key):
+                    best = priority
+                    break
+        return best
+
+    def __bool__(self) -> bool:
+        return bool(self._exact or self._prefixed or self._unprefixed)
+
+    @property
+    def patterns(self) -> bool:
+        """Whether any valid re:/glob: rule is in the table"""
+        return bool(self._prefixed or self._unprefixed)
+
+    def choose(self, buttons: Tuple[str, ...]) -> Optional[str]:
+        """Return the window's button with the best (lowest) rule priority, if any matches"""
+        best, best_priority = None, len(self.rules)
+        patterns = self._prefixed or self._unprefixed
+        for button in buttons:
+            key = self._key(button)
+            priority = self._exact.get(key)
+            if priority is None and patterns:
+                priority = self._pattern_priority(key)
+            if priority is not None and priority < best_priority:
+                best, best_priority = button, priority
+                if priority == 0:
+                    break
+        return best
+
+
+class RuleEngine:
+    """Button and process rules compiled from one configuration
+
+    Every process shares the default table unless process_rules gives it its
+    own ordered button list. process_rules can also force a process in
+    ("allow": true, even if it is not a default target) or out
+    ("allow": false), overriding the global whitelist and blacklist.
+    """
+
+    def __init__(self, default: RuleTable, tables: Dict[str, RuleTable] = None,
+                 overrides: Dict[str, bool] = None, whitelist: Set[str] = None,
+                 blacklist: Set[str] = None):
+        self.default = default
+        self.tables = tables or {}
+        self.overrides = overrides or {}
+        self.whitelist = whitelist or set()
+        self.blacklist = blacklist or set()
+
+    @classmethod
+    def from_config(cls, config: Dict, buttons: List[str]) -> "RuleEngine":
+        normalized = config.get("button_match", "normalized") == "normalized"
+        tables, overrides = {}, {}
+        for name, rule in (config.get("process_rules") or {}).items():
+            if not isinstance(rule, dict):
+                continue
+            if "allow" in rule:
+                overrides[name] = bool(rule["allow"])
+            if "buttons" in rule:
+                tables[name] = RuleTable(list(rule["buttons"]), normalized)
+        return cls(
+            RuleTable(buttons, normalized), tables, overrides,
+            set(config.get("process_whitelist") or []), set(config.get("process_blacklist") or [])
+        )
+
+    @property
+    def errors(self) -> List[str]:
+        return self.default.errors + [error for table in self.tables.values() for error in table.errors]
+
+    @property
+    def empty(self) -> bool:
+        """True when no process has any button to click"""
+        return not self.default and not any(self.tables.values())
+
+    def allows(self, process_name: str) -> bool:
+        """Apply process_rules, then the blacklist, then the whitelist"""
+        override = self.overrides.get(process_name)
+        if override is not None:
+            return override
+        if process_name in self.blacklist:
+            return False
+        return not self.whitelist or process_name in self.whitelist
+
+    def targets(self, default_targets: List[str]) -> List[str]:
+        """Default targets plus processes forced in by process_rules, minus excluded ones"""
+        forced = [name for name, allowed in self.overrides.items() if allowed and name not in default_targets]
+        return [name for name in list(default_targets) + forced if self.allows(name)]
+
+    def table(self, process_name: str) -> RuleTable:
+        return self.tables.get(process_name, self.default)
+
+    def choose(self, window: DialogWindow) -> Optional[str]:
+        """The button to click in a window, or None to leave it alone"""
+        return self.table(window.process).choose(window.buttons)
+
+    def batches(self, process_names: List[str]) -> List[Tuple[List[str], List[str]]]:
+        """Group processes sharing a rule table, with the literal button names to try
+
+        Batched click scripts match names inside AppleScript, so they only
+        see literal rules; processes whose table has patterns need a snapshot.
+        """
+        groups: Dict[int, Tuple[List[str], List[str]]] = {}
+        for name in process_names:
+            table = self.table(name)
+            groups.setdefault(id(table), ([], table.literals))[0].append(name)
+        return [group for group in groups.values() if group[1]]
+
+
+class IncrementalScanner:
+    """Deep-scan only windows that are new or changed since the previous tick
+
+    Every scan starts with a cheap pass that lists window titles per process.
+    A window is fingerprinted as (process, index, title); fingerprints seen on
+    the previous tick reuse their cached deep-scan result, and only the rest
+    are passed to the deep scan. Cached results older than max_age are
+    rescanned so a window whose buttons change under a stable title is
+    eventually noticed, unless `settled` says the window is known to need
+    nothing (e.g. the decision cache already ignored it).
+    """
+
+    def __init__(self, list_titles: Callable[[List[str]], Dict[str, List[str]]],
+                 deep_scan: Callable[[Dict[str, List[int]]], List[DialogWindow]],
+                 max_age: float = 30.0, clock: Callable[[], float] = None,
+                 settled: Callable[[DialogWindow], bool] = None):
+        self.list_titles = list_titles
+        self.deep_scan = deep_scan
+        self.max_age = max_age
+        self.clock = clock or time.monotonic
+        self.settled = settled
+        self.hits = 0
+        self.misses = 0
+        self.deep_scans = 0
+        self._known: Dict[Tuple[str, int, str], Tuple[Optional[DialogWindow], float]] = {}
+
+    def scan(self, process_names: List[str]) -> DialogSnapshot:
+        """Return every window with buttons, deep-scanning only new or changed windows
+
+        Processes either pass could not query are left out of the result
+        and the cache, and listed in its `errors`.
+        """
+        now = self.clock()
+        titles = self.list_titles(process_names)
+        errors = dict(scan_errors(titles))
+
+        # Processes left out of this scan (by the scan schedule or the budget) keep recent entries
+        scanned = set(process_names)
+        current = {key: entry for key, entry in self._known.items()
+                   if key[0] not in scanned and now - entry[1] < self.max_age}
+        wanted: Dict[str, List[int]] = {}
+        for process_name, process_titles in titles.items():
+            for index, title in enumerate(process_titles, 1):
+                key = (process_name, index, title)
+                cached = self._known.get(key)
+                if cached is not None and (now - cached[1] < self.max_age or self._is_settled(cached[0])):
+                    self.hits += 1
+                    current[key] = cached
+                else:
+                    self.misses += 1
+                    wanted.setdefault(process_name, []).append(index)
+
+        if wanted:
+            self.deep_scans += 1
+            scanned_windows = self.deep_scan(wanted)
+            errors.update(scan_errors(scanned_windows))
+            found = {(w.process, w.index, w.title): w for w in scanned_windows}
+            for process_name, indexes in wanted.items():
+                if process_name in errors:
+                    current = {key: entry for key, entry in current.items() if key[0] != process_name}
+                    continue
+                for index in indexes:
+                    key = (process_name, index, titles[process_name][index - 1])
+                    current[key] = (found.get(key), now)
+
+        # Windows that disappeared drop out of the cache here
+        self._known = current
+        return DialogSnapshot((window for key, (window, _) in current.items()
+                               if window is not None and key[0] in scanned), errors)
+
+    def _is_settled(self, window: Optional[DialogWindow]) -> bool:
+        return window is not None and self.settled is not None and self.settled(window)
+
+    def invalidate(self, window: DialogWindow) -> None:
+        """Force a window to be deep-scanned again on the next tick (e.g. after a click)"""
+        self._known.pop((window.process, window.index, window.title), None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "deep_scans": self.deep_scans,
+                "tracked_windows": len(self._known)}
+
+
+class DecisionCache:
+    """Remember what was decided for each window, bounded by entry count and age
+
+    A window is fingerprinted as (process, title, button set). An "ignore"
+    decision (no rule matches any of its buttons) lets the loop skip the window
+    until the entry expires after `ttl` seconds, and lets the incremental
+    scanner keep reusing its deep-scan result instead of refreshing it. A
+    "clicked" decision expires after `click_ttl` seconds; a window that still
+    shows the same fingerprint within that time is not clicked again, but the
+    entry is dropped as soon as a scan of its process no longer shows the
+    window, so an identical dialog opened after it is clicked right away. At
+    most `capacity` entries are kept, evicting the least recently used.
+    """
+
+    IGNORE = "ignore"
+    CLICKED = "clicked"
+
+    def __init__(self, capacity: int = 1024, ttl: float = 300.0, click_ttl: float = 2.0,
+                 clock: Callable[[], float] = None):
+        self.capacity = max(0, capacity)
+        self.ttl = ttl
+        self.click_ttl = click_ttl
+        self.clock = clock or time.monotonic
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[Tuple[str, str, FrozenSet[str]], Tuple[str, float]]" = OrderedDict()
+
+    @classmethod
+    def from_config(cls, config: Dict, clock: Callable[[], float] = None) -> "DecisionCache":
+        return cls(
+            capacity=config.get("decision_cache_size", 1024),
+            ttl=config.get("decision_cache_ttl", 300.0),
+            click_ttl=config.get("click_dedup_ttl", 2.0),
+            clock=clock
+        )
+
+    def reconfigure(self, config: Dict) -> None:
+        """Adopt new limits and forget every decision, since the rules may have changed"""
+        fresh = self.from_config(config, self.clock)
+        self.capacity, self.ttl, self.click_ttl = fresh.capacity, fresh.ttl, fresh.click_ttl
+        self._entries.clear()
+
+    @staticmethod
+    def fingerprint(window: DialogWindow) -> Tuple[str, str, FrozenSet[str]]:
+        return window.process, window.title, frozenset(window.buttons)
+
+    def get(self, window: DialogWindow) -> Optional[str]:
+        """Return the live decision for a window, or None"""
+        key = self.fingerprint(window)
+        entry = self._entries.get(key)
+        if entry is not None and self.clock() >= entry[1]:
+            del self._entries[key]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def is_ignored(self, window: DialogWindow) -> bool:
+        """True while a window is known to need no click (does not count as a lookup)"""
+        entry = self._entries.get(self.fingerprint(window))
+        return entry is not None and entry[0] == self.IGNORE and self.clock() < entry[1]
+
+    def record(self, window: DialogWindow, decision: str) -> None:
+        """Remember a decision, evicting the least recently used entries over capacity"""
+        ttl = self.click_ttl if decision == self.CLICKED else self.ttl
+        if self.capacity == 0 or ttl <= 0:
+            return
+        key = self.fingerprint(window)
+        self._entries[key] = (decision, self.clock() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def forget_dismissed(self, process_names: Iterable[str], windows: List[DialogWindow]) -> None:
+        """Drop "clicked" entries of scanned processes whose window is gone from the scan"""
+        scanned = set(process_names)
+        present = {self.fingerprint(window) for window in windows}
+        for key in [key for key, (decision, _) in self._entries.items()
+                    if decision == self.CLICKED and key[0] in scanned and key not in present]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "expirations": self.expirations, "entries": len(self._entries),
+                "capacity": self.capacity}
+
+
+class Histogram:
+    """Latency histogram with fixed, exponentially spaced buckets (seconds)"""
+
+    # 0.25 ms to ~12 s, each bucket sqrt(2) wider than the last
+    BOUNDS = tuple(0.00025 * 2 ** (i / 2) for i in range(32))
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction: float) -> float:
+        """Estimate a percentile by interpolating inside the bucket that holds it"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        cumulative = 0
+        for index, bucket in enumerate(self.counts):
+            if bucket and cumulative + bucket >= rank:
+                lower = self.BOUNDS[index - 1] if index else 0.0
+                upper = min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+                return lower + (upper - lower) * max(0.0, rank - cumulative) / bucket
+            cumulative += bucket
+        return self.max
+
+
+class Metrics:
+    """Counters and latency histograms for the monitor loop
+
+    Every metric has at most one label (see DEFINITIONS). When disabled, count()
+    and observe() return before touching anything, so instrumented code pays
+    only for the call. Child CPU time comes from getrusage(RUSAGE_CHILDREN) and
+    is read when metrics are exported, not on every tick.
+    """
+
+    PREFIX = "copilot_helper_"
+    DEFINITIONS = {
+        "ticks_total": ("counter", None, "Monitor ticks run"),
+        "clicks_total": ("counter", "process", "Buttons clicked"),
+        "scripts_total": ("counter", "mode", "Scripts run in the script host or spawned as osascript"),
+        "script_timeouts_total": ("counter", "script", "Scripts that timed out"),
+        "script_timeout_seconds_total": ("counter", "script", "Seconds spent in scripts that timed out"),
+        "tick_seconds": ("histogram", None, "Duration of one monitor tick"),
+        "stage_seconds": ("histogram", "stage", "Duration of each stage of a tick"),
+        "script_seconds": ("histogram", "script", "Duration of one script run"),
+        "click_seconds": ("histogram", "process", "Duration of click scripts"),
+        "dialog_latency_seconds": ("histogram", "process",
+                                   "Seconds from the last scan that did not see a dialog to clicking it"),
+    }
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._counters: Dict[Tuple[str, str], float] = {}
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+
+    def count(self, name: str, label: str = "", amount: float = 1) -> None:
+        if not self.enabled:
+            return
+        key = (name, label)
+        self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, label: str = "") -> None:
+        if not self.enabled:
+            return
+        histogram = self._histograms.get((name, label))
+        if histogram is None:
+            histogram = self._histograms[(name, label)] = Histogram()
+        histogram.observe(seconds)
+
+    @staticmethod
+    def child_cpu() -> Dict[str, float]:
+        """CPU seconds used by waited-for child processes (osascript, launchctl, ps)"""
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return {"user": usage.ru_utime, "system": usage.ru_stime}
+
+    def summary(self) -> Dict:
+        """Counters, p50/p95/p99 per histogram and child CPU time, for the `stats` command"""
+        counters: Dict[str, Dict[str, float]] = {}
+        for (name, label), value in list(self._counters.items()):
+            counters.setdefault(name, {})[label] = value
+        histograms: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (name, label), histogram in list(self._histograms.items()):
+            histograms.setdefault(name, {})[label] = {
+                "count": histogram.count, "sum": histogram.sum,
+                "p50": histogram.percentile(0.5), "p95": histogram.percentile(0.95),
+                "p99": histogram.percentile(0.99)
+            }
+        return {"counters": counters, "histograms": histograms, "child_cpu_seconds": self.child_cpu()}
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        counters = sorted(self._counters.items())
+        histograms = sorted(self._histograms.items())
+        for name, (kind, label_name, help_text) in self.DEFINITIONS.items():
+            metric = self.PREFIX + name
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            if kind == "counter":
+                for (key, label), value in counters:
+                    if key == name:
+                        lines.append(f"{metric}{self._labels(label_name, label)} {self._value(value)}")
+                continue
+            for (key, label), histogram in histograms:
+                if key != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(Histogram.BOUNDS, histogram.counts):
+                    cumulative += bucket
+                    lines.append(f"{metric}_bucket{self._labels(label_name, label, le=f'{bound:.6g}')} {cumulative}")
+                lines.append(f"{metric}_bucket{self._labels(label_name, label, le='+Inf')} {histogram.count}")
+                lines.append(f"{metric}_sum{self._labels(label_name, label)} {self._value(histogram.sum)}")
+                lines.append(f"{metric}_count{self._labels(label_name, label)} {histogram.count}")
+        metric = self.PREFIX + "child_cpu_seconds_total"
+        lines.append(f"# HELP {metric} CPU seconds used by child processes")
+        lines.append(f"# TYPE {metric} counter")
+        for mode, seconds in self.child_cpu().items():
+            lines.append(f'{metric}{{mode="{mode}"}} {self._value(seconds)}')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _value(value: float) -> str:
+        """A sample value at full precision (`:g` would round counters past 999999)"""
+        return str(value) if isinstance(value, int) else repr(float(value))
+
+    @staticmethod
+    def _labels(label_name: Optional[str], label: str, le: str = None) -> str:
+        pairs = []
+        if label_name:
+            escaped = label.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            pairs.append(f'{label_name}="{escaped}"')
+        if le is not None:
+            pairs.append(f'le="{le}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def write(self, path: str) -> None:
+        """Replace a Prometheus text file atomically (for node_exporter's textfile collector)"""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, partial = tempfile.mkstemp(prefix=".metrics-", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.replace(partial, path)
+        except OSError:
+            if os.path.exists(partial):
+                os.unlink(partial)
+            raise
+
+
+class ProcessTable:
+    """Take one snapshot of running process names per call
+
+    Uses psutil when installed, otherwise /proc (Linux) or a single
+    `ps -axo comm=` listing (macOS). Names are executable basenames, which is
+    what System Events reports for the processes the helper targets.
+    """
+
+    PROC_ROOT = "/proc"
+
+    def __init__(self, command_runner: Callable = None):
+        self.command_runner = command_runner or subprocess.run
+        self.snapshots = 0
+
+    def snapshot(self) -> Set[str]:
+        """Return the set of running process names"""
+        self.snapshots += 1
+        if optional_import("psutil") is not None:
+            return self._snapshot_psutil()
+        if os.path.isdir(self.PROC_ROOT):
+            return self._snapshot_proc()
+        return self._snapshot_ps()
+
+    @staticmethod
+    def _snapshot_psutil() -> Set[str]:
+        names = set()
+        for process in optional_import("psutil").process_iter(["name"]):
+            name = process.info.get("name")
+            if name:
+                names.add(name)
+        return names
+
+    def _snapshot_proc(self) -> Set[str]:
+        names = set()
+        for entry in os.listdir(self.PROC_ROOT):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.PROC_ROOT, entry, "cmdline"), "rb") as f:
+                    argv0 = f.read().split(b"\0", 1)[0]
+                if argv0:
+                    name = os.path.basename(argv0)
+                else:
+                    # Kernel threads have no command line; comm is all there is
+                    with open(os.path.join(self.PROC_ROOT, entry, "comm"), "rb") as f:
+                        name = f.read().strip()
+            except OSError:
+                continue  # Process exited while we were listing
+            names.add(name.decode(errors="replace"))
+        return names
+
+    def _snapshot_ps(self) -> Set[str]:
+        result = self.command_runner(["ps", "-axo", "comm="], capture_output=True, text=True, timeout=5)
+        if result.returncode != 0:
+            raise OSError(f"ps failed: {result.stderr.strip()}")
+        return {os.path.basename(line.strip()) for line in result.stdout.splitlines() if line.strip()}
+
+
+class UIBackend(abc.ABC):
+    """Everything the monitor needs from the desktop: processes, windows, buttons and clicks
+
+    Queries raise ScanError when the desktop could not be looked at, so callers
+    can tell "no windows" apart from "could not look"; snapshot() and
+    window_titles() may instead name single processes that could not be
+    looked at in the `errors` of a DialogSnapshot or WindowTitles. The async
+    variants used by the async engine default to running the blocking call in
+    a worker thread under the given timeout.
+    """
+
+    name = "base"
+
+    def available(self) -> bool:
+        """Whether there is a desktop session to query at all"""
+        return True
+
+    @abc.abstractmethod
+    def running_processes(self) -> Set[str]:
+        """Names of the running processes"""
+
+    @abc.abstractmethod
+    def window_titles(self, process_names: List[str]) -> Dict[str, List[str]]:
+        """Window titles per running process, in window order, without enumerating buttons"""
+
+    @abc.abstractmethod
+    def snapshot(self, process_names: List[str] = None,
+                 windows: Dict[str, List[int]] = None) -> List[DialogWindow]:
+        """Windows with buttons in the named processes (all of them for None), narrowed by `windows`"""
+
+    @abc.abstractmethod
+    def click(self, window: DialogWindow, button_name: str) -> bool:
+        """Click a button in a window returned by snapshot()"""
+
+    @abc.abstractmethod
+    def click_first(self, process_names: List[str],
+                    button_names: List[str]) -> List[Tuple[str, str, str]]:
+        """Click the first candidate button found in each process; (process, button, title) per click"""
+
+    def accessible(self) -> bool:
+        """Whether UI scripting is permitted"""
+        return True
+
+    async def snapshot_async(self, process_names: List[str], timeout: float) -> List[DialogWindow]:
+        return await self._in_thread(timeout, self.snapshot, process_names)
+
+    async def click_async(self, window: DialogWindow, button_name: str, timeout: float) -> bool:
+        return await self._in_thread(timeout, self.click, window, button_name)
+
+    @staticmethod
+    async def _in_thread(timeout: float, function: Callable, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(None, function, *args), timeout)
+        except asyncio.TimeoutError:
+            raise ScanError(TIMEOUT_MESSAGE)
+
+
+class AppleScriptBackend(UIBackend):
+    """System Events through osascript in the console user's session
+
+    Scripts run through the helper's script host or spawned osascript, from
+    the compiled template cache when possible. Async calls always spawn one
+    osascript per call (built by command_builder) so a hung one can be killed.
+    """
+
+    name = "applescript"
+
+    def __init__(self, helper: "CopilotHelper",
+                 command_builder: Callable[[str, str, List[str]], List[str]] = None):
+        self.helper = helper
+        self.command_builder = command_builder or helper.build_template_command
+
+    def available(self) -> bool:
+        return bool(self.helper.session_resolver.resolve()[1])
+
+    def running_processes(self) -> Set[str]:
+        return self.helper.process_table.snapshot()
+
+    def window_titles(self, process_names: List[str]) -> Dict[str, List[str]]:
+        success, result = self.helper.run_template_as_user("window_titles", [json.dumps(process_names)])
+        if not success:
+            raise ScanError(result)
+
+        try:
+            return parse_window_titles(result)
+        except ValueError as e:
+            raise ScanError(f"Error parsing window list: {e}")
+
+    def snapshot(self, process_names: List[str] = None,
+                 windows: Dict[str, List[int]] = None) -> List[DialogWindow]:
+        if windows is not None:
+            process_names = list(windows)
+        success, result = self.helper.run_template_as_user(
+            "dialog_snapshot", [json.dumps(process_names), json.dumps(windows)]
+        )
+        if not success:
+            raise ScanError(result)
+        return self._parse_snapshot(result)
+
+    @staticmethod
+    def _parse_snapshot(result: str) -> DialogSnapshot:
+        try:
+            return parse_dialog_snapshot(result)
+        except ValueError as e:
+            raise ScanError(f"Error parsing dialog result: {e}")
+
+    def click(self, window: DialogWindow, button_name: str) -> bool:
+        success, result = self.helper.run_template_as_user(
+            "click_button", self.helper.click_arguments(window, button_name)
+        )
+        return success and result == "clicked"
+
+    def click_first(self, process_names: List[str],
+                    button_names: List[str]) -> List[Tuple[str, str, str]]:
+        success, result = self.helper.run_template_as_user(
+            "batched_click", self.helper.batched_click_arguments(process_names, button_names)
+        )
+        if not success:
+            raise ScanError(result)
+        clicks = []
+        for line in result.splitlines():
+            parts = line.split("\t")
+            if len(parts) == 3:
+                clicks.append((parts[0], parts[1], parts[2]))
+        return clicks
+
+    def accessible(self) -> bool:
+        success, result = self.helper.run_template_as_user("accessibility_check")
+        return success and result == "accessible"
+
+    async def run_script(self, name: str, args: List[str], timeout: float = None) -> Tuple[bool, str]:
+        """Run one script template as a subprocess, killing it on timeout or cancellation"""
+        user, uid = self.helper.session_resolver.resolve()
+        if not uid:
+            return False, "No user logged in"
+        started = time.perf_counter()
+        self.helper.governor.record_spawn()
+        process = await asyncio.create_subprocess_exec(
+            *self.command_builder(uid, name, args),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            self.helper.record_script_run(name, "spawn", started, TIMEOUT_MESSAGE)
+            return False, TIMEOUT_MESSAGE
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+        output = (stdout if process.returncode == 0 else stderr).decode(errors="replace").strip()
+        self.helper.record_script_run(name, "spawn", started, output)
+        return process.returncode == 0, output
+
+    async def snapshot_async(self, process_names: List[str], timeout: float) -> List[DialogWindow]:
+        success, result = await self.run_script("dialog_snapshot", [json.dumps(process_names), "null"], timeout)
+        if not success:
+            raise ScanError(result)
+        return self._parse_snapshot(result)
+
+    async def click_async(self, window: DialogWindow, button_name: str, timeout: float) -> bool:
+        success, result = await self.run_script(
+            "click_button", self.helper.click_arguments(window, button_name), timeout
+        )
+        return success and result == "clicked"
+
+
+class SimulatedDesktop(UIBackend):
+    """In-memory desktop for running the monitor off a Mac (tests, CI benchmarks)
+
+    Processes own ordered lists of (title, buttons) windows; window indexes
+    are 1-based positions, so closing a window renumbers the ones after it,
+    as in System Events. Every query costs `latency` seconds plus any
+    per-process latency, and a query touching a hung process blocks for
+    `timeout` seconds and then fails the way a wedged osascript does. A
+    failing process answers at once but is reported in the scan's `errors`,
+    like an application whose accessibility queries throw. Clicking a
+    button closes its window and is logged in `clicks`; button names match
+    as in AppleScript, ignoring case only (see find_candidate_button).
+    `sleep` can be swapped for a simulated clock's advance. Safe to drive
+    from another thread while the monitor scans.
+    """
+
+    name = "simulated"
+    FAILURE_MESSAGE = "Error: Invalid index. (-1719)"
+
+    def __init__(self, latency: float = 0.0, timeout: float = 10.0,
+                 clock: Callable[[], float] = None, sleep: Callable[[float], None] = None):
+        self.latency = latency
+        self.timeout = timeout
+        self.clock = clock or time.monotonic
+        self.sleep = sleep or time.sleep
+        self.queries = 0
+        self.clicks: List[Tuple[float, str, str, str]] = []  # (time, process, title, button)
+        self._processes: Dict[str, List[Tuple[str, Tuple[str, ...]]]] = {}
+        self._latencies: Dict[str, float] = {}
+        self._hung: Set[str] = set()
+        self._failing: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def launch(self, process_name: str, latency: float = 0.0) -> None:
+        with self._lock:
+            self._processes.setdefault(process_name, [])
+            self._latencies[process_name] = latency
+
+    def quit(self, process_name: str) -> None:
+        with self._lock:
+            self._processes.pop(process_name, None)
+            self._hung.discard(process_name)
+            self._failing.discard(process_name)
+
+    def hang(self, process_name: str, hung: bool = True) -> None:
+        """Make every query that touches the process time out (or stop doing so)"""
+        with self._lock:
+            (self._hung.add if hung else self._hung.discard)(process_name)
+
+    def fail(self, process_name: str, failing: bool = True) -> None:
+        """Make every query of the process's windows report an error (or stop doing so)"""
+        with self._lock:
+            (self._failing.add if failing else self._failing.discard)(process_name)
+
+    def open_window(self, process_name: str, title: str, buttons: List[str]) -> None:
+        """Show a window, launching its process if needed"""
+        with self._lock:
+            self._processes.setdefault(process_name, []).append((title, tuple(buttons)))
+
+    def close_window(self, process_name: str, title: str) -> bool:
+        with self._lock:
+            windows = self._processes.get(process_name, [])
+            for index, (window_title, _) in enumerate(windows):
+                if window_title == title:
+                    del windows[index]
+                    return True
+        return False
+
+    def windows(self, process_name: str) -> List[Tuple[str, Tuple[str, ...]]]:
+        with self._lock:
+            return list(self._processes.get(process_name, []))
+
+    def _query(self, process_names: List[str]) -> None:
+        """Charge latency for a query and fail it if a hung process is involved"""
+        self.queries += 1
+        with self._lock:
+            hung = any(name in self._hung for name in process_names)
+            delay = self.latency + max((self._latencies.get(name, 0.0) for name in process_names), default=0.0)
+        if hung:
+            self.sleep(self.timeout)
+            raise ScanError(TIMEOUT_MESSAGE)
+        if delay:
+            self.sleep(delay)
+
+    def running_processes(self) -> Set[str]:
+        with self._lock:
+            return set(self._processes)
+
+    def window_titles(self, process_names: List[str]) -> Dict[str, List[str]]:
+        self._query(process_names)
+        with self._lock:
+            names = [name for name in process_names if name in self._processes]
+            return WindowTitles({name: [title for title, _ in self._processes[name]]
+                                 for name in names if name not in self._failing},
+                                {name: self.FAILURE_MESSAGE for name in names if name in self._failing})
+
+    def snapshot(self, process_names: List[str] = None,
+                 windows: Dict[str, List[int]] = None) -> List[DialogWindow]:
+        if windows is not None:
+            process_names = list(windows)
+        with self._lock:
+            names = list(self._processes) if process_names is None else process_names
+        self._query(names)
+        found = DialogSnapshot()
+        with self._lock:
+            for name in names:
+                if name in self._failing and name in self._processes:
+                    found.errors[name] = self.FAILURE_MESSAGE
+                    continue
+                for index, (title, buttons) in enumerate(self._processes.get(name, []), 1):
+                    if buttons and (windows is None or index in windows.get(name, ())):
+                        found.append(DialogWindow(name, title, index, buttons))
+        return found
+
+    def click(self, window: DialogWindow, button_name: str) -> bool:
+        self._query([window.process])
+        with self._lock:
+            windows = self._processes.get(window.process, [])
+            if window.index > len(windows):
+                return False
+            title, buttons = windows[window.index - 1]
+            match = find_candidate_button([button_name], buttons) if title == window.title else None
+            if match is None:
+                return False
+            del windows[window.index - 1]
+            self.clicks.append((self.clock(), window.process, title, match[1]))
+        return True
+
+    def click_first(self, process_names: List[str],
+                    button_names: List[str]) -> List[Tuple[str, str, str]]:
+        self._query(process_names)
+        clicks = []
+        with self._lock:
+            for name in process_names:
+                windows = self._processes.get(name, [])
+                for index, (title, buttons) in enumerate(windows):
+                    match = find_candidate_button(button_names, buttons)
+                    if match is not None:
+                        del windows[index]
+                        self.clicks.append((self.clock(), name, title, match[1]))
+                        # Reported by candidate name, as the batched click script does
+                        clicks.append((name, match[0], title))
+                        break
+        return clicks
+
+
+def open_trace(path: str, mode: str = "r"):
+    """Open an NDJSON trace as text, compressed by suffix: .gz (gzip) or .zst (needs zstandard)"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if path.endswith(".zst"):
+        zstandard = optional_import("zstandard")
+        if zstandard is None:
+            raise ValueError("Reading or writing .zst traces needs the zstandard package")
+        if "r" in mode:
+            stream = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(open(path, mode + "b"))
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class TraceRecorder:
+    """Append what the monitor saw and decided on each tick to an NDJSON trace
+
+    A header line ({"trace": 1, "version", "started"}) opens every recording
+    session, so one file can hold several. Each tick is then one line:
+    {"t": seconds since the header, "targets": [...], "windows": [[process,
+    title, index, [buttons]], ...], "decisions": [[process, index, title,
+    button, clicked], ...]}. "targets" and "windows" are left out when they
+    did not change since the previous tick and "decisions" when no rule
+    matched, so an idle desktop costs a few bytes per tick. The file is
+    flushed at most once per flush_interval seconds.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, clock: Callable[[], float] = None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.clock = clock or time.monotonic
+        self.ticks = 0
+        self._file = open_trace(path, "a")
+        self._started = self.clock()
+        self._next_flush = self._started + flush_interval
+        self._targets: Optional[List[str]] = None
+        self._windows: Optional[List] = None
+        self._write({"trace": 1, "version": __version__, "started": time.time()})
+
+    def _write(self, entry: Dict) -> None:
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def record(self, targets: List[str], windows: List[DialogWindow],
+               decisions: List[Tuple[DialogWindow, str, bool]]) -> None:
+        """Write one tick: the targets, the windows found and the (window, button, clicked) decisions"""
+        now = self.clock()
+        entry: Dict = {"t": round(now - self._started, 4)}
+        if targets != self._targets:
+            entry["targets"] = self._targets = list(targets)
+        rows = [[w.process, w.title, w.index, list(w.buttons)] for w in windows]
+        if rows != self._windows:
+            entry["windows"] = self._windows = rows
+        if decisions:
+            entry["decisions"] = [[w.process, w.index, w.title, button, clicked] for w, button, clicked in decisions]
+        self._write(entry)
+        self.ticks += 1
+        if now >= self._next_flush:
+            self._file.flush()
+            self._next_flush = now + self.flush_interval
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ReplayBackend(UIBackend):
+    """Serve a recorded trace to the unchanged monitor, one tick at a time
+
+    The windows of the current tick are all the desktop there is. A click
+    succeeds unless the recording shows the same click failing; either way
+    it is kept in `clicks` so the tick's decisions can be compared with the
+    recorded ones. `clock` follows the trace's timestamps, so cooldowns and
+    cache lifetimes behave as they did when the trace was recorded.
+    """
+
+    name = "replay"
+
+    def __init__(self):
+        self.now = 0.0
+        self.targets: List[str] = []
+        self.windows: List[DialogWindow] = []
+        self.clicks: List[Tuple[str, str, str]] = []
+        self._failed: Set[Tuple[str, str, str]] = set()
+
+    def clock(self) -> float:
+        return self.now
+
+    def load(self, now: float, targets: List[str], windows: List[DialogWindow], decisions: List) -> None:
+        self.now = now
+        self.targets = targets
+        self.windows = windows
+        self.clicks = []
+        self._failed = {(process, title, button) for process, _, title, button, clicked in decisions if not clicked}
+
+    def running_processes(self) -> Set[str]:
+        return set(self.targets) | {window.process for window in self.windows}
+
+    def window_titles(self, process_names: List[str]) -> Dict[str, List[str]]:
+        # Windows without buttons were not recorded; blank titles keep the indexes in place
+        titles: Dict[str, List[str]] = {}
+        for window in self.windows:
+            if window.process in process_names:
+                slots = titles.setdefault(window.process, [])
+                slots.extend([""] * (window.index - len(slots)))
+                slots[window.index - 1] = window.title
+        return titles
+
+    def snapshot(self, process_names: List[str] = None,
+                 windows: Dict[str, List[int]] = None) -> List[DialogWindow]:
+        if windows is not None:
+            return [w for w in self.windows if w.index in windows.get(w.process, ())]
+        return [w for w in self.windows if process_names is None or w.process in process_names]
+
+    def click(self, window: DialogWindow, button_name: str) -> bool:
+        key = (window.process, window.title, button_name)
+        self.clicks.append(key)
+        return key not in self._failed
+
+    def click_first(self, process_names: List[str],
+                    button_names: List[str]) -> List[Tuple[str, str, str]]:
+        clicks = []
+        for name in process_names:
+            for window in self.windows:
+                match = find_candidate_button(button_names, window.buttons) if window.process == name else None
+                if match is not None:
+                    if self.click(window, match[1]):
+                        clicks.append((name, match[0], window.title))
+                    break
+        return clicks
+
+
+def replay_trace(helper: "CopilotHelper", path: str, realtime: bool = False,
+                 sleep: Callable[[float], None] = None, max_diffs: int = 20) -> Dict:
+    """Feed a recorded trace through the helper's monitor tick, streaming it line by line
+
+    Returns tick and click counts, the ticks whose clicks differ from the
+    recording (the first max_diffs of them in full) and the per-tick cost.
+    In realtime mode ticks are spaced as they were recorded.
+    """
+    sleep = sleep or time.sleep
+    backend = ReplayBackend()
+    helper.backend = backend
+    for component in (helper.scheduler, helper.scanner, helper.decisions, helper.health):
+        component.clock = backend.clock
+    # Recorded targets already went through the recorder's scan schedule
+    helper.frequency.enabled = False
+    helper.is_running = True
+
+    costs: List[float] = []
+    diffs: List[Dict] = []
+    diff_ticks = recorded_clicks = replayed_clicks = 0
+    first_started = segment_started = None
+    targets: List[str] = []
+    windows: List[DialogWindow] = []
+    wall_started = time.monotonic()
+    try:
+        with open_trace(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "trace" in entry:
+                    segment_started = entry.get("started", 0.0)
+                    if first_started is None:
+                        first_started = segment_started
+                    targets, windows = [], []
+                    continue
+                now = (segment_started or 0.0) - (first_started or 0.0) + entry["t"]
+                if "targets" in entry:
+                    targets = entry["targets"]
+                if "windows" in entry:
+                    windows = [DialogWindow(p, title, index, tuple(buttons))
+                               for p, title, index, buttons in entry["windows"]]
+                decisions = entry.get("decisions", [])
+                if realtime:
+                    delay = wall_started + now - time.monotonic()
+                    if delay > 0:
+                        sleep(delay)
+
+                backend.load(now, targets, windows, decisions)
+                started = time.perf_counter()
+                clicks = helper.run_tick()
+                costs.append(time.perf_counter() - started)
+                helper.scheduler.record_tick(clicks > 0)
+
+                recorded = {(p, title, button) for p, _, title, button, clicked in decisions}
+                replayed = set(backend.clicks)
+                recorded_clicks += len(recorded)
+                replayed_clicks += len(replayed)
+                if recorded != replayed:
+                    diff_ticks += 1
+                    if len(diffs) < max_diffs:
+                        diffs.append({"tick": len(costs), "t": round(now, 3),
+                                      "recorded": sorted(recorded - replayed),
+                                      "replayed": sorted(replayed - recorded)})
+    finally:
+        helper.is_running = False
+
+    ordered = sorted(costs)
+
+    def cost(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1e6 if ordered else 0.0
+
+    elapsed = time.monotonic() - wall_started
+    return {
+        "ticks": len(costs), "recorded_clicks": recorded_clicks, "replayed_clicks": replayed_clicks,
+        "diff_ticks": diff_ticks, "diffs": diffs, "elapsed": elapsed,
+        "ticks_per_second": len(costs) / elapsed if elapsed else 0.0,
+        "tick_us": {"p50": cost(0.5), "p95": cost(0.95), "p99": cost(0.99), "max": cost(1.0)}
+    }
+
+
+def format_replay(report: Dict) -> List[str]:
+    """Render a replay report as the lines printed by `replay`"""
+    lines = [
+        f"Replayed {report['ticks']} ticks in {report['elapsed']:.2f}s ({report['ticks_per_second']:.0f} ticks/s)",
+        f"Tick cost: p50 {report['tick_us']['p50']:.0f} µs, p95 {report['tick_us']['p95']:.0f} µs, "
+        f"p99 {report['tick_us']['p99']:.0f} µs, max {report['tick_us']['max']:.0f} µs",
+        f"Clicks: {report['recorded_clicks']} recorded, {report['replayed_clicks']} replayed",
+        f"Ticks with different decisions: {report['diff_ticks']}"
+    ]
+    for diff in report["diffs"]:
+        lines.append(f"  tick {diff['tick']} (t={diff['t']}s): recorded {diff['recorded']}, "
+                     f"replayed {diff['replayed']}")
+    return lines
+
+
+class AuditStore:
+    """Every click decision as a row in a SQLite database in WAL mode
+
+    record() only appends the row to an in-memory queue, so the monitor loop
+    never waits for the disk: a writer thread commits everything queued in
+    one transaction every flush_interval seconds, or as soon as batch_size
+    rows are waiting. When max_pending rows are already queued, new ones are
+    dropped and counted rather than growing memory without bound.
+
+    The same transaction folds the rows into decision_rollup, per hour, UID,
+    process and button, which answers `audit --group-by` without scanning
+    millions of rows. Raw rows are indexed on time and on (process, time),
+    the two ways `audit` filters. Rows older than retention_days are deleted
+    once an hour, in chunks so writers from other sessions are never blocked
+    for long (WAL readers are not blocked at all).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS decisions (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            uid TEXT NOT NULL,
+            process TEXT NOT NULL,
+            title TEXT NOT NULL,
+            buttons TEXT,
+            button TEXT NOT NULL,
+            clicked INTEGER NOT NULL,
+            latency REAL
+        );
+        CREATE INDEX IF NOT EXISTS decisions_ts ON decisions (ts);
+        CREATE INDEX IF NOT EXISTS decisions_process_ts ON decisions (process, ts);
+        CREATE TABLE IF NOT EXISTS decision_rollup (
+            bucket INTEGER NOT NULL,
+            uid TEXT NOT NULL,
+            process TEXT NOT NULL,
+            button TEXT NOT NULL,
+            decisions INTEGER NOT NULL,
+            clicked INTEGER NOT NULL,
+            latency_sum REAL NOT NULL,
+            latency_count INTEGER NOT NULL,
+            latency_max REAL NOT NULL,
+            first REAL NOT NULL,
+            last REAL NOT NULL,
+            PRIMARY KEY (bucket, uid, process, button)
+        );
+    """
+    BUCKET = 3600
+    PRUNE_INTERVAL = 3600.0
+    PRUNE_CHUNK = 10000
+
+    def __init__(self, path: str, retention_days: float = 90.0, flush_interval: float = 1.0,
+                 batch_size: int = 1000, max_pending: int = 100000, clock: Callable[[], float] = None):
+        self.path = path
+        self.retention_days = retention_days
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.clock = clock or time.time
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.pruned = 0
+        self.errors = 0
+        # Appends and pops of a deque are atomic, so record() takes no lock
+        self._pending: deque = deque()
+        self._wake = threading.Event()
+        self._next_prune = 0.0
+        # Fail here, not in the writer thread, when the database cannot be created
+        connection = self.connect(path)
+        connection.executescript(self.SCHEMA)
+        connection.close()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "AuditStore":
+        return cls(
+            os.path.expanduser(config.get("audit_file", "~/.copilot_helper_audit.db")),
+            retention_days=config.get("audit_retention_days", 90.0),
+            flush_interval=config.get("audit_flush_interval", 1.0)
+        )
+
+    def reconfigure(self, config: Dict) -> None:
+        self.retention_days = config.get("audit_retention_days", 90.0)
+        self.flush_interval = config.get("audit_flush_interval", 1.0)
+
+    @staticmethod
+    def connect(path: str) -> "sqlite3.Connection":
+        """Writable connection in WAL mode; other processes writing the same file wait up to 5s"""
+        connection = sqlite3.connect(path, timeout=5.0)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def record(self, uid: str, process: str, title: str, buttons: Optional[Tuple[str, ...]],
+               button: str, clicked: bool, latency: Optional[float]) -> None:
+        """Queue one decision; buttons and latency are None when the scan did not tell"""
+        pending = self._pending
+        if len(pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        pending.append((self.clock(), uid, process, title, buttons, button, int(clicked), latency))
+        if len(pending) >= self.batch_size:
+            self._wake.set()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything queued so far is committed"""
+        if not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        self._pending.append(done)
+        self._wake.set()
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Commit what is queued and stop the writer thread"""
+        if self._thread.is_alive():
+            self._pending.append(None)
+            self._wake.set()
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        connection = self.connect(self.path)
+        try:
+            running = True
+            while running:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                rows, flushes = [], []
+                while True:
+                    try:
+                        item = self._pending.popleft()
+                    except IndexError:
+                        break
+                    if isinstance(item, tuple):
+                        rows.append(item)
+                    elif item is None:
+                        running = False
+                    else:
+                        flushes.append(item)
+                if rows:
+                    self._write(connection, rows)
+                if self.clock() >= self._next_prune:
+                    self._prune(connection)
+                for done in flushes:
+                    done.set()
+        finally:
+            connection.close()
+
+    def _rollup(self, rows: List[Tuple]) -> List[Tuple]:
+        """Fold rows into (bucket, uid, process, button) totals"""
+        totals: Dict[Tuple, List] = {}
+        for ts, uid, process, _, _, button, clicked, latency in rows:
+            key = (int(ts // self.BUCKET) * self.BUCKET, uid, process, button)
+            entry = totals.get(key)
+            if entry is None:
+                entry = totals[key] = [0, 0, 0.0, 0, 0.0, ts, ts]
+            entry[0] += 1
+            entry[1] += clicked
+            if latency is not None:
+                entry[2] += latency
+                entry[3] += 1
+                entry[4] = max(entry[4], latency)
+            entry[5] = min(entry[5], ts)
+            entry[6] = max(entry[6], ts)
+        return [key + tuple(entry) for key, entry in totals.items()]
+
+    def _write(self, connection: "sqlite3.Connection", rows: List[Tuple]) -> None:
+        # Buttons are encoded here, off the monitor loop, once per distinct button set
+        encoded: Dict[Optional[Tuple[str, ...]], Optional[str]] = {None: None}
+        for row in rows:
+            if row[4] not in encoded:
+                encoded[row[4]] = json.dumps(list(row[4]))
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT INTO decisions (ts, uid, process, title, buttons, button, clicked, latency) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [row[:4] + (encoded[row[4]],) + row[5:] for row in rows]
+                )
+                connection.executemany(
+                    "INSERT INTO decision_rollup VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (bucket, uid, process, button) DO UPDATE SET "
+                    "decisions = decisions + excluded.decisions, clicked = clicked + excluded.clicked, "
+                    "latency_sum = latency_sum + excluded.latency_sum, "
+                    "latency_count = latency_count + excluded.latency_count, "
+                    "latency_max = max(latency_max, excluded.latency_max), "
+                    "first = min(first, excluded.first), last = max(last, excluded.last)",
+                    self._rollup(rows)
+                )
+        except sqlite3.Error as e:
+            self.errors += 1
+            self.dropped += len(rows)
+            logging.getLogger(__name__).warning("Dropped %d audit rows: %s", len(rows), e)
+            return
+        self.written += len(rows)
+        self.batches += 1
+
+    def prune(self) -> int:
+        """Delete rows past the retention period now; returns how many"""
+        connection = self.connect(self.path)
+        try:
+            return self._prune(connection)
+        finally:
+            connection.close()
+
+    def _prune(self, connection: "sqlite3.Connection") -> int:
+        self._next_prune = self.clock() + self.PRUNE_INTERVAL
+        if self.retention_days <= 0:
+            return 0
+        cutoff = self.clock() - self.retention_days * 86400
+        deleted = 0
+        try:
+            while True:
+                with connection:
+                    cursor = connection.execute(
+                        "DELETE FROM decisions WHERE id IN (SELECT id FROM decisions WHERE ts < ? LIMIT ?)",
+                        (cutoff, self.PRUNE_CHUNK)
+                    )
+                deleted += cursor.rowcount
+                if cursor.rowcount < self.PRUNE_CHUNK:
+                    break
+            # Hours only partly past the cutoff keep their totals until they are wholly past it
+            with connection:
+                connection.execute("DELETE FROM decision_rollup WHERE bucket + ? <= ?", (self.BUCKET, cutoff))
+        except sqlite3.Error as e:
+            self.errors += 1
+            logging.getLogger(__name__).warning("Audit pruning failed: %s", e)
+        self.pruned += deleted
+        return deleted
+
+    def stats(self) -> Dict:
+        return {"path": self.path, "written": self.written, "pending": len(self._pending),
+                "dropped": self.dropped, "batches": self.batches, "pruned": self.pruned, "errors": self.errors}
+
+
+# Group keys of `audit --group-by`, as SQL over a time column
+AUDIT_GROUPS = {
+    "process": "process",
+    "button": "button",
+    "uid": "uid",
+    "title": "title",
+    "day": "strftime('%Y-%m-%d', {time}, 'unixepoch', 'localtime')",
+    "hour": "strftime('%Y-%m-%d %H:00', {time}, 'unixepoch', 'localtime')"
+}
+
+
+def open_audit(path: str) -> "sqlite3.Connection":
+    """Read-only connection to an audit database; raises sqlite3.Error if it does not exist"""
+    from urllib.parse import quote
+    connection = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True, timeout=5.0)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def parse_audit_time(text: str, now: float = None) -> float:
+    """Timestamp for --since/--until: an age such as 90s, 30m, 12h or 7d, or an ISO date/time"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhdw])", text.strip())
+    if match:
+        unit = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}[match.group(2)]
+        return (time.time() if now is None else now) - float(match.group(1)) * unit
+    from datetime import datetime
+    return datetime.fromisoformat(text.strip()).timestamp()
+
+
+def audit_filters(since: float = None, until: float = None, process: str = None, button: str = None,
+                  title: str = None, uid: str = None, clicked: bool = None,
+                  time_column: str = "ts", walk_time: bool = False) -> Tuple[str, List]:
+    """WHERE clause and parameters for the `audit` filters
+
+    process, button and title are shell-style globs; without wildcards they
+    are compared for equality, which lets the process filter use its index.
+    With walk_time a process glob is kept off its index, so a newest-first
+    listing walks the time index and stops after `limit` matches.
+    """
+    clauses, params = [], []
+    if since is not None:
+        clauses.append(f"{time_column} >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append(f"{time_column} < ?")
+        params.append(until)
+    for column, pattern in (("process", process), ("button", button), ("title", title)):
+        if pattern:
+            if any(c in pattern for c in "*?["):
+                clauses.append(f"{'+' if walk_time else ''}{column} GLOB ?")
+            else:
+                clauses.append(f"{column} = ?")
+            params.append(pattern)
+    if uid:
+        clauses.append("uid = ?")
+        params.append(str(uid))
+    if clicked is not None:
+        clauses.append("clicked = ?")
+        params.append(int(clicked))
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def query_audit(connection: "sqlite3.Connection", limit: int = 50, **filters) -> List[Dict]:
+    """Most recent decisions matching the filters, newest first"""
+    where, params = audit_filters(walk_time=True, **filters)
+    rows = connection.execute(
+        f"SELECT ts, uid, process, title, buttons, button, clicked, latency FROM decisions{where} "
+        f"ORDER BY ts DESC LIMIT ?", params + [limit]
+    )
+    return [dict(row, buttons=None if row["buttons"] is None else json.loads(row["buttons"]),
+                 clicked=bool(row["clicked"])) for row in rows]
+
+
+def aggregate_audit(connection: "sqlite3.Connection", group_by: str = "process", limit: int = 50,
+                    **filters) -> List[Dict]:
+    """Decision counts and latency per group, largest groups first
+
+    Whole hours come from decision_rollup and only the partial hours at the
+    ends of the since/until range from the raw rows. Grouping by title, or
+    filtering by title or outcome, needs the raw rows throughout.
+    """
+    since, until = filters.get("since"), filters.get("until")
+    spans = []  # (table, since, until)
+    if group_by == "title" or filters.get("title") or filters.get("clicked") is not None:
+        spans.append(("decisions", since, until))
+    else:
+        bucket = AuditStore.BUCKET
+        first = None if since is None else -(-since // bucket) * bucket
+        last = None if until is None else until // bucket * bucket
+        if first is not None and last is not None and first >= last:
+            spans.append(("decisions", since, until))
+        else:
+            spans.append(("decision_rollup", first, last))
+            if first is not None and since < first:
+                spans.append(("decisions", since, first))
+            if last is not None and last < until:
+                spans.append(("decisions", last, until))
+
+    groups: Dict[str, Dict] = {}
+    for table, start, end in spans:
+        span_filters = dict(filters, since=start, until=end)
+        if table == "decisions":
+            where, params = audit_filters(**span_filters)
+            totals = "COUNT(*), SUM(clicked), TOTAL(latency), COUNT(latency), MAX(latency), MIN(ts), MAX(ts)"
+            key = AUDIT_GROUPS[group_by].format(time="ts")
+        else:
+            where, params = audit_filters(time_column="bucket", **span_filters)
+            totals = ("SUM(decisions), SUM(clicked), SUM(latency_sum), SUM(latency_count), "
+                      "MAX(CASE WHEN latency_count THEN latency_max END), MIN(first), MAX(last)")
+            key = AUDIT_GROUPS[group_by].format(time="bucket")
+        for row in connection.execute(f"SELECT {key}, {totals} FROM {table}{where} GROUP BY 1", params):
+            name, decisions, clicked, latency_sum, latency_count, latency_max, first_ts, last_ts = tuple(row)
+            group = groups.setdefault(name, {"key": name, "decisions": 0, "clicked": 0, "latency_sum": 0.0,
+                                             "latency_count": 0, "max_latency": None, "first": first_ts,
+                                             "last": last_ts})
+            group["decisions"] += decisions
+            group["clicked"] += clicked
+            group["latency_sum"] += latency_sum or 0.0
+            group["latency_count"] += latency_count or 0
+            if latency_max is not None:
+                group["max_latency"] = max(group["max_latency"] or 0.0, latency_max)
+            group["first"] = min(group["first"], first_ts)
+            group["last"] = max(group["last"], last_ts)
+
+    results = []
+    for group in sorted(groups.values(), key=lambda g: (-g["decisions"], str(g["key"])))[:limit]:
+        latency_sum, latency_count = group.pop("latency_sum"), group.pop("latency_count")
+        group["avg_latency"] = latency_sum / latency_count if latency_count else None
+        results.append(group)
+    return results
+
+
+def format_audit(rows: List[Dict], group_by: str = None) -> List[str]:
+    """Render `audit` results as the lines it prints"""
+    if not rows:
+        return ["No matching decisions"]
+    lines = []
+    if group_by:
+        lines.append(f"{group_by:<32} {'decisions':>9} {'clicked':>8} {'avg latency':>12} {'max latency':>12}")
+        for row in rows:
+            average = "-" if row["avg_latency"] is None else f"{row['avg_latency']:.2f}s"
+            longest = "-" if row["max_latency"] is None else f"{row['max_latency']:.2f}s"
+            lines.append(f"{str(row['key'])[:32]:<32} {row['decisions']:>9} {row['clicked']:>8} "
+                         f"{average:>12} {longest:>12}")
+        return lines
+    for row in rows:
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["ts"]))
+        outcome = "clicked" if row["clicked"] else "failed "
+        latency = "" if row["latency"] is None else f" after {row['latency']:.2f}s"
+        buttons = "" if row["buttons"] is None else f" of [{', '.join(row['buttons'])}]"
+        lines.append(f"{when}  uid {row['uid']}  {outcome} '{row['button']}'{buttons} "
+                     f"in {row['process']}: {row['title']}{latency}")
+    return lines
+
+
+class PollingScheduler:
+    """Adaptive tick interval with idle backoff, burst mode and per-process click cooldowns
+
+    While nothing is detected the interval grows geometrically from
+    base_interval up to max_interval. Any click snaps the loop into burst
+    mode (burst_interval) for burst_window seconds, because approvals tend to
+    arrive in groups. A process that was just clicked is skipped for
+    click_cooldown seconds instead of stalling the whole loop.
+    """
+
+    def __init__(self, base_interval: float = 0.5, max_interval: float = 2.0,
+                 idle_backoff: float = 1.5, burst_interval: float = 0.1,
+                 burst_window: float = 5.0, click_cooldown: float = 0.5,
+                 clock: Callable[[], float] = None):
+        self.base_interval = base_interval
+        self.max_interval = max(max_interval, base_interval)
+        self.idle_backoff = max(idle_backoff, 1.0)
+        self.burst_interval = min(burst_interval, base_interval)
+        self.burst_window = burst_window
+        self.click_cooldown = click_cooldown
+        self.clock = clock or time.monotonic
+        self.idle_ticks = 0
+        self._burst_until = float("-inf")
+        self._cooldowns: Dict[str, float] = {}
+
+    @classmethod
+    def from_config(cls, config: Dict, clock: Callable[[], float] = None) -> "PollingScheduler":
+        return cls(
+            base_interval=config.get("check_interval", 0.5),
+            max_interval=config.get("max_interval", 2.0),
+            idle_backoff=config.get("idle_backoff", 1.5),
+            burst_interval=config.get("burst_interval", 0.1),
+            burst_window=config.get("burst_window", 5.0),
+            click_cooldown=config.get("click_cooldown", 0.5),
+            clock=clock
+        )
+
+    def reconfigure(self, config: Dict) -> None:
+        """Adopt new settings, keeping the current backoff, burst and cooldown state"""
+        fresh = self.from_config(config, self.clock)
+        for name in ("base_interval", "max_interval", "idle_backoff", "burst_interval",
+                     "burst_window", "click_cooldown"):
+            setattr(self, name, getattr(fresh, name))
+
+    def record_click(self, process_name: str) -> None:
+        """Start the cooldown for a process and enter burst mode"""
+        now = self.clock()
+        self._cooldowns[process_name] = now + self.click_cooldown
+        self._burst_until = now + self.burst_window
+        self.idle_ticks = 0
+
+    def record_tick(self, detected: bool) -> None:
+        """Account for a finished tick"""
+        if detected:
+            self.idle_ticks = 0
+        else:
+            self.idle_ticks += 1
+
+    def next_interval(self) -> float:
+        """Seconds to wait before the next tick"""
+        if self.clock() < self._burst_until:
+            return self.burst_interval
+        return self._idle_interval(self.idle_ticks)
+
+    def longest_interval(self) -> float:
+        """Longest the wait after the current tick can be, whether or not the tick clicks"""
+        return max(self.next_interval(), self._idle_interval(self.idle_ticks + 1))
+
+    def _idle_interval(self, idle_ticks: int) -> float:
+        try:
+            return min(self.base_interval * self.idle_backoff ** idle_ticks, self.max_interval)
+        except OverflowError:
+            # A long idle stretch: the backoff passed max_interval long ago
+            return self.max_interval
+
+    def is_cooling_down(self, process_name: str) -> bool:
+        until = self._cooldowns.get(process_name)
+        if until is None:
+            return False
+        if self.clock() >= until:
+            del self._cooldowns[process_name]
+            return False
+        return True
+
+
+class ProcessHealthTracker:
+    """Per-process circuit breaker for accessibility queries that fail or hang
+
+    closed: the process is probed normally. After failure_threshold
+    consecutive failures (or timeout_threshold consecutive timeouts) the
+    circuit opens and the process is quarantined. Once the quarantine expires
+    the circuit goes half-open and one trial probe is let through: success
+    closes it, failure re-opens it with the quarantine doubled, up to
+    max_quarantine.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 3, timeout_threshold: int = 2,
+                 quarantine: float = 5.0, max_quarantine: float = 300.0,
+                 clock: Callable[[], float] = None):
+        self.failure_threshold = failure_threshold
+        self.timeout_threshold = timeout_threshold
+        self.quarantine = quarantine
+        self.max_quarantine = max_quarantine
+        self.clock = clock or time.monotonic
+        self._health: Dict[str, Dict] = {}
+
+    @classmethod
+    def from_config(cls, config: Dict, clock: Callable[[], float] = None) -> "ProcessHealthTracker":
+        return cls(
+            failure_threshold=config.get("circuit_failure_threshold", 3),
+            timeout_threshold=config.get("circuit_timeout_threshold", 2),
+            quarantine=config.get("circuit_quarantine", 5.0),
+            max_quarantine=config.get("circuit_max_quarantine", 300.0),
+            clock=clock
+        )
+
+    def reconfigure(self, config: Dict) -> None:
+        """Adopt new thresholds, keeping every process's current state"""
+        fresh = self.from_config(config, self.clock)
+        for name in ("failure_threshold", "timeout_threshold", "quarantine", "max_quarantine"):
+            setattr(self, name, getattr(fresh, name))
+
+    def _entry(self, process_name: str) -> Dict:
+        entry = self._health.get(process_name)
+        if entry is None:
+            entry = self._health[process_name] = {
+                "state": self.CLOSED, "failures": 0, "timeouts": 0,
+                "quarantine": 0.0, "retry_at": 0.0, "total_failures": 0, "total_timeouts": 0
+            }
+        return entry
+
+    def allow(self, process_name: str) -> bool:
+        """Whether the process may be probed now"""
+        entry = self._health.get(process_name)
+        if entry is None or entry["state"] == self.CLOSED:
+            return True
+        if entry["state"] == self.OPEN and self.clock() >= entry["retry_at"]:
+            entry["state"] = self.HALF_OPEN
+        return entry["state"] == self.HALF_OPEN
+
+    def record_success(self, process_name: str) -> None:
+        entry = self._health.get(process_name)
+        if entry is not None and (entry["state"] != self.CLOSED or entry["failures"]):
+            entry.update(state=self.CLOSED, failures=0, timeouts=0, quarantine=0.0)
+
+    def record_failure(self, process_name: str, timed_out: bool = False) -> None:
+        entry = self._entry(process_name)
+        entry["failures"] += 1
+        entry["total_failures"] += 1
+        if timed_out:
+            entry["timeouts"] += 1
+            entry["total_timeouts"] += 1
+
+        if entry["state"] == self.HALF_OPEN:
+            quarantine = min(entry["quarantine"] * 2, self.max_quarantine)
+        elif entry["failures"] >= self.failure_threshold or entry["timeouts"] >= self.timeout_threshold:
+            quarantine = self.quarantine
+        else:
+            return
+        entry.update(state=self.OPEN, quarantine=quarantine, retry_at=self.clock() + quarantine)
+
+    def state(self, process_name: str) -> str:
+        entry = self._health.get(process_name)
+        return entry["state"] if entry else self.CLOSED
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Copy of every process that has ever failed, for status reporting"""
+        now = self.clock()
+        report = {}
+        for name, entry in list(self._health.items()):
+            report[name] = dict(entry, retry_in=max(entry["retry_at"] - now, 0.0))
+        return report
+
+
+class FrequencyScheduler:
+    """Scan processes in proportion to how often they actually show dialogs
+
+    Every rule decision in a process counts as a hit; hits decay with a
+    half-life, so the count tracks recent behaviour. A process whose decayed
+    count reaches hot_hits is scanned every tick. Below that its scan
+    interval grows as base_interval * hot_hits / count, so one with a tenth
+    of the hot count is scanned a tenth as often. No process goes longer
+    than max_staleness without a scan, and one never scanned is due at once.
+    Until the first hit nothing is known, so every target is scanned. Counts
+    are kept in a JSON file so a restart does not have to learn them again.
+    Off unless enabled: a quiet process's dialog can wait up to max_staleness.
+    """
+
+    SAVE_INTERVAL = 60.0
+
+    def __init__(self, enabled: bool = False, hot_hits: float = 1.0, half_life: float = 86400.0,
+                 max_staleness: float = 5.0, base_interval: float = 0.5, path: str = None,
+                 clock: Callable[[], float] = None):
+        self.enabled = enabled
+        self.hot_hits = hot_hits
+        self.half_life = half_life
+        self.max_staleness = max_staleness
+        self.base_interval = base_interval
+        self.path = path
+        self.clock = clock or time.time
+        self.scans = 0
+        self.skipped = 0
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._scanned: Dict[str, float] = {}
+        self._dirty = False
+        self._next_save = 0.0
+
+    @classmethod
+    def from_config(cls, config: Dict, clock: Callable[[], float] = None) -> "FrequencyScheduler":
+        path = config.get("schedule_file", "~/.copilot_helper_schedule.json")
+        return cls(
+            enabled=config.get("frequency_schedule", False),
+            hot_hits=config.get("schedule_hot_hits", 1.0),
+            half_life=config.get("schedule_half_life", 86400.0),
+            max_staleness=config.get("schedule_max_staleness", 5.0),
+            base_interval=config.get("check_interval", 0.5),
+            path=os.path.expanduser(path) if path else None,
+            clock=clock
+        )
+
+    def reconfigure(self, config: Dict) -> None:
+        """Adopt new settings, keeping the learned counts"""
+        fresh = self.from_config(config, self.clock)
+        for name in ("enabled", "hot_hits", "half_life", "max_staleness", "base_interval"):
+            setattr(self, name, getattr(fresh, name))
+
+    def score(self, process_name: str, now: float = None) -> float:
+        """Decayed hit count of a process"""
+        entry = self._stats.get(process_name)
+        if entry is None:
+            return 0.0
+        now = self.clock() if now is None else now
+        return entry["hits"] * 0.5 ** (max(now - entry["updated"], 0.0) / self.half_life)
+
+    def interval(self, process_name: str, now: float = None) -> float:
+        """Longest a process may go between scans"""
+        score = self.score(process_name, now)
+        if score >= self.hot_hits:
+            return 0.0
+        if score <= 0.0:
+            return self.max_staleness
+        return min(self.max_staleness, self.base_interval * self.hot_hits / score)
+
+    def due(self, targets: List[str], horizon: float = 0.0) -> List[str]:
+        """Targets to scan this tick, which are then counted as scanned
+
+        horizon is the longest the next tick may be away; a target is
+        scanned now if waiting for that tick could overrun its interval.
+        """
+        if not self.enabled or not self._stats:
+            return targets
+        now = self.clock()
+        due = []
+        for name in targets:
+            scanned = self._scanned.get(name)
+            if scanned is None or now - scanned + horizon >= self.interval(name, now):
+                self._scanned[name] = now
+                due.append(name)
+        self.scans += len(due)
+        self.skipped += len(targets) - len(due)
+        return due
+
+    def record_hit(self, process_name: str) -> None:
+        """Count a dialog the rules acted on; the process turns hot at once"""
+        now = self.clock()
+        score = self.score(process_name, now)
+        self._stats[process_name] = {"hits": score + 1.0, "updated": now, "last_seen": now}
+        self._dirty = True
+
+    def load(self) -> None:
+        """Read counts saved by a previous run; a missing or unreadable file starts from scratch"""
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r") as f:
+                processes = json.load(f)["processes"]
+            self._stats = {str(name): {key: float(entry[key]) for key in ("hits", "updated", "last_seen")}
+                           for name, entry in processes.items()}
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logging.getLogger(__name__).warning("Ignoring unreadable scan schedule %s: %s", self.path, e)
+
+    def save(self) -> None:
+        """Write the counts, replacing the file atomically"""
+        self._next_save = self.clock() + self.SAVE_INTERVAL
+        if not self.path:
+            return
+        temporary = self.path + ".tmp"
+        try:
+            with open(temporary, "w") as f:
+                json.dump({"version": 1, "processes": self._stats}, f)
+            os.replace(temporary, self.path)
+            self._dirty = False
+        except OSError as e:
+            logging.getLogger(__name__).warning("Could not save the scan schedule to %s: %s", self.path, e)
+
+    def maybe_save(self, force: bool = False) -> None:
+        """Save changed counts at most once a minute, or at once when forced"""
+        if self._dirty and (force or self.clock() >= self._next_save):
+            self.save()
+
+    def snapshot(self) -> Dict:
+        """Learned counts and scan savings, for status reporting"""
+        now = self.clock()
+        processes = {}
+        for name, entry in sorted(self._stats.items()):
+            processes[name] = {"score": round(self.score(name, now), 3),
+                               "interval": round(self.interval(name, now), 2),
+                               "last_seen": entry["last_seen"]}
+        return {"scans": self.scans, "skipped": self.skipped, "max_staleness": self.max_staleness,
+                "hot": [name for name, entry in processes.items() if entry["interval"] == 0.0],
+                "processes": processes}
+
+
+class BudgetGovernor:
+    """Keep the helper's CPU use and subprocess spawns under configured budgets
+
+    CPU is the helper's own plus its reaped children's (os.times), and
+    spawns are counted as they happen (except the process table's own
+    listing, which runs every tick), both over a sliding window of
+    `window` seconds. The pressure is the larger of usage / limit for the
+    two budgets (a limit of 0, the default, disables that budget). It is
+    re-evaluated at most every window / 4 seconds: above 1 the governor
+    first stops probing low-priority processes (any target not in
+    `priority`), then stretches the tick interval, by up to max_stretch;
+    below 0.8 it relaxes in the opposite order.
+    """
+
+    OK = "ok"
+    SHEDDING = "shedding"
+    STRETCHING = "stretching"
+
+    def __init__(self, cpu_percent: float = 0.0, spawns_per_minute: float = 0.0,
+                 window: float = 20.0, max_stretch: float = 8.0, priority: List[str] = None,
+                 clock: Callable[[], float] = None, cpu_clock: Callable[[], float] = None):
+        self.cpu_percent = cpu_percent
+        self.spawns_per_minute = spawns_per_minute
+        self.window = window
+        self.max_stretch = max(max_stretch, 1.0)
+        self.priority = set(priority or [])
+        self.clock = clock or time.monotonic
+        self.cpu_clock = cpu_clock or self.process_cpu
+        self.pressure = 0.0
+        self.stretch = 1.0
+        self.shedding = False
+        self.dropped_probes = 0
+        self._samples: deque = deque()  # (time, CPU seconds)
+        self._spawns: deque = deque()
+        self._next_adjust = 0.0
+
+    @classmethod
+    def from_config(cls, config: Dict, clock: Callable[[], float] = None) -> "BudgetGovernor":
+        return cls(
+            cpu_percent=config.get("cpu_budget_percent", 0.0),
+            spawns_per_minute=config.get("spawn_budget_per_minute", 0.0),
+            window=config.get("budget_window", 20.0),
+            max_stretch=config.get("budget_max_stretch", 8.0),
+            priority=config.get("budget_priority_processes", ["Terminal", "iTerm2", "osascript", "SecurityAgent"]),
+            clock=clock
+        )
+
+    def reconfigure(self, config: Dict) -> None:
+        """Adopt new budgets, keeping the measurements and the current throttling"""
+        fresh = self.from_config(config, self.clock)
+        for name in ("cpu_percent", "spawns_per_minute", "window", "max_stretch", "priority"):
+            setattr(self, name, getattr(fresh, name))
+        self.stretch = min(self.stretch, self.max_stretch)
+
+    @staticmethod
+    def process_cpu() -> float:
+        """CPU seconds used by this process and its reaped children"""
+        times = os.times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    @property
+    def enabled(self) -> bool:
+        return self.cpu_percent > 0 or self.spawns_per_minute > 0
+
+    def counted(self, runner: Callable) -> Callable:
+        """Wrap a subprocess.run-style runner so that every call counts as a spawn"""
+        def run(*args, **kwargs):
+            self.record_spawn()
+            return runner(*args, **kwargs)
+        return run
+
+    def record_spawn(self) -> None:
+        self._spawns.append(self.clock())
+
+    def _prune(self, now: float) -> None:
+        horizon = now - self.window
+        while self._spawns and self._spawns[0] < horizon:
+            self._spawns.popleft()
+        # Keep one sample at or before the horizon as the baseline
+        while len(self._samples) > 1 and self._samples[1][0] <= horizon:
+            self._samples.popleft()
+
+    def cpu_usage(self) -> float:
+        """Percent of one core used over the window"""
+        if len(self._samples) < 2:
+            return 0.0
+        (start, start_cpu), (end, end_cpu) = self._samples[0], self._samples[-1]
+        return (end_cpu - start_cpu) / (end - start) * 100 if end > start else 0.0
+
+    def spawn_rate(self) -> float:
+        """Subprocesses per minute over the window (or since the first sample)"""
+        if not self._samples:
+            return 0.0
+        span = min(self.window, self.clock() - self._samples[0][0])
+        return len(self._spawns) * 60.0 / span if span > 0 else 0.0
+
+    def sample(self) -> None:
+        """Measure once per tick and adjust the throttling when it is due"""
+        if not self.enabled:
+            self.pressure, self.stretch, self.shedding = 0.0, 1.0, False
+            # counted() keeps recording spawns; without budgets nothing prunes them
+            self._samples.clear()
+            self._spawns.clear()
+            return
+        now = self.clock()
+        self._samples.append((now, self.cpu_clock()))
+        self._prune(now)
+        if now < self._next_adjust or now - self._samples[0][0] < self.window / 4:
+            return
+        self._next_adjust = now + self.window / 4
+        pressures = [0.0]
+        if self.cpu_percent > 0:
+            pressures.append(self.cpu_usage() / self.cpu_percent)
+        if self.spawns_per_minute > 0:
+            pressures.append(self.spawn_rate() / self.spawns_per_minute)
+        self.pressure = max(pressures)
+        if self.pressure > 1.0:
+            if not self.shedding:
+                self.shedding = True
+            else:
+                # Usage scales roughly with 1 / interval; the square root damps the step
+                self.stretch = min(self.stretch * self.pressure ** 0.5, self.max_stretch)
+        elif self.pressure < 0.8:
+            if self.stretch > 1.0:
+                self.stretch = max(self.stretch * max(self.pressure, 0.25) ** 0.5, 1.0)
+            else:
+                self.shedding = False
+
+    def admit(self, targets: List[str]) -> List[str]:
+        """Targets to probe this tick: without the low-priority ones while shedding"""
+        if not self.shedding:
+            return targets
+        admitted = [name for name in targets if name in self.priority]
+        self.dropped_probes += len(targets) - len(admitted)
+        return admitted
+
+    def stretch_interval(self, interval: float) -> float:
+        return interval * self.stretch
+
+    @property
+    def state(self) -> str:
+        if self.stretch > 1.0:
+            return self.STRETCHING
+        return self.SHEDDING if self.shedding else self.OK
+
+    def snapshot(self) -> Dict:
+        """Budget state for `status`"""
+        return {
+            "state": self.state,
+            "cpu_percent": round(self.cpu_usage(), 2), "cpu_limit": self.cpu_percent,
+            "spawns_per_minute": round(self.spawn_rate(), 1), "spawn_limit": self.spawns_per_minute,
+            "pressure": round(self.pressure, 2), "stretch": round(self.stretch, 2),
+            "dropped_probes": self.dropped_probes
+        }
+
+
+class AsyncMonitorEngine:
+    """Probe processes concurrently with asyncio under a per-tick deadline
+
+    Each live target gets its own backend probe (one snapshot subprocess with
+    the AppleScript backend), at most `concurrency` at a time. Probes still
+    running when the tick's deadline expires are cancelled and their
+    subprocesses killed, so one hung System Events query only costs that
+    process its result for the tick. Results are merged and clicks are issued
+    the same way as in the threaded engine.
+    """
+
+    def __init__(self, helper: "CopilotHelper", concurrency: int = 4, tick_deadline: float = 2.0):
+        self.helper = helper
+        self.concurrency = max(1, concurrency)
+        self.tick_deadline = tick_deadline
+        self.ticks = 0
+        self.cancelled_probes = 0
+
+    async def probe(self, process_name: str, semaphore: "asyncio.Semaphore",
+                    timeout: float) -> Optional[List[DialogWindow]]:
+        """Snapshot one process's windows, or None if the query failed"""
+        try:
+            async with semaphore:
+                windows = await self.helper.backend.snapshot_async([process_name], timeout)
+        except asyncio.CancelledError:
+            # Straggler at the tick deadline: as costly as a timeout
+            self.helper.health.record_failure(process_name, timed_out=True)
+            raise
+        except ScanError as e:
+            self.helper.health.record_failure(process_name, timed_out=e.timed_out)
+            self.helper.logger.debug("Async probe of %s failed: %s", process_name, e)
+            return None
+        if process_name in scan_errors(windows):
+            self.helper.record_scan_failure(process_name, ScanError(scan_errors(windows)[process_name]))
+            return None
+        self.helper.health.record_success(process_name)
+        return windows
+
+    async def run_tick(self, snapshot: "ConfigSnapshot" = None) -> int:
+        """Probe all live targets concurrently and click matches found before the deadline"""
+        self.ticks += 1
+        helper = self.helper
+        rules = (snapshot or helper.snapshot).rules
+        targets = helper.tick_targets()
+        if not targets or rules.empty or not helper.backend.available():
+            return 0
+
+        deadline = time.monotonic() + self.tick_deadline
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.ensure_future(self.probe(name, semaphore, self.tick_deadline))
+                 for name in targets]
+        done, pending = await asyncio.wait(tasks, timeout=self.tick_deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.cancelled_probes += len(pending)
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        clicks = 0
+        seen: List[DialogWindow] = []
+        decisions = []
+        for name, task in zip(targets, tasks):
+            if task not in done or task.exception() is not None:
+                continue
+            windows = task.result()
+            if windows is None:
+                continue
+            seen.extend(windows)
+            helper.decisions.forget_dismissed([name], windows)
+            for window in windows:
+                if helper.decisions.get(window) is not None:
+                    continue
+                button_name = rules.choose(window)
+                if not button_name:
+                    helper.decisions.record(window, DecisionCache.IGNORE)
+                    continue
+                remaining = max(deadline - time.monotonic(), 0.5)
+                try:
+                    clicked = await helper.backend.click_async(window, button_name, remaining)
+                except ScanError:
+                    clicked = False
+                decisions.append((window, button_name, clicked))
+                helper.frequency.record_hit(window.process)
+                if helper.audit is not None:
+                    helper.audit_decision(window, button_name, clicked)
+                if clicked:
+                    helper.logger.info("Successfully clicked '%s' in %s", button_name, window.process)
+                    helper.scheduler.record_click(window.process)
+                    helper.decisions.record(window, DecisionCache.CLICKED)
+                    helper.metrics.count("clicks_total", window.process)
+                    clicks += 1
+                    break
+        if helper.recorder is not None:
+            helper.record_trace(targets, seen, decisions)
+        return clicks
+
+    async def run(self) -> None:
+        """Tick until the helper stops"""
+        helper = self.helper
+        while helper.is_running:
+            try:
+                started = time.perf_counter()
+                clicks = await self.run_tick(helper.poll_config())
+                helper.tick_count += 1
+                helper.click_count += clicks
+                helper.scheduler.record_tick(clicks > 0)
+                helper.record_tick_metrics(started)
+                helper.frequency.maybe_save()
+                helper.governor.sample()
+                await asyncio.sleep(helper.governor.stretch_interval(helper.scheduler.next_interval()))
+            except Exception as e:
+                helper.logger.error("Error in async monitoring loop: %s", e)
+                await asyncio.sleep(1)
+
+
+class ConfigWatcher:
+    """Notice edits to the config file with at most one stat() per check interval
+
+    A change is any difference in mtime, size or inode, so editors that save
+    by writing a new file and renaming it over the old one are caught too.
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0, clock: Callable[[], float] = None):
+        self.path = path
+        self.check_interval = check_interval
+        self.clock = clock or time.monotonic
+        self.checks = 0
+        self._signature = self._stat()
+        self._next_check = float("-inf")
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def changed(self) -> bool:
+        """Whether the file changed since the last check or mark()"""
+        now = self.clock()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        self.checks += 1
+        signature = self._stat()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        return True
+
+    def mark(self) -> None:
+        """Accept the file's current state, e.g. after writing it ourselves"""
+        self._signature = self._stat()
+
+
+class ConfigSnapshot(NamedTuple):
+    """One generation of the configuration, compiled once for the monitor loop
+
+    The loop adopts a new snapshot only between ticks, so a tick never sees
+    half-applied settings, and derived values such as the candidate button
+    list are computed once per change instead of once per tick.
+    """
+    generation: int
+    config: Mapping
+    buttons: Tuple[str, ...]
+    rules: RuleEngine
+
+
+class ControlError(Exception):
+    """The daemon received a control request but could not carry it out"""
+
+
+class ControlServer:
+    """Serve the daemon's control API on a Unix-domain socket
+
+    Each connection sends one JSON request line, {"command": name, ...}, and
+    gets one JSON response line back: {"ok": true, "result": ...} or
+    {"ok": false, "error": message}. The socket is created owner-only. A stale
+    socket left behind by a crashed daemon is replaced; a live one, or a path
+    that is not a socket at all, is not.
+    """
+
+    def __init__(self, path: str, handlers: Dict[str, Callable[[Dict], object]],
+                 logger: logging.Logger = None):
+        self.path = path
+        self.handlers = handlers
+        self.logger = logger or logging.getLogger(__name__)
+        self.requests = 0
+        self._server = None
+
+    def start(self) -> None:
+        """Bind the socket and serve requests on a background thread"""
+        try:
+            mode = os.lstat(self.path).st_mode
+        except FileNotFoundError:
+            mode = None
+        if mode is not None:
+            if not stat.S_ISSOCK(mode):
+                raise ControlError(f"{self.path} exists and is not a socket, refusing to replace it")
+            if ControlClient(self.path, timeout=0.5).ping():
+                raise ControlError(f"Another helper is already listening on {self.path}")
+            os.unlink(self.path)
+
+        control = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            timeout = 5.0
+
+            def handle(self):
+                response = control.dispatch(self.rfile.readline(65536))
+                self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+        # Bound inside an owner-only directory and moved into place once it is owner-only itself, so no
+        # other user can connect in between (the process umask is shared with the logging and audit threads)
+        private_dir = tempfile.mkdtemp(prefix=".copilot_helper-", dir=os.path.dirname(os.path.abspath(self.path)))
+        private_path = os.path.join(private_dir, "sock")
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(private_path, Handler)
+            try:
+                os.chmod(private_path, 0o600)
+                os.rename(private_path, self.path)
+            except OSError:
+                self._server.server_close()
+                self._server = None
+                raise
+        finally:
+            try:
+                os.unlink(private_path)
+            except OSError:
+                pass
+            os.rmdir(private_dir)
+        # stop() waits for handlers still writing their replies
+        self._server.daemon_threads = False
+        self._server.block_on_close = True
+        threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.2},
+                         daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop serving, wait for requests in flight and remove the socket"""
+        server, self._server = self._server, None
+        if server is None:
+            return
+        server.shutdown()
+        server.server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def dispatch(self, line: bytes) -> Dict:
+        """Run one request line against the handlers"""
+        self.requests += 1
+        try:
+            request = json.loads(line or b"{}")
+            handler = self.handlers.get(request.get("command"))
+            if handler is None:
+                return {"ok": False, "error": f"Unknown command. Valid commands: {', '.join(self.handlers)}"}
+            return {"ok": True, "result": handler(request)}
+        except Exception as e:
+            self.logger.error("Control request failed: %s", e)
+            return {"ok": False, "error": str(e)}
+
+
+class ControlClient:
+    """Send commands to a running daemon's control socket"""
+
+    def __init__(self, path: str, timeout: float = 2.0):
+        self.path = path
+        self.timeout = timeout
+
+    def request(self, command: str, **params):
+        """Send one command and return its result
+
+        Raises OSError when no daemon is listening and ControlError when the
+        daemon rejects the request.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            sock.sendall((json.dumps(dict(params, command=command)) + "\n").encode("utf-8"))
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        try:
+            response = json.loads(data)
+        except ValueError:
+            raise ControlError("Malformed response from the daemon")
+        if not response.get("ok"):
+            raise ControlError(response.get("error", "Unknown error"))
+        return response.get("result")
+
+    def ping(self) -> bool:
+        """Whether a daemon answers on the socket"""
+        try:
+            self.request("status")
+            return True
+        except (OSError, ControlError):
+            return False
+
+
+class SessionSupervisor:
+    """Keep one monitoring worker process per GUI session
+
+    Each poll() compares the source's sessions with the running workers:
+    new sessions get a worker, ended sessions have theirs stopped, and a
+    worker that died is restarted after a delay that doubles on every crash
+    (reset once a worker stays up for max_restart_delay). Workers are
+    separate processes with their own scheduler, health tracker and script
+    host, so a hung or crashed session cannot stall the others; each sends a
+    heartbeat with its counters every `heartbeat` seconds. They are created
+    by `context`, a "spawn" multiprocessing context unless one is given.
+    """
+
+    def __init__(self, config_file: str, source: SessionSource, engine: str = None,
+                 heartbeat: float = 1.0, restart_delay: float = 1.0, max_restart_delay: float = 60.0,
+                 stop_timeout: float = 5.0, logger: logging.Logger = None, clock: Callable[[], float] = None,
+                 context=None):
+        self.config_file = config_file
+        self.source = source
+        self.engine = engine
+        self.heartbeat = heartbeat
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stop_timeout = stop_timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self.clock = clock or time.monotonic
+        # Spawned, not forked: the daemon has threads (control socket, log queue) a fork would not carry over
+        self.context = context or multiprocessing.get_context("spawn")
+        self.reports = self.context.Queue()
+        self.workers: Dict[str, Dict] = {}
+        self.started = 0
+        self.restarts = 0
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+
+    def poll(self) -> None:
+        """Start, stop and restart workers to match the current sessions"""
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            self.drain()
+            try:
+                sessions = {session.uid: session for session in self.source.sessions()
+                            if self.enabled_for(session)}
+            except Exception as e:
+                self.logger.warning("Session discovery failed, keeping the current workers: %s", e)
+                return
+            now = self.clock()
+            for uid in [uid for uid in self.workers if uid not in sessions]:
+                self.logger.info("Session of %s ended or disabled, stopping its worker",
+                                 self.workers[uid]["session"].user)
+                self._stop_worker(self.workers.pop(uid))
+            for uid, session in sessions.items():
+                entry = self.workers.get(uid)
+                if entry is None:
+                    entry = self.workers[uid] = {"session": session, "process": None, "restarts": 0,
+                                                 "delay": self.restart_delay, "restart_at": now, "report": None}
+                    self.logger.info("Session of %s (uid %s) found, starting a worker", session.user, uid)
+                process = entry["process"]
+                if process is not None and process.is_alive():
+                    if now - entry["started_at"] >= self.max_restart_delay:
+                        entry["delay"] = self.restart_delay
+                    continue
+                if process is not None:
+                    self.logger.warning("Worker for %s exited with code %s, restarting in %.0fs",
+                                        session.user, process.exitcode, entry["delay"])
+                    entry["process"] = None
+                    entry["restart_at"] = now + entry["delay"]
+                    entry["delay"] = min(entry["delay"] * 2, self.max_restart_delay)
+                    entry["restarts"] += 1
+                    self.restarts += 1
+                if now >= entry["restart_at"]:
+                    self._start_worker(entry, now)
+
+    def enabled_for(self, session: GUISession) -> bool:
+        """Whether the session's configuration (its overrides included) enables monitoring"""
+        try:
+            config = read_config_cached(self.config_file)
+        except (OSError, ValueError):
+            return True  # An unreadable edit does not end monitoring
+        return session_config(dict(CopilotHelper.default_config(), **config), session.user)["enabled"]
+
+    def _start_worker(self, entry: Dict, now: float) -> None:
+        session = entry["session"]
+        process = self.context.Process(
+            target=run_session_worker, name=f"copilot-helper-{session.user}",
+            args=(self.config_file, session, self.engine, self.reports, self.heartbeat), daemon=True
+        )
+        process.start()
+        entry["process"] = process
+        entry["started_at"] = now
+        self.started += 1
+
+    def _stop_worker(self, entry: Dict) -> None:
+        process = entry["process"]
+        if process is None:
+            return
+        process.terminate()  # The worker stops its monitor on SIGTERM
+        process.join(self.stop_timeout)
+        if process.is_alive():
+            process.kill()
+            process.join(self.stop_timeout)
+
+    def drain(self) -> None:
+        """Take in the heartbeats workers have sent since the last call"""
+        with self._lock:
+            while True:
+                try:
+                    report = self.reports.get_nowait()
+                except queue.Empty:
+                    return
+                entry = self.workers.get(report["uid"])
+                if entry is not None and entry["process"] is not None and entry["process"].pid == report["pid"]:
+                    entry["report"] = dict(report, received_at=self.clock())
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep until the next poll is due; True once stopped"""
+        return self._stopped.wait(timeout)
+
+    def stop(self) -> None:
+        """Stop every worker"""
+        with self._lock:
+            self._stopped.set()
+            for entry in self.workers.values():
+                self._stop_worker(entry)
+            self.workers.clear()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Per-UID worker state, JSON-serialisable"""
+        with self._lock:
+            self.drain()
+            now = self.clock()
+            sessions = {}
+            for uid, entry in sorted(self.workers.items(), key=lambda item: int(item[0])):
+                process = entry["process"]
+                report = entry["report"] or {}
+                sessions[uid] = {
+                    "user": entry["session"].user,
+                    "pid": process.pid if process is not None else None,
+                    "alive": process is not None and process.is_alive(),
+                    "restarts": entry["restarts"],
+                    "ticks": report.get("ticks", 0),
+                    "clicks": report.get("clicks", 0),
+                    "overrides": report.get("overrides", []),
+                    "heartbeat_age": round(now - report["received_at"], 1) if report else None
+                }
+            return sessions
+
+
+def run_session_worker(config_file: str, session: GUISession, engine: Optional[str],
+                       reports, heartbeat: float = 1.0) -> None:
+    """Worker process body: monitor one GUI session until terminated"""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    worker = CopilotHelper(config_file, session=session)
+    if not worker.start(engine):
+        sys.exit(1)
+    try:
+        while worker.is_running:
+            reports.put(worker.session_report())
+            time.sleep(heartbeat)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        if worker.is_running:
+            worker.stop()
+
+
+class RepeatFilter(logging.Filter):
+    """Drop identical log messages repeated within `window` seconds
+
+    The first occurrence is logged and repeats inside the window are only
+    counted; the next occurrence logged after the window carries the count.
+    At most max_keys distinct messages are tracked.
+    """
+
+    def __init__(self, window: float = 10.0, max_keys: int = 512, clock: Callable[[], float] = None):
+        super().__init__()
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock or time.monotonic
+        self.suppressed = 0
+        self._seen: Dict[Tuple[int, str], List] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.window <= 0:
+            return True
+        message = record.getMessage()
+        key = (record.levelno, message)
+        now = self.clock()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                self.suppressed += 1
+                return False
+            repeats = entry[1] if entry is not None else 0
+            if entry is None and len(self._seen) >= self.max_keys:
+                self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.window}
+                if len(self._seen) >= self.max_keys:
+                    self._seen.clear()
+            self._seen[key] = [now, 0]
+        if repeats:
+            record.msg, record.args = "%s (repeated %d more times)", (message, repeats)
+        return True
+
+
+class LogPipeline:
+    """Write log records from a background thread
+
+    Logging calls only format the record and put it on a queue; a
+    QueueListener thread hands it to the real handlers, so a slow disk never
+    stalls the monitor loop. Identical messages are dropped by a RepeatFilter
+    before they are queued.
+    """
+
+    FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+    def __init__(self, handlers: List[logging.Handler], repeat_window: float = 10.0):
+        import logging.handlers  # Only processes that log to a file need it
+
+        self.handlers = handlers
+        self.queue: "queue.Queue[logging.LogRecord]" = queue.Queue()
+        self.repeats = RepeatFilter(repeat_window)
+        self.handler = logging.handlers.QueueHandler(self.queue)
+        self.handler.addFilter(self.repeats)
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self._logger: Optional[logging.Logger] = None
+
+    @classmethod
+    def from_config(cls, log_file: str, config: Dict, console: bool = None) -> "LogPipeline":
+        """Rotating file handler (by size, or by time with log_rotate_when), plus stderr on a terminal"""
+        import logging.handlers
+
+        backups = config.get("log_backup_count", 3)
+        if config.get("log_rotate_when"):
+            file_handler = logging.handlers.TimedRotatingFileHandler(
+                log_file, when=config["log_rotate_when"], backupCount=backups
+            )
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=config.get("log_max_bytes", 5 * 1024 * 1024), backupCount=backups
+            )
+        handlers = [file_handler]
+        # Under launchd stderr is a file that would never be rotated
+        if console if console is not None else sys.stderr.isatty():
+            handlers.append(logging.StreamHandler())
+        formatter = logging.Formatter(cls.FORMAT)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        return cls(handlers, config.get("log_repeat_window", 10.0))
+
+    def start(self, logger: logging.Logger) -> None:
+        """Route a logger's records through the queue"""
+        self.listener = logging.handlers.QueueListener(self.queue, *self.handlers)
+        self.listener.start()
+        logger.addHandler(self.handler)
+        self._logger = logger
+
+    def stop(self) -> None:
+        """Write out everything still queued and close the handlers"""
+        if self.listener is None:
+            return
+        self._logger.removeHandler(self.handler)
+        self.listener.stop()
+        self.listener = None
+        for handler in self.handlers:
+            handler.close()
+
+    def reconfigure(self, config: Dict) -> None:
+        self.repeats.window = config.get("log_repeat_window", 10.0)
+
+
+# One pipeline per process, shared by every CopilotHelper
+_log_pipeline: Optional[LogPipeline] = None
+
+# Parsed config files by path, with the (mtime, size, inode) they were parsed at
+_config_cache: Dict[str, Tuple[Tuple[int, int, int], Dict]] = {}
 
 
 class CopilotHelper:
-    def __init__(self, config_file: str = None):
+    def __init__(self, config_file: str = None, session_resolver: SessionResolver = None,
+                 command_runner: Callable = None,
+                 script_host_factory: Callable[[str], ScriptHostWorker] = None,
+                 script_cache: CompiledScriptCache = None, backend: UIBackend = None,
+                 session: GUISession = None, session_source: SessionSource = None,
+                 clock: Callable[[], float] = None):
         self.config_file = config_file or os.path.expanduser("~/.copilot_helper_config.json")
+        # Set in session workers: the one GUI session monitored, whose config overrides apply
+        self.session = session
         self.is_running = False
         self.monitoring_thread = None
         self.config = self.load_config()
-        self.setup_logging()
+        # File logging is set up by start(); until then records only reach stderr (warnings and up)
+        self.log_pipeline: Optional[LogPipeline] = _log_pipeline
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(getattr(logging, self.config.get("log_level", "INFO"), logging.INFO))
+        
+        # Every external command goes through this runner so it can be stubbed (and its spawns budgeted)
+        self.governor = BudgetGovernor.from_config(self.config, clock=clock)
+        self.command_runner = self.governor.counted(command_runner or subprocess.run)
+        if session_resolver is None and session is not None:
+            session_resolver = PinnedSessionResolver(session)
+        self.session_resolver = session_resolver or SessionResolver(
+            ttl=self.config.get("session_ttl", 30.0),
+            command_runner=self.command_runner
+        )
+        self.session_source = session_source
+        self.supervisor: Optional[SessionSupervisor] = None
+        self.script_host_factory = script_host_factory or self._default_script_host
+        self.script_host: Optional[ScriptHostWorker] = None
+        self._script_host_uid = None
+        self.script_cache = script_cache or CompiledScriptCache(
+            os.path.expanduser(self.config.get("script_cache_dir", "~/.copilot_helper_cache"))
+        )
+        # The prefilter's `ps` (macOS without psutil) runs every tick, burst ticks included, and would use up
+        # the spawn budget by itself; it replaces probes rather than adding to them, so it is not counted
+        self.process_table = ProcessTable(command_runner or subprocess.run)
+        self.backend = backend or self.default_backend()
+        # A simulated clock (tests, benchmarks) drives every schedule, quarantine and cache expiry at once
+        self.scheduler = PollingScheduler.from_config(self.config, clock=clock)
+        self.health = ProcessHealthTracker.from_config(self.config, clock=clock)
+        self.frequency = FrequencyScheduler.from_config(self.config, clock=clock)
+        self.async_engine: Optional[AsyncMonitorEngine] = None
+        self.control_server: Optional[ControlServer] = None
+        self.started_at: Optional[float] = None
+        self.tick_count = 0
+        self.click_count = 0
+        self.decisions = DecisionCache.from_config(self.config, clock=clock)
+        self.metrics = Metrics(self.config.get("metrics", False))
+        self._next_metrics_export = 0.0
+        self._sightings: Dict[Tuple[str, int, str], float] = {}
+        self._last_scan_at: Optional[float] = None
+        self.recorder: Optional[TraceRecorder] = None
+        self.audit: Optional[AuditStore] = None
+        self.scanner = IncrementalScanner(
+            self.list_window_titles,
+            lambda windows: self.snapshot_windows(windows=windows),
+            max_age=self.config.get("scan_refresh_interval", 30.0),
+            clock=clock,
+            settled=self.decisions.is_ignored
+        )
         
         # Default positive action buttons (will be auto-clicked)
         self.positive_buttons = [
@@ -50,9 +3538,31 @@ class CopilotHelper:
             "Cancel", "No", "Deny", "Refuse", "Decline", "Skip", "Dismiss"
         ]
         
-    def load_config(self) -> Dict:
-        """Load configuration from file or create default config"""
-        default_config = {
+        # Common processes that show approval dialogs
+        self.common_processes = [
+            "Terminal", "iTerm2", "osascript", "System Preferences", 
+            "System Settings", "SecurityAgent", "UserNotificationCenter",
+            "CoreServicesUIAgent", "loginwindow"
+        ]
+        
+        # Live reload: edits are compiled into a snapshot the loop adopts between ticks
+        self.config_watcher = ConfigWatcher(self.config_file, self.config.get("config_watch_interval", 1.0),
+                                            clock=clock)
+        self.snapshot = self.compile_config(self.config, generation=1)
+        self._pending_snapshot: Optional[ConfigSnapshot] = None
+        self._snapshot_lock = threading.Lock()
+        self.config_reloads = 0
+        
+    def default_backend(self) -> UIBackend:
+        """UI backend named by the ui_backend setting"""
+        if self.config.get("ui_backend", "applescript") == "simulated":
+            return SimulatedDesktop()
+        return AppleScriptBackend(self)
+    
+    @staticmethod
+    def default_config() -> Dict:
+        """Configuration used for keys missing from the config file"""
+        return {
             "enabled": False,
             "auto_approve": True,
             "auto_deny": False,
@@ -62,25 +3572,105 @@ class CopilotHelper:
             "custom_negative_buttons": [],
             "focus_prevention": True,
             "process_whitelist": [],  # Empty means all processes
-            "process_blacklist": ["Script Editor", "Xcode"]  # Don't auto-click in these
+            "process_blacklist": ["Script Editor", "Xcode"],  # Don't auto-click in these
+            "session_ttl": 30.0,  # Seconds to cache the console user/UID
+            "batch_scope": "tick",  # One click script per "tick" or per "process"
+            "script_host": "worker",  # Persistent "worker" or "spawn" per script
+            "compiled_scripts": True,  # Run script templates from the osacompile cache
+            "script_cache_dir": "~/.copilot_helper_cache",  # Where compiled templates are kept
+            "scan_mode": "snapshot",  # One window "snapshot" per tick, or "batched" click scripts
+            "incremental_scan": True,  # Only enumerate buttons of new or changed windows
+            "scan_refresh_interval": 30.0,  # Seconds before an unchanged window is rescanned
+            "process_prefilter": True,  # Skip targets that are not in the process table
+            "max_interval": 2.0,  # Ceiling for the idle backoff (seconds)
+            "idle_backoff": 1.5,  # Interval multiplier per idle tick
+            "burst_interval": 0.1,  # Interval right after a detection (seconds)
+            "burst_window": 5.0,  # How long burst mode lasts after a detection (seconds)
+            "click_cooldown": 0.5,  # Skip a process this long after clicking in it (seconds)
+            "engine": "thread",  # "thread" (serial) or "async" (concurrent probes)
+            "probe_concurrency": 4,  # Async engine: probes in flight at once
+            "tick_deadline": 2.0,  # Async engine: seconds before unfinished probes are cancelled
+            "circuit_failure_threshold": 3,  # Consecutive failures before a process is quarantined
+            "circuit_timeout_threshold": 2,  # Consecutive timeouts before a process is quarantined
+            "circuit_quarantine": 5.0,  # First quarantine (seconds), doubled on each failed retry
+            "circuit_max_quarantine": 300.0,  # Longest quarantine (seconds)
+            "control_socket": "~/.copilot_helper.sock",  # Unix socket served by the daemon
+            "config_watch_interval": 1.0,  # Seconds between checks of the config file for edits
+            "button_match": "normalized",  # "normalized" (ignore case and spacing) or "exact"
+            "process_rules": {},  # Per-process {"allow": bool, "buttons": [...]} overrides
+            "decision_cache_size": 1024,  # Window decisions remembered (least recently used go first)
+            "decision_cache_ttl": 300.0,  # Seconds a window with nothing to click is skipped
+            "click_dedup_ttl": 2.0,  # Seconds a clicked window is not clicked again if it lingers
+            "log_dir": "~/.copilot_helper_logs",  # Read when logging starts; session workers log here too
+            "log_max_bytes": 5 * 1024 * 1024,  # Rotate the log file at this size
+            "log_backup_count": 3,  # Rotated log files kept
+            "log_rotate_when": "",  # Rotate by time instead ("midnight", "H", ...); empty rotates by size
+            "log_repeat_window": 10.0,  # Seconds identical log messages are suppressed after the first
+            "metrics": False,  # Collect counters and latency histograms
+            "metrics_file": "~/.copilot_helper_metrics.prom",  # Prometheus text file written while running
+            "metrics_interval": 10.0,  # Seconds between rewrites of the metrics file
+            "ui_backend": "applescript",  # "applescript" (System Events) or an empty "simulated" desktop
+            "record_file": "",  # Trace every tick's windows and decisions here (.gz/.zst compress); empty is off
+            "cpu_budget_percent": 0.0,  # CPU ceiling (percent of one core, children included); 0 disables it
+            "spawn_budget_per_minute": 0.0,  # Subprocess ceiling; 0 disables it
+            "budget_window": 20.0,  # Seconds of history the budgets are measured over
+            "budget_max_stretch": 8.0,  # Most the tick interval is stretched to stay within budget
+            # Still probed when over budget; other targets are skipped first
+            "budget_priority_processes": ["Terminal", "iTerm2", "osascript", "SecurityAgent"],
+            "multi_session": False,  # Monitor every logged-in GUI user, one worker process each
+            "session_poll_interval": 5.0,  # Seconds between checks for sessions coming and going
+            "session_overrides": {},  # Per-user settings merged over the rest, e.g. {"alice": {"auto_deny": true}}
+            "audit": True,  # Keep every click decision in a SQLite database for the `audit` command
+            "audit_file": "~/.copilot_helper_audit.db",  # Shared by all session workers
+            "audit_retention_days": 90.0,  # Decisions older than this are deleted; 0 keeps them forever
+            "audit_flush_interval": 1.0,  # Seconds decisions may wait in memory before they are committed
+            "frequency_schedule": False,  # Scan processes that rarely show dialogs less often
+            "schedule_max_staleness": 5.0,  # Longest any running target goes unscanned
+            "schedule_hot_hits": 1.0,  # Decayed dialog count at which a process is scanned every tick
+            "schedule_half_life": 86400.0,  # Seconds for a process's dialog count to halve
+            "schedule_file": "~/.copilot_helper_schedule.json"  # Learned counts, kept across restarts
         }
+    
+    @staticmethod
+    def isolated_config(workdir: str) -> Dict:
+        """Settings that keep every file the helper writes inside workdir instead of $HOME
+        
+        For tests, benchmarks and load generators: their simulated decisions
+        and dialog counts must not reach the user's audit database or the scan
+        schedule of the real daemon.
+        """
+        return {
+            "script_cache_dir": os.path.join(workdir, "scripts"),
+            "control_socket": os.path.join(workdir, "control.sock"),
+            "log_dir": os.path.join(workdir, "logs"),
+            "metrics_file": os.path.join(workdir, "metrics.prom"),
+            "audit_file": os.path.join(workdir, "audit.db"),
+            "schedule_file": os.path.join(workdir, "schedule.json")
+        }
+    
+    def load_config(self) -> Dict:
+        """Load configuration from file or create default config"""
+        default_config = self.default_config()
         
         if os.path.exists(self.config_file):
             try:
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
-                    # Merge with defaults to ensure all keys exist
-                    for key, value in default_config.items():
-                        if key not in config:
-                            config[key] = value
-                    return config
-            except (json.JSONDecodeError, IOError) as e:
+                return self.read_config_file()
+            except (ValueError, IOError) as e:
                 print(f"Error loading config: {e}. Using defaults.")
                 return default_config
         else:
             self.save_config(default_config)
             return default_config
     
+    def read_config_file(self) -> Dict:
+        """Read the config file merged over the defaults, raising if it is unreadable"""
+        config = read_config_cached(self.config_file)
+        # Merge with defaults to ensure all keys exist
+        config = dict(self.default_config(), **config)
+        if self.session is not None:
+            config = session_config(config, self.session.user)
+        return config
+    
     def save_config(self, config: Dict = None) -> None:
         """Save configuration to file"""
         config = config or self.config
@@ -91,211 +3681,595 @@ class CopilotHelper:
             print(f"Error saving config: {e}")
     
     def setup_logging(self) -> None:
-        """Setup logging configuration"""
-        log_dir = os.path.expanduser("~/.copilot_helper_logs")
-        os.makedirs(log_dir, exist_ok=True)
-        
-        log_file = os.path.join(log_dir, "copilot_helper.log")
-        
-        logging.basicConfig(
-            level=getattr(logging, self.config.get("log_level", "INFO")),
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file),
-                logging.StreamHandler()
-            ]
-        )
+        """Setup logging configuration (a queue-fed, rotating log shared by the process)"""
+        global _log_pipeline
+        if _log_pipeline is None:
+            log_dir = os.path.expanduser(self.config.get("log_dir", "~/.copilot_helper_logs"))
+            os.makedirs(log_dir, exist_ok=True)
+            
+            log_name = "copilot_helper.log" if self.session is None else f"copilot_helper-{self.session.user}.log"
+            log_file = os.path.join(log_dir, log_name)
+            _log_pipeline = LogPipeline.from_config(log_file, self.config)
+            _log_pipeline.start(logging.getLogger())
+            atexit.register(_log_pipeline.stop)
+        else:
+            _log_pipeline.reconfigure(self.config)
+        
+        self.log_pipeline = _log_pipeline
         self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(getattr(logging, self.config.get("log_level", "INFO"), logging.INFO))
     
     def get_current_user(self) -> str:
         """Get the currently logged in user"""
         try:
-            result = subprocess.run([
-                "python3", "-c", 
-                "from SystemConfiguration import SCDynamicStoreCopyConsoleUser; "
-                "import sys; "
-                "username = (SCDynamicStoreCopyConsoleUser(None, None, None) or [None])[0]; "
-                "username = [username,''][username in ['loginwindow', None, '']]; "
-                "sys.stdout.write(username + '\\n');"
-            ], capture_output=True, text=True)
-            return result.stdout.strip()
+            return self.session_resolver.resolve()[0]
         except Exception as e:
-            self.logger.error(f"Failed to get current user: {e}")
+            self.logger.error("Failed to get current user: %s", e)
             return ""
     
-    def run_applescript_as_user(self, script: str, user: str = None) -> Tuple[bool, str]:
-        """Run AppleScript as the current user"""
-        if not user:
-            user = self.get_current_user()
+    def run_applescript_as_user(self, script: str, user: str = None,
+                                language: str = "AppleScript") -> Tuple[bool, str]:
+        """Run AppleScript (or JXA with language="JavaScript") as the current user"""
+        return self._run_as_user(script, language, user=user)
+    
+    def run_template_as_user(self, name: str, args: List[str] = ()) -> Tuple[bool, str]:
+        """Run a script template with arguments, from the compiled cache when possible"""
+        template = SCRIPT_TEMPLATES[name]
+        return self._run_as_user(template.source, template.language, args=[str(arg) for arg in args],
+                                 compiled=self.compiled_script(template), name=name)
+    
+    def compiled_script(self, template: ScriptTemplate) -> Optional[str]:
+        """Path of the template's compiled file, or None to run it from source"""
+        if not self.config.get("compiled_scripts", True):
+            return None
+        return self.script_cache.lookup(template)
+    
+    def _run_as_user(self, script: str, language: str, user: str = None,
+                     args: List[str] = None, compiled: str = None, name: str = "inline") -> Tuple[bool, str]:
+        """Run a script (or compiled file) in the user's GUI session; `name` labels its metrics"""
+        try:
+            if user:
+                uid = self.session_resolver.lookup_uid(user)
+            else:
+                user, uid = self.session_resolver.resolve()
+        except Exception as e:
+            return False, f"Error resolving user session: {e}"
         
         if not user:
             return False, "No user logged in"
         
+        if not uid:
+            return False, f"Failed to get UID for user {user}"
+        
+        if self.config.get("script_host", "worker") == "worker":
+            started = time.perf_counter()
+            success, output = self._run_in_script_host(script, uid, language, args, compiled)
+            if success or not output.startswith("Script host"):
+                self.record_script_run(name, "host", started, output)
+                return success, output
+            self.logger.debug("Script host unavailable, spawning osascript: %s", output)
+        
+        started = time.perf_counter()
         try:
             # Use launchctl to run as user to avoid permission issues
-            uid = subprocess.run(["id", "-u", user], capture_output=True, text=True)
-            if uid.returncode != 0:
-                return False, f"Failed to get UID for user {user}"
-            
-            uid = uid.stdout.strip()
+            cmd = self.build_osascript_command(uid, script, language, args, compiled)
             
-            cmd = [
-                "launchctl", "asuser", uid, "/usr/bin/osascript", "-e", script
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            return result.returncode == 0, result.stdout.strip() if result.stdout else result.stderr.strip()
+            result = self.command_runner(cmd, capture_output=True, text=True, timeout=10)
+            if result.returncode != 0 and self._is_launchctl_failure(result.stderr):
+                # The cached session is stale (user switched or logged out)
+                self.session_resolver.invalidate()
+            success = result.returncode == 0
+            output = result.stdout.strip() if result.stdout else result.stderr.strip()
             
         except subprocess.TimeoutExpired:
-            return False, "AppleScript execution timed out"
+            success, output = False, TIMEOUT_MESSAGE
         except Exception as e:
             return False, f"Error running AppleScript: {e}"
+        self.record_script_run(name, "spawn", started, output)
+        return success, output
     
-    def find_dialog_windows(self) -> List[Dict]:
-        """Find all dialog windows that might need auto-clicking"""
-        script = '''
-        tell application "System Events"
-            set dialogWindows to {}
-            repeat with proc in (every process whose background only is false)
-                try
-                    set procName to name of proc
-                    repeat with win in (every window of proc)
-                        try
-                            set winButtons to every button of win
-                            if (count of winButtons) > 0 then
-                                set buttonNames to {}
-                                repeat with btn in winButtons
-                                    try
-                                        set end of buttonNames to name of btn
-                                    end try
-                                end repeat
-                                if (count of buttonNames) > 0 then
-                                    set end of dialogWindows to {processName:procName, windowTitle:(name of win), buttons:buttonNames}
-                                end if
-                            end if
-                        end try
-                    end repeat
-                end try
-            end repeat
-            return dialogWindows
-        end tell
-        '''
-        
-        success, result = self.run_applescript_as_user(script)
-        if not success:
-            self.logger.debug(f"Failed to find dialog windows: {result}")
+    def record_script_run(self, name: str, mode: str, started: float, output: str) -> None:
+        """Count one script run ("host" or "spawn") and its duration, including time lost to timeouts"""
+        metrics = self.metrics
+        if not metrics.enabled:
+            return
+        elapsed = time.perf_counter() - started
+        metrics.count("scripts_total", mode)
+        metrics.observe("script_seconds", elapsed, name)
+        if output == TIMEOUT_MESSAGE:
+            metrics.count("script_timeouts_total", name)
+            metrics.count("script_timeout_seconds_total", name, elapsed)
+    
+    @staticmethod
+    def build_osascript_command(uid: str, script: str, language: str = "AppleScript",
+                                args: List[str] = None, compiled: str = None) -> List[str]:
+        """Build the command that runs one script in the user's GUI session
+        
+        A compiled file runs as `osascript <file> args...`; source is passed
+        with -e, and any arguments still reach its run handler as argv.
+        """
+        command = ["launchctl", "asuser", uid, "/usr/bin/osascript"]
+        if compiled:
+            command.append(compiled)
+        else:
+            command.extend(["-l", language, "-e", script])
+        return command + list(args or [])
+    
+    def build_template_command(self, uid: str, name: str, args: List[str]) -> List[str]:
+        """Build the command that runs one script template with arguments"""
+        template = SCRIPT_TEMPLATES[name]
+        return self.build_osascript_command(uid, template.source, template.language,
+                                            [str(arg) for arg in args], self.compiled_script(template))
+    
+    @staticmethod
+    def _default_script_host(uid: str) -> ScriptHostWorker:
+        """Start the JXA script host inside the user's GUI session"""
+        return ScriptHostWorker(
+            ["launchctl", "asuser", uid, "/usr/bin/osascript", "-l", "JavaScript", "-e", SCRIPT_HOST_SOURCE]
+        )
+    
+    def _run_in_script_host(self, script: str, uid: str, language: str, args: List[str] = None,
+                            compiled: str = None) -> Tuple[bool, str]:
+        """Send a script to the persistent host for this UID, replacing it on session change"""
+        if self.script_host is None or self._script_host_uid != uid:
+            self.stop_script_host()
+            self.script_host = self.script_host_factory(uid)
+            self._script_host_uid = uid
+        elif not self.script_host.healthy:
+            return False, "Script host disabled after repeated crashes: " + self.script_host.stderr_tail()
+        
+        success, output = self.script_host.request(script, language, args=args, file=compiled)
+        if not success and output.startswith("Script host") and self._is_launchctl_failure(output):
+            self.session_resolver.invalidate()
+        return success, output
+    
+    def stop_script_host(self) -> None:
+        """Shut down the persistent script host, if any"""
+        if self.script_host is not None:
+            self.script_host.stop()
+            self.script_host = None
+    
+    @staticmethod
+    def _is_launchctl_failure(stderr: str) -> bool:
+        """Tell launchctl errors apart from AppleScript errors in stderr"""
+        stderr = (stderr or "").lower()
+        return "launchctl" in stderr or "audit session" in stderr or "asuser" in stderr
+    
+    def find_dialog_windows(self, process_names: List[str] = None,
+                            windows: Dict[str, List[int]] = None) -> List[DialogWindow]:
+        """Find all dialog windows that might need auto-clicking
+        
+        Takes one snapshot of every window with buttons, either across all
+        foreground processes or only the named ones, in a single JXA call.
+        `windows` narrows the scan to specific {process: [window indexes]}.
+        """
+        try:
+            return self.snapshot_windows(process_names, windows)
+        except ScanError as e:
+            self.logger.debug("Failed to find dialog windows: %s", e)
             return []
+    
+    def snapshot_windows(self, process_names: List[str] = None,
+                         windows: Dict[str, List[int]] = None) -> List[DialogWindow]:
+        """Like find_dialog_windows, but raise ScanError instead of returning nothing"""
+        return self.backend.snapshot(process_names, windows)
+    
+    def list_window_titles(self, process_names: List[str]) -> Dict[str, List[str]]:
+        """List window titles per running process without enumerating buttons
         
-        # Parse the result - this is a simplified parser for AppleScript record format
-        dialogs = []
+        Raises ScanError when the script fails, so callers can tell "no
+        windows" apart from "could not look".
+        """
+        return self.backend.window_titles(process_names)
+    
+    def click_dialog_button(self, window: DialogWindow, button_name: str) -> bool:
+        """Click a button in a window found by find_dialog_windows"""
+        started = time.perf_counter()
         try:
-            # This is a basic parser - in production you might want something more robust
-            if result and result.strip():
-                self.logger.debug(f"Found potential dialogs: {result}")
-                # For now, we'll use a different approach with individual checks
-        except Exception as e:
-            self.logger.debug(f"Error parsing dialog result: {e}")
+            clicked = self.backend.click(window, button_name)
+        except ScanError:
+            clicked = False
+        self.metrics.observe("click_seconds", time.perf_counter() - started, window.process)
+        if clicked:
+            self.logger.info("Successfully clicked '%s' in %s", button_name, window.process)
+            self.metrics.count("clicks_total", window.process)
+            return True
+        return False
+    
+    @staticmethod
+    def click_arguments(window: DialogWindow, button_name: str) -> List[str]:
+        """Arguments of the click_button template for one window and button"""
+        return [window.process, str(int(window.index)), window.title, button_name]
+    
+    def is_process_allowed(self, process_name: str) -> bool:
+        """Apply process_rules and the process whitelist and blacklist"""
+        if self.snapshot.rules.allows(process_name):
+            return True
+        self.logger.debug("Process %s is excluded by the whitelist, blacklist or process_rules, skipping",
+                          process_name)
+        return False
+    
+    @staticmethod
+    def batched_click_arguments(process_names: List[str], button_names: List[str]) -> List[str]:
+        """Arguments of the batched_click template
         
-        return dialogs
+        The template walks each process's windows once and clicks the first
+        candidate found, so the cost is one script per call instead of one per
+        (process, button) pair.
+        """
+        return [str(len(process_names))] + list(process_names) + list(button_names)
     
-    def click_button_in_process(self, process_name: str, button_names: List[str]) -> bool:
-        """Try to click specific buttons in a process"""
-        # Check if process is in blacklist
-        if process_name in self.config.get("process_blacklist", []):
-            self.logger.debug(f"Process {process_name} is blacklisted, skipping")
-            return False
+    def click_buttons_in_processes(self, process_names: List[str],
+                                   button_names: List[str]) -> List[Tuple[str, str, str]]:
+        """Click at most one candidate button per process using a single batched script
         
-        # Check if process whitelist is defined and process is not in it
-        whitelist = self.config.get("process_whitelist", [])
-        if whitelist and process_name not in whitelist:
-            self.logger.debug(f"Process {process_name} not in whitelist, skipping")
-            return False
+        Returns (process, button, window title) for every click performed.
+        """
+        allowed = [name for name in process_names if self.is_process_allowed(name)]
+        if not allowed or not button_names:
+            return []
         
-        for button_name in button_names:
-            script = f'''
-            tell application "System Events"
-                try
-                    tell process "{process_name}"
-                        repeat with win in windows
-                            try
-                                set targetButton to (first button of win whose name is "{button_name}")
-                                click targetButton
-                                return "clicked_{button_name}"
-                            end try
-                        end repeat
-                    end tell
-                end try
-                return "not_found"
-            end tell
-            '''
-            
-            success, result = self.run_applescript_as_user(script)
-            if success and result.startswith("clicked_"):
-                self.logger.info(f"Successfully clicked '{button_name}' in {process_name}")
-                return True
+        started = time.perf_counter()
+        try:
+            clicks, error = self.backend.click_first(allowed, button_names), None
+        except ScanError as e:
+            clicks, error = [], e
+        self.metrics.observe("click_seconds", time.perf_counter() - started,
+                             allowed[0] if len(allowed) == 1 else "batch")
+        if len(allowed) == 1:
+            # Only single-process scripts can be attributed to one process
+            if error is None:
+                self.health.record_success(allowed[0])
+            else:
+                self.health.record_failure(allowed[0], timed_out=error.timed_out)
+        if error is not None:
+            self.logger.debug("Batched click script failed: %s", error)
+            return []
         
-        return False
+        for process_name, button_name, _ in clicks:
+            self.logger.info("Successfully clicked '%s' in %s", button_name, process_name)
+            self.metrics.count("clicks_total", process_name)
+        return clicks
+    
+    def click_button_in_process(self, process_name: str, button_names: List[str]) -> bool:
+        """Try to click specific buttons in a process"""
+        return bool(self.click_buttons_in_processes([process_name], button_names))
     
-    def get_all_buttons_to_click(self) -> List[str]:
+    def get_all_buttons_to_click(self, config: Dict = None) -> List[str]:
         """Get list of all buttons that should be auto-clicked based on config"""
+        config = self.config if config is None else config
         buttons = []
         
-        if self.config.get("auto_approve", True):
+        if config.get("auto_approve", True):
             buttons.extend(self.positive_buttons)
-            buttons.extend(self.config.get("custom_positive_buttons", []))
+            buttons.extend(config.get("custom_positive_buttons", []))
         
-        if self.config.get("auto_deny", False):
+        if config.get("auto_deny", False):
             buttons.extend(self.negative_buttons)
-            buttons.extend(self.config.get("custom_negative_buttons", []))
+            buttons.extend(config.get("custom_negative_buttons", []))
+        
+        return list(dict.fromkeys(buttons))  # Remove duplicates, keeping priority order
+    
+    def live_targets(self) -> List[str]:
+        """Return the monitored processes that are allowed and actually running"""
+        targets = self.snapshot.rules.targets(self.common_processes)
+        if not targets or not self.config.get("process_prefilter", True):
+            return targets
+        
+        started = time.perf_counter()
+        try:
+            running = self.backend.running_processes()
+        except Exception as e:
+            self.logger.debug("Process table snapshot failed, probing all targets: %s", e)
+            return targets
+        self.metrics.observe("stage_seconds", time.perf_counter() - started, "process_table")
+        return [name for name in targets if name in running]
+    
+    def tick_targets(self) -> List[str]:
+        """Live targets that are not cooling down, quarantined, over budget or off their scan schedule"""
+        targets = self.governor.admit([name for name in self.live_targets()
+                                       if not self.scheduler.is_cooling_down(name) and self.health.allow(name)])
+        return self.frequency.due(targets, self.governor.stretch_interval(self.scheduler.longest_interval()))
+    
+    def run_tick(self, snapshot: ConfigSnapshot = None) -> int:
+        """Scan the monitored processes once and return the number of clicks"""
+        rules = (snapshot or self.snapshot).rules
+        targets = self.tick_targets()
+        if not targets:
+            return 0
+        
+        if self.config.get("scan_mode", "snapshot") == "snapshot":
+            return self.run_snapshot_tick(rules, targets)
+        
+        # Click scripts only match literal names, so processes with pattern rules are snapshot-scanned instead
+        patterned = [name for name in targets if rules.table(name).patterns]
+        clicks = self.run_snapshot_tick(rules, patterned) if patterned else 0
+        targets = [name for name in targets if name not in patterned]
+        if self.config.get("batch_scope", "tick") == "process":
+            for process_name in targets:
+                if not self.is_running:
+                    break
+                buttons = rules.table(process_name).literals
+                clicks += self._record_clicks(self.click_buttons_in_processes([process_name], buttons))
+            return clicks
+        
+        for process_names, buttons in rules.batches(targets):
+            clicks += self._record_clicks(self.click_buttons_in_processes(process_names, buttons))
+        return clicks
+    
+    def _record_clicks(self, clicks: List[Tuple[str, str, str]]) -> int:
+        """Start cooldowns for processes clicked by the batched engine and count them as hits"""
+        for process_name, button_name, title in clicks:
+            self.scheduler.record_click(process_name)
+            self.frequency.record_hit(process_name)
+            if self.audit is not None:
+                # Batched scripts report neither the window's buttons nor when it appeared
+                self.audit.record(self.current_uid(), process_name, title, None, button_name, True, None)
+        return len(clicks)
+    
+    def current_uid(self) -> str:
+        """UID of the session being monitored, as far as it is already known"""
+        session = self.session_resolver.cached()
+        return session[1] if session and session[1] else str(os.getuid())
+    
+    def dialog_latency(self, window: DialogWindow) -> Optional[float]:
+        """Seconds since the window was first seen, if its sighting was tracked"""
+        appeared = self._sightings.get((window.process, window.index, window.title))
+        return None if appeared is None else time.monotonic() - appeared
+    
+    def audit_decision(self, window: DialogWindow, button_name: str, clicked: bool) -> None:
+        """Queue a rule decision for the audit store"""
+        self.audit.record(self.current_uid(), window.process, window.title, window.buttons, button_name, clicked,
+                          self.dialog_latency(window))
+    
+    def run_snapshot_tick(self, rules: RuleEngine, targets: List[str]) -> int:
+        """Take one snapshot and click only where a rule matches a button that actually exists"""
+        if not targets or rules.empty:
+            return 0
+        
+        started = time.perf_counter()
+        try:
+            if self.config.get("incremental_scan", True):
+                windows = self.scanner.scan(targets)
+            else:
+                windows = self.snapshot_windows(targets)
+        except ScanError as e:
+            self.logger.debug("Snapshot of %d processes failed (%s), isolating", len(targets), e)
+            windows = self.isolate_scan_failure(targets)
+        else:
+            errors = scan_errors(windows)
+            for name in targets:
+                if name in errors:
+                    self.record_scan_failure(name, ScanError(errors[name]))
+                else:
+                    self.health.record_success(name)
+            self.decisions.forget_dismissed([name for name in targets if name not in errors], windows)
+        if self.metrics.enabled:
+            self.metrics.observe("stage_seconds", time.perf_counter() - started, "scan")
+        if self.metrics.enabled or self.audit is not None:
+            self._track_sightings(windows)
+        
+        clicks = 0
+        clicked_processes = set()
+        decisions = []
+        for window in windows:
+            if window.process in clicked_processes or self.decisions.get(window) is not None:
+                continue
+            button_name = rules.choose(window)
+            if not button_name:
+                self.decisions.record(window, DecisionCache.IGNORE)
+                continue
+            clicked = self.click_dialog_button(window, button_name)
+            decisions.append((window, button_name, clicked))
+            self.frequency.record_hit(window.process)
+            if self.audit is not None:
+                self.audit_decision(window, button_name, clicked)
+            if clicked:
+                clicked_processes.add(window.process)
+                self.scheduler.record_click(window.process)
+                self.decisions.record(window, DecisionCache.CLICKED)
+                if self.metrics.enabled:
+                    latency = self.dialog_latency(window)
+                    if latency is not None:
+                        self.metrics.observe("dialog_latency_seconds", latency, window.process)
+                # Re-check the window next tick in case the click did not dismiss it
+                self.scanner.invalidate(window)
+                clicks += 1
+        if self.recorder is not None:
+            self.record_trace(targets, windows, decisions)
+        return clicks
+    
+    def record_trace(self, targets: List[str], windows: List[DialogWindow],
+                     decisions: List[Tuple[DialogWindow, str, bool]]) -> None:
+        """Append the tick to the active recording, giving up on it if the file cannot be written"""
+        try:
+            self.recorder.record(targets, windows, decisions)
+        except OSError as e:
+            self.logger.warning("Stopping the recording to %s: %s", self.recorder.path, e)
+            self.stop_recording()
+    
+    def start_recording(self, path: str) -> bool:
+        """Record every snapshot tick to an NDJSON trace at path"""
+        self.stop_recording()
+        path = os.path.expanduser(path)
+        try:
+            self.recorder = TraceRecorder(path)
+        except (OSError, ValueError) as e:
+            self.logger.warning("Cannot record to %s: %s", path, e)
+            return False
+        self.logger.info("Recording ticks to %s", path)
+        return True
+    
+    def stop_recording(self) -> None:
+        """Close the active recording, if any"""
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+            self.logger.info("Recorded %d ticks to %s", recorder.ticks, recorder.path)
+    
+    def start_audit(self, path: str = None) -> bool:
+        """Open the audit store (audit_file unless a path is given) and log decisions to it"""
+        self.stop_audit()
+        config = self.config if path is None else dict(self.config, audit_file=path)
+        try:
+            self.audit = AuditStore.from_config(config)
+        except (OSError, sqlite3.Error) as e:
+            self.logger.warning("Audit store unavailable: %s", e)
+            return False
+        return True
+    
+    def stop_audit(self) -> None:
+        """Commit queued decisions and close the audit store, if open"""
+        audit, self.audit = self.audit, None
+        if audit is not None:
+            audit.close()
+    
+    def _track_sightings(self, windows: List[DialogWindow]) -> None:
+        """Date each new window to the previous scan, the latest time it was known not to be there"""
+        now = time.monotonic()
+        appeared = now if self._last_scan_at is None else self._last_scan_at
+        self._sightings = {key: self._sightings.get(key, appeared)
+                           for key in ((w.process, w.index, w.title) for w in windows)}
+        self._last_scan_at = now
+    
+    def isolate_scan_failure(self, targets: List[str]) -> List[DialogWindow]:
+        """Probe targets one by one after a combined snapshot failed
         
-        return list(set(buttons))  # Remove duplicates
+        Each process's outcome feeds the health tracker, so the culprit's
+        circuit opens and later combined snapshots leave it out.
+        """
+        windows = []
+        for name in targets:
+            if not self.health.allow(name):
+                continue
+            try:
+                found = self.snapshot_windows([name])
+            except ScanError as e:
+                self.record_scan_failure(name, e)
+                continue
+            if name in scan_errors(found):
+                self.record_scan_failure(name, ScanError(scan_errors(found)[name]))
+                continue
+            windows.extend(found)
+            self.health.record_success(name)
+        return windows
+    
+    def record_scan_failure(self, name: str, error: ScanError) -> None:
+        """Count a failed query of one process, quarantining it once its circuit opens"""
+        self.health.record_failure(name, timed_out=error.timed_out)
+        if self.health.state(name) == ProcessHealthTracker.OPEN:
+            self.logger.warning("Quarantining %s after repeated scan failures: %s", name, error)
     
     def monitor_and_auto_click(self) -> None:
         """Main monitoring loop"""
         self.logger.info("Starting dialog monitoring...")
-        buttons_to_click = self.get_all_buttons_to_click()
-        
-        # Common processes that show approval dialogs
-        common_processes = [
-            "Terminal", "iTerm2", "osascript", "System Preferences", 
-            "System Settings", "SecurityAgent", "UserNotificationCenter",
-            "CoreServicesUIAgent", "loginwindow"
-        ]
         
         while self.is_running:
             try:
-                for process_name in common_processes:
-                    if not self.is_running:
-                        break
-                    
-                    success = self.click_button_in_process(process_name, buttons_to_click)
-                    if success:
-                        # Small delay after successful click to avoid rapid clicking
-                        time.sleep(1)
-                
-                time.sleep(self.config.get("check_interval", 0.5))
+                started = time.perf_counter()
+                snapshot = self.poll_config()
+                # Clicked processes cool down individually instead of stalling the loop
+                clicks = self.run_tick(snapshot)
+                self.tick_count += 1
+                self.click_count += clicks
+                self.scheduler.record_tick(clicks > 0)
+                self.record_tick_metrics(started)
+                self.frequency.maybe_save()
+                self.governor.sample()
+                time.sleep(self.governor.stretch_interval(self.scheduler.next_interval()))
                 
             except Exception as e:
-                self.logger.error(f"Error in monitoring loop: {e}")
+                self.logger.error("Error in monitoring loop: %s", e)
                 time.sleep(1)
     
-    def start(self) -> bool:
+    def record_tick_metrics(self, started: float) -> None:
+        """Account for a finished tick and rewrite the metrics file when it is due"""
+        if not self.metrics.enabled:
+            return
+        self.metrics.observe("tick_seconds", time.perf_counter() - started)
+        self.metrics.count("ticks_total")
+        if time.monotonic() >= self._next_metrics_export:
+            self.export_metrics()
+    
+    def export_metrics(self) -> None:
+        """Write the Prometheus text file"""
+        self._next_metrics_export = time.monotonic() + self.config.get("metrics_interval", 10.0)
+        path = os.path.expanduser(self.config.get("metrics_file", "~/.copilot_helper_metrics.prom"))
+        try:
+            self.metrics.write(path)
+        except OSError as e:
+            self.logger.warning("Could not write metrics to %s: %s", path, e)
+    
+    def supervise_sessions(self) -> None:
+        """Monitoring thread body in multi-session mode: keep one worker per GUI session"""
+        self.logger.info("Supervising GUI sessions...")
+        while self.is_running:
+            try:
+                self.poll_config()
+                self.supervisor.poll()
+            except Exception as e:
+                self.logger.error("Error supervising sessions: %s", e)
+            if self.supervisor.wait(self.config.get("session_poll_interval", 5.0)):
+                break
+    
+    def session_report(self) -> Dict:
+        """Heartbeat a session worker sends its supervisor"""
+        overrides = self.config.get("session_overrides", {}).get(self.session.user, {})
+        return {
+            "uid": self.session.uid,
+            "pid": os.getpid(),
+            "ticks": self.tick_count,
+            "clicks": self.click_count,
+            "overrides": sorted(overrides)
+        }
+    
+    def run_async_engine(self) -> None:
+        """Monitoring thread body for the asyncio engine"""
+        self.logger.info("Starting dialog monitoring (async engine)...")
+        self.async_engine = AsyncMonitorEngine(
+            self,
+            concurrency=self.config.get("probe_concurrency", 4),
+            tick_deadline=self.config.get("tick_deadline", 2.0)
+        )
+        asyncio.run(self.async_engine.run())
+    
+    def start(self, engine: str = None) -> bool:
         """Start the helper"""
         if self.is_running:
             print("Helper is already running")
             return False
         
+        self.setup_logging()
         if not self.config.get("enabled", False):
             print("Helper is disabled. Use 'enable' command to enable it.")
             return False
         
-        # Check accessibility permissions
-        if not self.check_accessibility_permissions():
-            print("Accessibility permissions required. Please enable in System Settings > Privacy & Security > Accessibility")
-            return False
+        if self.config.get("multi_session", False):
+            # The session workers check permissions, scan and record; this process only supervises them
+            self.supervisor = SessionSupervisor(
+                self.config_file, self.session_source or LoginWindowSessionSource(self.command_runner),
+                engine=engine, logger=self.logger
+            )
+            target = self.supervise_sessions
+        else:
+            # Check accessibility permissions
+            if not self.check_accessibility_permissions():
+                print("Accessibility permissions required. Please enable in System Settings > Privacy & Security > Accessibility")
+                return False
+            
+            engine = engine or self.config.get("engine", "thread")
+            target = self.run_async_engine if engine == "async" else self.monitor_and_auto_click
+            
+            if self.config.get("record_file") and self.recorder is None:
+                self.start_recording(self.config["record_file"])
+            if self.config.get("audit", True):
+                self.start_audit()
+            if self.frequency.enabled:
+                self.frequency.load()
         
         self.is_running = True
-        self.monitoring_thread = threading.Thread(target=self.monitor_and_auto_click, daemon=True)
+        self.started_at = time.time()
+        self.monitoring_thread = threading.Thread(target=target, daemon=True)
         self.monitoring_thread.start()
         
         print("Copilot Helper started and monitoring for dialogs...")
@@ -309,8 +4283,16 @@ class CopilotHelper:
             return False
         
         self.is_running = False
+        if self.supervisor is not None:
+            self.supervisor.stop()
         if self.monitoring_thread:
             self.monitoring_thread.join(timeout=2)
+        self.stop_script_host()
+        self.stop_recording()
+        self.stop_audit()
+        self.frequency.maybe_save(force=True)
+        if self.metrics.enabled:
+            self.export_metrics()
         
         print("Copilot Helper stopped")
         self.logger.info("Copilot Helper stopped")
@@ -332,51 +4314,119 @@ class CopilotHelper:
     
     def status(self) -> None:
         """Show current status"""
-        enabled = self.config.get("enabled", False)
-        running = self.is_running
-        
-        print(f"Status: {'Enabled' if enabled else 'Disabled'}")
-        print(f"Running: {'Yes' if running else 'No'}")
-        print(f"Config file: {self.config_file}")
-        print(f"Auto-approve: {self.config.get('auto_approve', True)}")
-        print(f"Auto-deny: {self.config.get('auto_deny', False)}")
-        print(f"Check interval: {self.config.get('check_interval', 0.5)}s")
+        print("\n".join(format_status(self.status_report())))
+    
+    def status_report(self) -> Dict:
+        """Everything `status` shows, as JSON-serialisable data"""
+        report = config_status_report(self.config, self.config_file)
+        report.update({
+            "running": self.is_running,
+            "ui_backend": self.backend.name,
+            "script_cache_dir": self.script_cache.cache_dir,
+            "async_engine": None if self.async_engine is None else {
+                "ticks": self.async_engine.ticks,
+                "cancelled_probes": self.async_engine.cancelled_probes
+            },
+            "process_health": self.health.snapshot(),
+            "incremental_scan": self.scanner.stats(),
+            "decision_cache": self.decisions.stats(),
+            "budget": self.governor.snapshot() if self.governor.enabled else None,
+            "frequency": self.frequency.snapshot() if self.frequency.enabled else None,
+            "recording": None if self.recorder is None else {
+                "path": self.recorder.path, "ticks": self.recorder.ticks
+            },
+            "sessions": None if self.supervisor is None else self.supervisor.snapshot(),
+            "audit": None if self.audit is None else self.audit.stats()
+        })
+        return report
+    
+    def stats(self) -> Dict:
+        """Counters of the running monitor, for the `stats` command"""
+        host = self.script_host
+        return {
+            "uptime": time.time() - self.started_at if self.started_at else 0.0,
+            "ticks": self.tick_count,
+            "clicks": self.click_count,
+            "session_resolutions": self.session_resolver.resolutions,
+            "process_table_snapshots": self.process_table.snapshots,
+            "script_host": None if host is None else {
+                "spawns": host.spawns, "crashes": host.crashes, "timeouts": host.timeouts
+            },
+            "script_cache": {"compiles": self.script_cache.compiles, "failures": self.script_cache.failures},
+            "incremental_scan": self.scanner.stats(),
+            "decision_cache": self.decisions.stats(),
+            "budget": self.governor.snapshot() if self.governor.enabled else None,
+            "frequency": None if not self.frequency.enabled else {
+                "scans": self.frequency.scans, "skipped": self.frequency.skipped
+            },
+            "sessions": None if self.supervisor is None else {
+                "workers_started": self.supervisor.started, "restarts": self.supervisor.restarts
+            },
+            "audit": None if self.audit is None else self.audit.stats(),
+            "control_requests": self.control_server.requests if self.control_server else 0,
+            "config_generation": self.snapshot.generation,
+            "config_reloads": self.config_reloads,
+            "log_messages_suppressed": self.log_pipeline.repeats.suppressed if self.log_pipeline else 0,
+            "metrics": self.metrics.summary() if self.metrics.enabled else None
+        }
     
     def check_accessibility_permissions(self) -> bool:
         """Check if the current process has accessibility permissions"""
-        script = '''
-        tell application "System Events"
-            try
-                set frontApp to name of first application process whose frontmost is true
-                return "accessible"
-            on error
-                return "not_accessible"
-            end try
-        end tell
-        '''
-        
-        success, result = self.run_applescript_as_user(script)
-        return success and result == "accessible"
+        return self.backend.accessible()
     
     def configure(self, key: str, value: str) -> None:
         """Configure a setting"""
         valid_keys = [
             "auto_approve", "auto_deny", "check_interval", "log_level",
-            "focus_prevention"
+            "focus_prevention", "max_interval", "idle_backoff", "burst_interval",
+            "burst_window", "click_cooldown", "engine", "probe_concurrency", "tick_deadline",
+            "config_watch_interval", "decision_cache_size", "decision_cache_ttl", "click_dedup_ttl",
+            "metrics", "metrics_interval", "record_file", "cpu_budget_percent", "spawn_budget_per_minute",
+            "budget_window", "budget_max_stretch", "multi_session", "session_poll_interval", "audit", "audit_file",
+            "audit_retention_days", "audit_flush_interval", "frequency_schedule", "schedule_max_staleness",
+            "schedule_hot_hits", "schedule_half_life", "schedule_file"
+        ]
+        numeric_keys = [
+            "check_interval", "max_interval", "idle_backoff", "burst_interval",
+            "burst_window", "click_cooldown", "tick_deadline", "config_watch_interval",
+            "decision_cache_ttl", "click_dedup_ttl", "metrics_interval", "cpu_budget_percent",
+            "spawn_budget_per_minute", "budget_window", "budget_max_stretch", "session_poll_interval",
+            "audit_retention_days", "audit_flush_interval", "schedule_max_staleness", "schedule_hot_hits",
+            "schedule_half_life"
         ]
         
         if key not in valid_keys:
             print(f"Invalid configuration key. Valid keys: {', '.join(valid_keys)}")
             return
+        if not value and key not in ("record_file", "schedule_file"):
+            print(f"{key} needs a value (only record_file and schedule_file can be set to \"\")")
+            return
         
         # Type conversion
-        if key in ["auto_approve", "auto_deny", "focus_prevention"]:
+        if key in ["auto_approve", "auto_deny", "focus_prevention", "metrics", "multi_session", "audit",
+                   "frequency_schedule"]:
             value = value.lower() in ["true", "1", "yes", "on"]
-        elif key == "check_interval":
+        elif key in numeric_keys:
             try:
                 value = float(value)
             except ValueError:
-                print("check_interval must be a number")
+                print(f"{key} must be a number")
+                return
+        elif key == "probe_concurrency":
+            try:
+                value = max(1, int(value))
+            except ValueError:
+                print("probe_concurrency must be an integer")
+                return
+        elif key == "decision_cache_size":
+            try:
+                value = max(0, int(value))
+            except ValueError:
+                print("decision_cache_size must be an integer")
+                return
+        elif key == "engine":
+            if value not in ["thread", "async"]:
+                print("engine must be one of: thread, async")
                 return
         elif key == "log_level":
             if value.upper() not in ["DEBUG", "INFO", "WARNING", "ERROR"]:
@@ -384,18 +4434,375 @@ class CopilotHelper:
                 return
             value = value.upper()
         
-        self.config[key] = value
-        self.save_config()
+        config = dict(self.config, **{key: value})
+        self.save_config(config)
+        self.config_watcher.mark()
+        # Applied between two ticks of a running monitor, without restarting it
+        self.apply_config(config)
         print(f"Configuration updated: {key} = {value}")
+        if self.is_running and key in ("engine", "multi_session"):
+            print(f"The new {key} setting is used the next time the helper starts")
+    
+    def reload_config(self) -> bool:
+        """Re-read the config file and apply it without restarting the monitor"""
+        try:
+            config = self.read_config_file()
+        except (ValueError, IOError) as e:
+            self.logger.warning("Keeping the current configuration, config file unreadable: %s", e)
+            return False
+        self.config_watcher.mark()
+        self.apply_config(config)
+        self.logger.info("Configuration reloaded")
+        return True
+    
+    def compile_config(self, config: Dict, generation: int) -> ConfigSnapshot:
+        """Build the immutable snapshot the monitor loop works from"""
+        buttons = self.get_all_buttons_to_click(config)
+        rules = RuleEngine.from_config(config, buttons)
+        for error in rules.errors:
+            self.logger.warning(error)
+        return ConfigSnapshot(
+            generation=generation,
+            config=MappingProxyType(dict(config)),
+            buttons=tuple(buttons),
+            rules=rules
+        )
+    
+    def apply_config(self, config: Dict) -> ConfigSnapshot:
+        """Compile a new configuration and hand it to the monitor loop
         
-        # If we're running, restart to apply changes
-        if self.is_running:
-            print("Restarting helper to apply changes...")
-            self.stop()
-            time.sleep(1)
-            self.start()
+        A running loop adopts it at its next tick boundary; otherwise it
+        takes effect immediately.
+        """
+        with self._snapshot_lock:
+            latest = self._pending_snapshot or self.snapshot
+            snapshot = self.compile_config(config, latest.generation + 1)
+            self._pending_snapshot = snapshot
+        if not self.is_running:
+            self.poll_config()
+        return snapshot
+    
+    def poll_config(self) -> ConfigSnapshot:
+        """Between ticks: pick up edits to the config file and adopt any pending snapshot"""
+        if self.config_watcher.changed():
+            try:
+                config = self.read_config_file()
+            except (ValueError, IOError) as e:
+                self.logger.warning("Ignoring unreadable config file change: %s", e)
+            else:
+                self.logger.info("Config file changed, reloading")
+                self.apply_config(config)
+        
+        with self._snapshot_lock:
+            snapshot, self._pending_snapshot = self._pending_snapshot, None
+        if snapshot is not None:
+            self._adopt_snapshot(snapshot)
+        return self.snapshot
+    
+    def _adopt_snapshot(self, snapshot: ConfigSnapshot) -> None:
+        """Push a new configuration into the components that cache settings"""
+        config = dict(snapshot.config)
+        previous, self.config = self.config, config
+        self.scheduler.reconfigure(config)
+        self.health.reconfigure(config)
+        self.governor.reconfigure(config)
+        self.frequency.reconfigure(config)
+        self.scanner.max_age = config.get("scan_refresh_interval", 30.0)
+        self.decisions.reconfigure(config)
+        self.metrics.enabled = config.get("metrics", False)
+        self.session_resolver.ttl = config.get("session_ttl", 30.0)
+        self.config_watcher.check_interval = config.get("config_watch_interval", 1.0)
+        self.logger.setLevel(getattr(logging, config.get("log_level", "INFO"), logging.INFO))
+        if self.log_pipeline is not None:
+            self.log_pipeline.reconfigure(config)
+        if self.async_engine is not None:
+            self.async_engine.concurrency = max(1, config.get("probe_concurrency", 4))
+            self.async_engine.tick_deadline = config.get("tick_deadline", 2.0)
+        if config.get("script_host") != previous.get("script_host"):
+            self.stop_script_host()
+        if (self.is_running and self.supervisor is None
+                and config.get("record_file", "") != previous.get("record_file", "")):
+            if config.get("record_file"):
+                self.start_recording(config["record_file"])
+            else:
+                self.stop_recording()
+        if self.is_running and self.supervisor is None and (
+                config.get("audit", True) != previous.get("audit", True)
+                or config.get("audit_file") != previous.get("audit_file")):
+            if config.get("audit", True):
+                self.start_audit()
+            else:
+                self.stop_audit()
+        elif self.audit is not None:
+            self.audit.reconfigure(config)
+        self.snapshot = snapshot
+        self.config_reloads += 1
+    
+    def serve_control(self, path: str = None) -> Optional[ControlServer]:
+        """Serve status, stop, reload and stats on the control socket"""
+        server = ControlServer(
+            path or os.path.expanduser(self.config.get("control_socket", "~/.copilot_helper.sock")),
+            {
+                "status": lambda request: self.status_report(),
+                "stats": lambda request: self.stats(),
+                "stop": lambda request: self.request_stop(),
+                "reload": lambda request: self.reload_config()
+            },
+            self.logger
+        )
+        try:
+            server.start()
+        except (OSError, ControlError) as e:
+            self.logger.warning("Control socket unavailable: %s", e)
+            return None
+        self.control_server = server
+        return server
+    
+    def request_stop(self) -> bool:
+        """Stop on another thread, so a control reply goes out before shutdown starts
+        
+        Returns whether the helper was running. The thread is not a daemon
+        thread, so the process does not exit before stop() has finished.
+        """
+        if not self.is_running:
+            return False
+        threading.Thread(target=self.stop, name="control-stop", daemon=False).start()
+        return True
+    
+    def stop_control(self) -> None:
+        """Stop serving the control socket"""
+        if self.control_server is not None:
+            self.control_server.stop()
+            self.control_server = None
+
+
+def read_config_cached(config_file: str) -> Dict:
+    """Parse a JSON config file, reusing the last parse while the file is unchanged
+
+    Raises OSError when the file cannot be read and ValueError when it is
+    not a JSON object.
+    """
+    info = os.stat(config_file)
+    key = (info.st_mtime_ns, info.st_size, info.st_ino)
+    cached = _config_cache.get(config_file)
+    if cached is None or cached[0] != key:
+        with open(config_file, "r") as f:
+            config = json.load(f)
+        if not isinstance(config, dict):
+            raise ValueError("config file is not a JSON object")
+        cached = _config_cache[config_file] = (key, config)
+    return dict(cached[1])
+
+
+def session_path(path: str, user: str) -> str:
+    """Per-user variant of a file path: ~/trace.ndjson.gz becomes ~/trace-alice.ndjson.gz"""
+    directory, name = os.path.split(path)
+    stem, dot, suffix = name[1:].partition(".")  # name[0] stays put so dotfiles keep their dot
+    return os.path.join(directory, f"{name[:1]}{stem}-{user}{dot}{suffix}")
+
+
+def session_config(config: Dict, user: str) -> Dict:
+    """Configuration of one session worker
+
+    The user's session_overrides are merged in, and files written while
+    running get per-user names unless an override names them.
+    """
+    overrides = config.get("session_overrides", {}).get(user, {})
+    config = dict(config, **overrides)
+    for key in ("record_file", "metrics_file", "schedule_file"):
+        if config.get(key) and key not in overrides:
+            config[key] = session_path(config[key], user)
+    config["multi_session"] = False
+    return config
+
+
+def config_status_report(config: Dict, config_file: str) -> Dict:
+    """Status of a helper that is not running, from its configuration alone"""
+    return {
+        "enabled": config.get("enabled", False),
+        "running": False,
+        "pid": os.getpid(),
+        "config_file": config_file,
+        "auto_approve": config.get("auto_approve", True),
+        "auto_deny": config.get("auto_deny", False),
+        "check_interval": config.get("check_interval", 0.5),
+        "idle_backoff": config.get("idle_backoff", 1.5),
+        "max_interval": config.get("max_interval", 2.0),
+        "burst_interval": config.get("burst_interval", 0.1),
+        "burst_window": config.get("burst_window", 5.0),
+        "engine": config.get("engine", "thread"),
+        "ui_backend": config.get("ui_backend", "applescript"),
+        "compiled_scripts": config.get("compiled_scripts", True),
+        "script_cache_dir": os.path.expanduser(config.get("script_cache_dir", "~/.copilot_helper_cache")),
+        "async_engine": None,
+        "process_health": {},
+        "incremental_scan": None,
+        "decision_cache": None,
+        "budget": None,
+        "frequency": None,
+        "recording": None,
+        "sessions": None,
+        "audit": None
+    }
+
+
+def offline_status_report(config_file: str = None) -> Dict:
+    """Status when no daemon answers, read from the config file without creating or writing anything"""
+    config_file = config_file or os.path.expanduser("~/.copilot_helper_config.json")
+    config = CopilotHelper.default_config()
+    try:
+        config.update(read_config_cached(config_file))
+    except (OSError, ValueError):
+        pass
+    return config_status_report(config, config_file)
+
+
+def format_status(report: Dict) -> List[str]:
+    """Render a status report as the lines printed by `status`"""
+    lines = [
+        f"Status: {'Enabled' if report['enabled'] else 'Disabled'}",
+        f"Running: {'Yes' if report['running'] else 'No'}",
+        f"Config file: {report['config_file']}",
+        f"Auto-approve: {report['auto_approve']}",
+        f"Auto-deny: {report['auto_deny']}",
+        f"Check interval: {report['check_interval']}s (idle backoff x{report['idle_backoff']} up to "
+        f"{report['max_interval']}s, burst {report['burst_interval']}s for {report['burst_window']}s)",
+        f"Engine: {report['engine']} ({report.get('ui_backend', 'applescript')} backend)",
+        f"Compiled scripts: {'On' if report['compiled_scripts'] else 'Off'} ({report['script_cache_dir']})"
+    ]
+    if report["running"]:
+        lines.insert(2, f"Daemon PID: {report['pid']}")
+
+    if report["async_engine"]:
+        lines.append(f"Async engine: {report['async_engine']['ticks']} ticks, "
+                     f"{report['async_engine']['cancelled_probes']} probes cancelled at the deadline")
+
+    health = report["process_health"]
+    if health:
+        lines.append("Process health:")
+        for name, entry in sorted(health.items()):
+            retry = f", retry in {entry['retry_in']:.0f}s" if entry["state"] == ProcessHealthTracker.OPEN else ""
+            lines.append(f"  {name}: {entry['state']} ({entry['total_failures']} failures, "
+                         f"{entry['total_timeouts']} timeouts{retry})")
+
+    scan = report.get("incremental_scan")
+    if scan:
+        lines.append(f"Incremental scan: {scan['hits']} hits, {scan['misses']} misses, "
+                     f"{scan['deep_scans']} deep scans, {scan['tracked_windows']} windows tracked")
+    decisions = report.get("decision_cache")
+    if decisions:
+        lines.append(f"Decision cache: {decisions['hits']} hits, {decisions['misses']} misses, "
+                     f"{decisions['evictions']} evictions, {decisions['entries']}/{decisions['capacity']} entries")
+    budget = report.get("budget")
+    if budget:
+        throttling = {
+            BudgetGovernor.OK: "within budget",
+            BudgetGovernor.SHEDDING: "over budget, skipping low-priority processes",
+            BudgetGovernor.STRETCHING: f"over budget, low-priority processes skipped, interval x{budget['stretch']}"
+        }[budget["state"]]
+        lines.append(f"Budget: CPU {budget['cpu_percent']:.1f}% of {budget['cpu_limit']:g}%, "
+                     f"{budget['spawns_per_minute']:.0f} of {budget['spawn_limit']:g} spawns/min ({throttling}, "
+                     f"{budget['dropped_probes']} probes skipped)")
+    frequency = report.get("frequency")
+    if frequency:
+        hot = ", ".join(frequency["hot"]) or "none yet"
+        probes = frequency["scans"] + frequency["skipped"]
+        share = f" ({100.0 * frequency['skipped'] / probes:.0f}%)" if probes else ""
+        lines.append(f"Scan schedule: hot {hot}; others at least every {frequency['max_staleness']:g}s, "
+                     f"{frequency['skipped']} of {probes} probes skipped{share}")
+    recording = report.get("recording")
+    if recording:
+        lines.append(f"Recording: {recording['ticks']} ticks to {recording['path']}")
+    audit = report.get("audit")
+    if audit:
+        dropped = f", {audit['dropped']} dropped" if audit["dropped"] else ""
+        lines.append(f"Audit: {audit['written']} decisions written to {audit['path']} "
+                     f"({audit['pending']} pending{dropped})")
+    sessions = report.get("sessions")
+    if sessions is not None:
+        lines.append(f"Sessions: {len(sessions)} GUI session{'s' if len(sessions) != 1 else ''}")
+        for uid, entry in sessions.items():
+            worker = f"worker {entry['pid']}" if entry["alive"] else "worker down"
+            overrides = f", overrides: {', '.join(entry['overrides'])}" if entry["overrides"] else ""
+            lines.append(f"  {entry['user']} (uid {uid}): {worker}, {entry['ticks']} ticks, "
+                         f"{entry['clicks']} clicks, {entry['restarts']} restarts{overrides}")
+    return lines
+
+
+def config_file_path(key: str, config_file: str = None) -> str:
+    """A path setting from the config file or its default, read without creating or rewriting the file"""
+    config_file = config_file or os.path.expanduser("~/.copilot_helper_config.json")
+    path = CopilotHelper.default_config()[key]
+    try:
+        path = read_config_cached(config_file).get(key, path)
+    except (OSError, ValueError):
+        pass
+    return os.path.expanduser(path)
+
+
+def control_socket_path(config_file: str = None) -> str:
+    """Control socket named in the config file"""
+    return config_file_path("control_socket", config_file)
+
+
+def run_audit(args) -> None:
+    """The `audit` command: query the audit database without a running daemon"""
+    path = config_file_path("audit_file", args.config)
+    try:
+        filters = {
+            "since": parse_audit_time(args.since) if args.since else None,
+            "until": parse_audit_time(args.until) if args.until else None,
+            "process": args.process, "button": args.button, "title": args.title, "uid": args.uid,
+            "clicked": None if args.outcome is None else args.outcome == "clicked"
+        }
+    except ValueError as e:
+        print(f"Invalid time: {e}")
+        return
+    try:
+        connection = open_audit(path)
+        try:
+            if args.group_by:
+                rows = aggregate_audit(connection, args.group_by, limit=args.limit, **filters)
+            else:
+                rows = query_audit(connection, limit=args.limit, **filters)
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        print(f"Cannot read the audit database {path}: {e}")
+        return
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print("\n".join(format_audit(rows, args.group_by)))
 
 
+def run_remote_command(command: str, socket_path: str) -> bool:
+    """Answer a command from the running daemon; False when no daemon is listening"""
+    client = ControlClient(socket_path)
+    try:
+        result = client.request(command)
+    except socket.timeout:
+        print(f"Daemon error: no answer within {client.timeout:g}s")
+        return True
+    except OSError as e:
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return False
+        print(f"Daemon error: {e}")
+        return True
+    except ControlError as e:
+        print(f"Daemon error: {e}")
+        return True
+
+    if command == "status":
+        print("\n".join(format_status(result)))
+    elif command == "stats":
+        print(json.dumps(result, indent=2))
+    elif command == "stop":
+        print("Copilot Helper stopped" if result else "Helper is not running")
+    elif command == "reload":
+        print("Configuration reloaded" if result else "Config file unreadable, keeping the current configuration")
+    return True
+
 def signal_handler(signum, frame):
     """Handle signals gracefully"""
     print("\nShutting down Copilot Helper...")
@@ -409,48 +4816,91 @@ def main():
     
     parser = argparse.ArgumentParser(description="Copilot Interactive Helper")
     parser.add_argument("command", nargs="?", choices=[
-        "start", "stop", "enable", "disable", "status", "configure", "daemon"
+        "start", "stop", "enable", "disable", "status", "configure", "daemon", "reload", "stats", "replay", "audit"
     ], help="Command to execute")
     parser.add_argument("--config-key", help="Configuration key for configure command")
     parser.add_argument("--config-value", help="Configuration value for configure command")
     parser.add_argument("--config", help="Path to configuration file")
+    parser.add_argument("--engine", choices=["thread", "async"],
+                        help="Monitoring engine for start/daemon (default: config 'engine')")
+    parser.add_argument("--socket", help="Control socket of the daemon (default: config 'control_socket')")
+    parser.add_argument("--record", metavar="PATH",
+                        help="Record every tick of start/daemon to this trace (default: config 'record_file')")
+    parser.add_argument("--trace", metavar="PATH", help="Trace to feed through the monitor for replay")
+    parser.add_argument("--realtime", action="store_true",
+                        help="Replay ticks at their recorded pace instead of as fast as possible")
+    audit = parser.add_argument_group("audit", "Filters and output of the audit command")
+    audit.add_argument("--since", help="Decisions since an age (90m, 12h, 7d, 2w) or ISO date/time")
+    audit.add_argument("--until", help="Decisions before an age or ISO date/time")
+    audit.add_argument("--process", help="Process name or glob, e.g. 'Xcode*'")
+    audit.add_argument("--button", help="Chosen button or glob")
+    audit.add_argument("--title", help="Window title or glob, e.g. '*keychain*'")
+    audit.add_argument("--uid", help="Only decisions in this user's session")
+    audit.add_argument("--outcome", choices=["clicked", "failed"], help="Only successful or failed clicks")
+    audit.add_argument("--group-by", choices=list(AUDIT_GROUPS),
+                       help="Count decisions per group instead of listing them")
+    audit.add_argument("--limit", type=int, default=50, help="Most rows or groups shown (default: 50)")
+    audit.add_argument("--json", action="store_true", help="Print the results as JSON")
     
     args = parser.parse_args()
     
+    if not args.command:
+        print("Copilot Interactive Helper")
+        print("Available commands: start, stop, enable, disable, status, configure, daemon, reload, stats, replay, "
+              "audit")
+        print("Use --help for more information")
+        return
+    
+    # Read-only commands are answered by the running daemon over its control
+    # socket, or else from the config file; neither builds a helper, writes
+    # files or sets up logging
+    if args.command in ("status", "stop", "reload", "stats"):
+        if run_remote_command(args.command, args.socket or control_socket_path(args.config)):
+            return
+        if args.command == "status":
+            print("\n".join(format_status(offline_status_report(args.config))))
+        else:
+            print("Helper is not running")
+        return
+    
+    if args.command == "audit":
+        run_audit(args)
+        return
+    
     helper = CopilotHelper(args.config)
     
     # Setup signal handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
-    if not args.command:
-        print("Copilot Interactive Helper")
-        print("Available commands: start, stop, enable, disable, status, configure, daemon")
-        print("Use --help for more information")
-        return
+    if args.record and args.command in ("start", "daemon"):
+        helper.start_recording(args.record)
     
     if args.command == "start":
-        if helper.start():
+        if helper.start(args.engine):
+            helper.serve_control(args.socket)
             try:
                 # Keep main thread alive
                 while helper.is_running:
                     time.sleep(1)
             except KeyboardInterrupt:
                 helper.stop()
+            finally:
+                helper.stop_control()
     
     elif args.command == "daemon":
         print("Starting as daemon...")
         helper.enable()  # Ensure it's enabled
-        if helper.start():
+        if helper.start(args.engine):
+            helper.serve_control(args.socket)
             try:
-                # Run indefinitely as daemon
-                while True:
-                    time.sleep(10)
+                # Run until stopped over the control socket or by a signal
+                while helper.is_running:
+                    time.sleep(1)
             except KeyboardInterrupt:
                 helper.stop()
-    
-    elif args.command == "stop":
-        helper.stop()
+            finally:
+                helper.stop_control()
     
     elif args.command == "enable":
         helper.enable()
@@ -458,14 +4908,23 @@ def main():
     elif args.command == "disable":
         helper.disable()
     
-    elif args.command == "status":
-        helper.status()
-    
     elif args.command == "configure":
-        if not args.config_key or not args.config_value:
+        # An empty value is valid: it turns record_file and schedule_file off
+        if not args.config_key or args.config_value is None:
             print("Configure command requires --config-key and --config-value")
             return
         helper.configure(args.config_key, args.config_value)
+    
+    elif args.command == "replay":
+        if not args.trace:
+            print("Replay command requires --trace")
+            return
+        try:
+            report = replay_trace(helper, os.path.expanduser(args.trace), realtime=args.realtime)
+        except (OSError, ValueError) as e:
+            print(f"Cannot replay {args.trace}: {e}")
+            return
+        print("\n".join(format_replay(report)))
 
 
 if __name__ == "__main__":
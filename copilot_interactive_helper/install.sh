@@ -29,7 +29,10 @@ sed "s|__SCRIPT_PATH__|$INSTALL_DIR|g" "$SCRIPT_DIR/com.copilot.helper.plist" >
 echo "🔗 Creating command-line wrapper..."
 cat > "$INSTALL_DIR/copilot-helper" << EOF
 #!/bin/bash
-exec python3 "$INSTALL_DIR/copilot_helper.py" "\$@"
+# Run as a module so Python reuses the compiled bytecode instead of recompiling on every call.
+# The install directory goes on sys.path in this process only: exporting PYTHONPATH would
+# leak into every child and shadow any other copilot_helper module they import.
+exec python3 -c 'import runpy, sys; sys.path.insert(0, sys.argv.pop(1)); runpy.run_module("copilot_helper", run_name="__main__", alter_sys=True)' "$INSTALL_DIR" "\$@"
 EOF
 chmod +x "$INSTALL_DIR/copilot-helper"
 
@@ -2,6 +2,7 @@ import * as vscode from 'vscode';
 import { exec, spawn, ChildProcess } from 'child_process';
 import * as path from 'path';
 import * as fs from 'fs';
+import * as net from 'net';
 
 export class CopilotHelperExtension {
     private statusBarItem: vscode.StatusBarItem;
@@ -66,6 +67,53 @@ export class CopilotHelperExtension {
         });
     }
 
+    // A path setting from the helper's config file or its default, with `~` expanded as config_file_path does
+    private getConfigPath(key: string, fallback: string): string {
+        const home = process.env.HOME || '';
+        let value = fallback;
+        try {
+            const config = JSON.parse(fs.readFileSync(path.join(home, '.copilot_helper_config.json'), 'utf8'));
+            if (typeof config[key] === 'string') {
+                value = config[key];
+            }
+        } catch (error) {
+            // No config file yet (or an unreadable one): the helper uses its defaults too
+        }
+        return value === '~' || value.startsWith('~/') ? path.join(home, value.slice(1)) : value;
+    }
+
+    private getControlSocketPath(): string {
+        return this.getConfigPath('control_socket', '~/.copilot_helper.sock');
+    }
+
+    // Ask the running daemon directly over its control socket (no CLI spawn)
+    private async queryDaemon(command: string): Promise<any> {
+        return new Promise((resolve, reject) => {
+            const socket = net.createConnection(this.getControlSocketPath());
+            let data = '';
+            socket.setTimeout(1000);
+            socket.on('connect', () => socket.write(JSON.stringify({ command }) + '\n'));
+            socket.on('data', (chunk) => { data += chunk.toString(); });
+            socket.on('end', () => {
+                try {
+                    const response = JSON.parse(data);
+                    if (response.ok) {
+                        resolve(response.result);
+                    } else {
+                        reject(new Error(response.error));
+                    }
+                } catch (error) {
+                    reject(error);
+                }
+            });
+            socket.on('timeout', () => {
+                socket.destroy();
+                reject(new Error('Control socket timed out'));
+            });
+            socket.on('error', reject);
+        });
+    }
+
     private async enableHelper() {
         try {
             await this.executeHelper(['enable']);
@@ -141,7 +189,7 @@ export class CopilotHelperExtension {
     }
 
     private async showLogs() {
-        const logPath = path.join(process.env.HOME || '', '.copilot_helper_logs', 'copilot_helper.log');
+        const logPath = path.join(this.getConfigPath('log_dir', '~/.copilot_helper_logs'), 'copilot_helper.log');
         
         if (fs.existsSync(logPath)) {
             const document = await vscode.workspace.openTextDocument(logPath);
@@ -165,9 +213,18 @@ export class CopilotHelperExtension {
 
     private async updateStatus() {
         try {
-            const statusOutput = await this.executeHelper(['status']);
-            const enabled = statusOutput.includes('Enabled');
-            const running = this.helperProcess !== null || statusOutput.includes('Running: Yes');
+            let enabled: boolean;
+            let running: boolean;
+            try {
+                const report = await this.queryDaemon('status');
+                enabled = report.enabled;
+                running = report.running;
+            } catch {
+                // No daemon listening: fall back to the CLI
+                const statusOutput = await this.executeHelper(['status']);
+                enabled = statusOutput.includes('Enabled');
+                running = this.helperProcess !== null || statusOutput.includes('Running: Yes');
+            }
 
             if (enabled && running) {
                 this.statusBarItem.text = '$(robot) Helper Active';
@@ -0,0 +1,1751 @@
+#!/usr/bin/env python3
+"""
+Unit tests for Copilot Helper
+
+Run with pytest on any machine: the helper watches a simulated desktop, so
+nothing here needs osascript or a GUI session.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import shutil
+import socket
+import stat
+import sys
+import time
+
+import pytest
+
+import copilot_helper
+from copilot_helper import (
+    SCRIPT_TEMPLATES, TIMEOUT_MESSAGE, AsyncMonitorEngine, AuditStore, BudgetGovernor, CompiledScriptCache,
+    ControlClient, ControlError, ControlServer, CopilotHelper, DecisionCache, DialogWindow, FakeSessionSource,
+    FrequencyScheduler, GUISession, Histogram, IncrementalScanner, LogPipeline, LoginWindowSessionSource, Metrics,
+    PinnedSessionResolver, PollingScheduler, ProcessHealthTracker, ProcessTable, RepeatFilter, ReplayBackend,
+    RuleTable, ScriptHostWorker, ScriptTemplate, SessionResolver, SessionSupervisor, SimulatedDesktop, _LazyModule,
+    aggregate_audit, open_audit, parse_dialog_snapshot, parse_window_titles, query_audit, read_config_cached
+)
+
+
+class SimClock:
+    """Manually advanced clock"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class LingeringDesktop(SimulatedDesktop):
+    """Simulated desktop whose clicks succeed without closing the window"""
+
+    def click(self, window, button_name):
+        self._query([window.process])
+        self.clicks.append((self.clock(), window.process, window.title, button_name))
+        return True
+
+
+def make_helper(tmp_path, desktop, clock=None, command_runner=None, session_resolver=None, script_host_factory=None,
+                script_cache=None, **overrides):
+    """Helper watching a simulated desktop, with every file it writes under tmp_path"""
+    config = dict(CopilotHelper.isolated_config(str(tmp_path)), enabled=True, ui_backend="simulated",
+                  process_prefilter=False, click_cooldown=0.0)
+    config.update(overrides)
+    config_file = os.path.join(str(tmp_path), "config.json")
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+    return CopilotHelper(config_file, session_resolver=session_resolver, command_runner=command_runner,
+                         script_host_factory=script_host_factory, script_cache=script_cache, backend=desktop,
+                         clock=clock)
+
+
+@pytest.fixture
+def desktop():
+    desktop = SimulatedDesktop()
+    desktop.launch("Terminal")
+    return desktop
+
+
+def clicked_titles(desktop):
+    return [title for _, _, title, _ in desktop.clicks]
+
+
+def test_identical_dialog_after_a_click_is_clicked(tmp_path, desktop):
+    helper = make_helper(tmp_path, desktop, click_dedup_ttl=60.0)
+    desktop.open_window("Terminal", "Run command?", ["Cancel", "Continue"])
+    assert helper.run_tick() == 1
+    assert helper.run_tick() == 0
+
+    # Same process, title and buttons, well within click_dedup_ttl
+    desktop.open_window("Terminal", "Run command?", ["Cancel", "Continue"])
+    assert helper.run_tick() == 1
+    assert clicked_titles(desktop) == ["Run command?", "Run command?"]
+
+
+def test_lingering_clicked_window_is_not_clicked_again(tmp_path):
+    desktop = LingeringDesktop()
+    desktop.launch("Terminal")
+    helper = make_helper(tmp_path, desktop, click_dedup_ttl=60.0)
+    desktop.open_window("Terminal", "Run command?", ["Cancel", "Continue"])
+    assert helper.run_tick() == 1
+    assert helper.run_tick() == 0
+    assert len(desktop.clicks) == 1
+
+
+def test_async_engine_clicks_identical_dialog_after_a_click(tmp_path, desktop):
+    helper = make_helper(tmp_path, desktop, click_dedup_ttl=60.0)
+    engine = AsyncMonitorEngine(helper)
+    desktop.open_window("Terminal", "Run command?", ["Cancel", "Continue"])
+    assert asyncio.run(engine.run_tick()) == 1
+    assert asyncio.run(engine.run_tick()) == 0
+    desktop.open_window("Terminal", "Run command?", ["Cancel", "Continue"])
+    assert asyncio.run(engine.run_tick()) == 1
+
+
+def test_forget_dismissed_keeps_other_processes_and_ignores():
+    cache = DecisionCache(click_ttl=60.0, ttl=60.0)
+    clicked = DialogWindow("Terminal", "Run command?", 1, ("Cancel", "Continue"))
+    elsewhere = DialogWindow("iTerm2", "Run command?", 1, ("Cancel", "Continue"))
+    ignored = DialogWindow("Terminal", "Save?", 2, ("Don't Save", "Save"))
+    cache.record(clicked, DecisionCache.CLICKED)
+    cache.record(elsewhere, DecisionCache.CLICKED)
+    cache.record(ignored, DecisionCache.IGNORE)
+
+    cache.forget_dismissed(["Terminal"], [])
+    assert cache.get(clicked) is None
+    assert cache.get(elsewhere) == DecisionCache.CLICKED
+    assert cache.get(ignored) == DecisionCache.IGNORE
+
+
+def test_control_server_refuses_to_replace_a_regular_file(tmp_path):
+    path = str(tmp_path / "control.sock")
+    with open(path, "w") as f:
+        f.write("not a socket")
+    with pytest.raises(ControlError):
+        ControlServer(path, {}).start()
+    with open(path) as f:
+        assert f.read() == "not a socket"
+
+
+def test_control_server_socket_is_owner_only_and_replaces_stale_sockets(tmp_path):
+    path = str(tmp_path / "control.sock")
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(path)
+    stale.close()
+
+    server = ControlServer(path, {"ping": lambda request: "pong"})
+    umask = os.umask(0o022)
+    try:
+        server.start()
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(umask)
+    try:
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        assert ControlClient(path).request("ping") == "pong"
+        assert os.listdir(str(tmp_path)) == ["control.sock"]
+    finally:
+        server.stop()
+
+
+@pytest.mark.parametrize("incremental", [True, False])
+def test_process_with_failing_queries_is_quarantined_in_snapshot_mode(tmp_path, desktop, incremental):
+    desktop.launch("Broken App")
+    desktop.fail("Broken App")
+    desktop.open_window("Broken App", "Allow?", ["Deny", "Allow"])
+    helper = make_helper(tmp_path, desktop, incremental_scan=incremental, circuit_failure_threshold=3,
+                         process_rules={"Broken App": {"allow": True}})
+    for _ in range(3):
+        helper.run_tick()
+    assert helper.health.state("Broken App") == ProcessHealthTracker.OPEN
+    assert helper.health.state("Terminal") == ProcessHealthTracker.CLOSED
+    assert "Broken App" not in helper.tick_targets()
+
+    # Healthy processes are still served while the broken one is quarantined
+    desktop.open_window("Terminal", "Run command?", ["Cancel", "Continue"])
+    assert helper.run_tick() == 1
+
+
+def test_async_probe_counts_reported_errors_as_failures(tmp_path, desktop):
+    desktop.fail("Terminal")
+    helper = make_helper(tmp_path, desktop, circuit_failure_threshold=2)
+    engine = AsyncMonitorEngine(helper)
+    for _ in range(2):
+        asyncio.run(engine.run_tick())
+    assert helper.health.state("Terminal") == ProcessHealthTracker.OPEN
+
+
+def test_scan_script_output_carries_per_process_errors():
+    snapshot = parse_dialog_snapshot(json.dumps({
+        "windows": [["Terminal", "Run command?", 1, ["Cancel", "Continue"]]],
+        "errors": {"Broken App": "Error: Invalid index. (-1719)"}
+    }))
+    assert snapshot == [DialogWindow("Terminal", "Run command?", 1, ("Cancel", "Continue"))]
+    assert snapshot.errors == {"Broken App": "Error: Invalid index. (-1719)"}
+
+    titles = parse_window_titles(json.dumps({"titles": {"Terminal": ["Run command?"]},
+                                             "errors": {"Broken App": "boom"}}))
+    assert titles == {"Terminal": ["Run command?"]}
+    assert titles.errors == {"Broken App": "boom"}
+
+
+def test_scan_script_output_without_errors_is_still_accepted():
+    assert parse_dialog_snapshot('[["Terminal", null, 2, ["OK"]]]') == [DialogWindow("Terminal", "", 2, ("OK",))]
+    assert parse_window_titles('{"Terminal": ["", "Run command?"]}') == {"Terminal": ["", "Run command?"]}
+    assert parse_dialog_snapshot("").errors == {}
+    with pytest.raises(ValueError):
+        parse_dialog_snapshot('"not rows"')
+
+
+def test_configure_with_an_empty_record_file_stops_recording(tmp_path, desktop, monkeypatch):
+    trace = str(tmp_path / "trace.ndjson")
+    helper = make_helper(tmp_path, desktop, record_file=trace)
+    helper.is_running = True
+    assert helper.start_recording(trace)
+
+    monkeypatch.setattr(sys, "argv", ["copilot_helper.py", "configure", "--config", helper.config_file,
+                                      "--config-key", "record_file", "--config-value", ""])
+    copilot_helper.main()
+    with open(helper.config_file) as f:
+        assert json.load(f)["record_file"] == ""
+
+    # A running monitor applies it at its next tick, without a restart
+    assert helper.reload_config()
+    helper.poll_config()
+    assert helper.recorder is None
+
+
+def test_configure_rejects_empty_values_for_other_keys(tmp_path, desktop):
+    helper = make_helper(tmp_path, desktop)
+    helper.configure("check_interval", "")
+    helper.configure("auto_approve", "")
+    assert helper.config["check_interval"] == 0.5
+    assert helper.config["auto_approve"] is True
+
+
+def test_configure_parses_numeric_keys_as_numbers(tmp_path, desktop, capsys):
+    helper = make_helper(tmp_path, desktop)
+    helper.configure("cpu_budget_percent", "25")
+    helper.configure("audit_retention_days", "7.5")
+    helper.configure("spawn_budget_per_minute", "many")
+    assert helper.config["cpu_budget_percent"] == 25.0
+    assert helper.config["audit_retention_days"] == 7.5
+    assert helper.config["spawn_budget_per_minute"] == 0.0
+    assert "spawn_budget_per_minute must be a number" in capsys.readouterr().out
+
+
+def test_simulated_batched_click_matches_names_like_applescript(desktop):
+    desktop.open_window("Terminal", "Run command?", ["Cancel", "Continue"])
+    desktop.open_window("Terminal", "Allow access?", ["Deny", "Allow"])
+    assert desktop.click_first(["Terminal"], ["continue"]) == [("Terminal", "continue", "Run command?")]
+    # AppleScript ignores case but considers white space
+    assert desktop.click_first(["Terminal"], ["Allow ", " allow"]) == []
+    assert desktop.click_first(["Terminal"], ["ALLOW"]) == [("Terminal", "ALLOW", "Allow access?")]
+    assert [button for _, _, _, button in desktop.clicks] == ["Continue", "Allow"]
+    assert desktop.windows("Terminal") == []
+
+
+def test_simulated_click_matches_names_like_click_first(desktop):
+    desktop.open_window("Terminal", "Run command?", ["Cancel", "Continue"])
+    window = desktop.snapshot(["Terminal"])[0]
+    assert not desktop.click(window, "Continue ")
+    assert not desktop.click(window._replace(title="Other"), "Continue")
+    assert desktop.click(window, "CONTINUE")
+    assert desktop.clicks[-1][1:] == ("Terminal", "Run command?", "Continue")
+    assert desktop.windows("Terminal") == []
+
+
+def test_replayed_batched_click_matches_names_like_applescript():
+    backend = ReplayBackend()
+    window = DialogWindow("Terminal", "Run command?", 1, ("Cancel", "Continue"))
+    backend.load(0.0, ["Terminal"], [window], [])
+    assert backend.click_first(["Terminal"], ["Allow", " CONTINUE"]) == []
+    assert backend.click_first(["Terminal"], ["Allow", "CONTINUE"]) == [("Terminal", "CONTINUE", "Run command?")]
+    assert backend.clicks == [("Terminal", "Run command?", "Continue")]
+
+
+def test_idle_interval_backs_off_geometrically_up_to_the_maximum():
+    scheduler = PollingScheduler(base_interval=0.5, max_interval=2.0, idle_backoff=2.0, clock=SimClock())
+    intervals = []
+    for _ in range(4):
+        intervals.append(scheduler.next_interval())
+        scheduler.record_tick(detected=False)
+    assert intervals == [0.5, 1.0, 2.0, 2.0]
+    scheduler.record_tick(detected=True)
+    assert scheduler.next_interval() == 0.5
+
+
+def test_very_long_idle_stretch_stays_at_the_maximum():
+    scheduler = PollingScheduler(base_interval=0.5, max_interval=2.0, idle_backoff=10.0, clock=SimClock())
+    scheduler.idle_ticks = 10_000
+    assert scheduler.next_interval() == 2.0
+
+
+def test_click_enters_burst_mode_for_the_burst_window():
+    clock = SimClock()
+    scheduler = PollingScheduler(base_interval=0.5, max_interval=2.0, burst_interval=0.1, burst_window=5.0,
+                                 clock=clock)
+    for _ in range(3):
+        scheduler.record_tick(detected=False)
+    scheduler.record_click("Code")
+    assert scheduler.idle_ticks == 0
+    assert scheduler.next_interval() == 0.1
+    clock.advance(4.9)
+    assert scheduler.next_interval() == 0.1
+    clock.advance(0.1)
+    assert scheduler.next_interval() == 0.5
+
+
+def test_longest_interval_covers_a_tick_that_finds_nothing():
+    scheduler = PollingScheduler(base_interval=0.5, max_interval=2.0, idle_backoff=2.0, clock=SimClock())
+    assert scheduler.longest_interval() == 1.0
+    scheduler.record_click("Code")
+    assert scheduler.longest_interval() == 1.0
+
+
+def test_only_the_clicked_process_cools_down():
+    clock = SimClock()
+    scheduler = PollingScheduler(click_cooldown=0.5, clock=clock)
+    scheduler.record_click("Code")
+    assert scheduler.is_cooling_down("Code")
+    assert not scheduler.is_cooling_down("Terminal")
+    clock.advance(0.5)
+    assert not scheduler.is_cooling_down("Code")
+
+
+def test_reconfigure_keeps_backoff_and_cooldowns():
+    clock = SimClock()
+    scheduler = PollingScheduler(base_interval=0.5, max_interval=2.0, idle_backoff=2.0, click_cooldown=1.0,
+                                 clock=clock)
+    scheduler.record_click("Code")
+    scheduler.record_tick(detected=False)
+    scheduler.reconfigure({"check_interval": 0.25, "max_interval": 4.0, "idle_backoff": 2.0})
+    assert scheduler.idle_ticks == 1
+    assert scheduler.is_cooling_down("Code")
+    clock.advance(5.0)
+    assert scheduler.next_interval() == 0.5
+
+
+def test_circuit_opens_after_consecutive_failures_and_closes_on_success():
+    clock = SimClock()
+    health = ProcessHealthTracker(failure_threshold=3, timeout_threshold=2, quarantine=5.0, clock=clock)
+    health.record_failure("Xcode")
+    health.record_failure("Xcode")
+    health.record_success("Xcode")
+    health.record_failure("Xcode")
+    health.record_failure("Xcode")
+    assert health.state("Xcode") == ProcessHealthTracker.CLOSED
+    health.record_failure("Xcode")
+    assert health.state("Xcode") == ProcessHealthTracker.OPEN
+    assert not health.allow("Xcode")
+
+    clock.now = 5.0
+    assert health.allow("Xcode")
+    assert health.state("Xcode") == ProcessHealthTracker.HALF_OPEN
+    health.record_success("Xcode")
+    assert health.state("Xcode") == ProcessHealthTracker.CLOSED
+    assert health.allow("Xcode")
+
+
+def test_timeouts_open_the_circuit_sooner_than_failures():
+    health = ProcessHealthTracker(failure_threshold=3, timeout_threshold=2, clock=SimClock())
+    health.record_failure("Hung App", timed_out=True)
+    assert health.state("Hung App") == ProcessHealthTracker.CLOSED
+    health.record_failure("Hung App", timed_out=True)
+    assert health.state("Hung App") == ProcessHealthTracker.OPEN
+    assert health.snapshot()["Hung App"]["total_timeouts"] == 2
+
+
+def test_failed_trial_probe_doubles_the_quarantine_up_to_the_maximum():
+    clock = SimClock()
+    health = ProcessHealthTracker(failure_threshold=1, quarantine=5.0, max_quarantine=12.0, clock=clock)
+    health.record_failure("Hung App")
+    for wait in (5.0, 10.0, 12.0, 12.0):
+        clock.now += wait - 0.001
+        assert not health.allow("Hung App")
+        clock.now += 0.001
+        assert health.allow("Hung App")
+        health.record_failure("Hung App")
+        assert health.state("Hung App") == ProcessHealthTracker.OPEN
+
+
+def test_hung_process_is_isolated_from_a_combined_snapshot(tmp_path):
+    clock = SimClock()
+    desktop = SimulatedDesktop(timeout=10.0, clock=clock, sleep=clock.advance)
+    desktop.launch("Terminal")
+    desktop.launch("Hung App")
+    desktop.hang("Hung App")
+    helper = make_helper(tmp_path, desktop, clock=clock, circuit_timeout_threshold=1,
+                         process_rules={"Hung App": {"allow": True}})
+    helper.run_tick()
+    assert helper.health.state("Hung App") == ProcessHealthTracker.OPEN
+    assert helper.health.state("Terminal") == ProcessHealthTracker.CLOSED
+
+
+def test_rules_resolve_in_configured_priority_order():
+    table = RuleTable(["Allow", "re:Continue( anyway)?", "glob:Open*", "OK"])
+    assert table.choose(("OK", "Open file", "Allow")) == "Allow"
+    assert table.choose(("OK", "Open file")) == "Open file"
+    assert table.choose(("OK", "Continue anyway")) == "Continue anyway"
+    assert table.choose(("Cancel", "Don't Allow")) is None
+    assert table.literals == ["Allow", "OK"]
+
+
+def test_normalized_rules_ignore_case_and_spacing():
+    table = RuleTable(["Allow", "glob:Always  allow*", "re:Keep  ?going"])
+    assert table.choose(("Deny", "  allow ")) == "  allow "
+    assert table.choose(("ALWAYS ALLOW once",)) == "ALWAYS ALLOW once"
+    assert table.choose(("Always  allow  once",)) == "Always  allow  once"
+    assert table.choose(("keep going",)) == "keep going"
+    assert table.choose(("Keepgoing",)) is None
+
+
+def test_exact_rules_compare_names_as_shown():
+    table = RuleTable(["Allow", "glob:Allow  *"], normalized=False)
+    assert table.choose(("allow", "Allow once")) is None
+    assert table.choose(("Allow once", "Allow  once")) == "Allow  once"
+    assert table.choose(("Deny", "Allow")) == "Allow"
+
+
+def test_patterns_match_the_whole_name():
+    table = RuleTable(["re:Yes", "glob:Install"])
+    assert table.choose(("Yes please",)) is None
+    assert table.choose(("Reinstall",)) is None
+    assert table.choose(("yes",)) == "yes"
+
+
+def test_patterns_without_a_literal_prefix_still_match():
+    table = RuleTable(["re:(Allow|Grant)", "glob:*Later", "re:.?Trust"])
+    assert table.choose(("Grant",)) == "Grant"
+    assert table.choose(("Remind Me Later",)) == "Remind Me Later"
+    assert table.choose(("Trust",)) == "Trust"
+    assert table.choose(("Deny",)) is None
+
+
+def test_optional_last_prefix_character_does_not_hide_matches():
+    table = RuleTable(["re:Continues?", "re:Ok{0,1}"])
+    assert table.choose(("Continue",)) == "Continue"
+    assert table.choose(("O",)) == "O"
+
+
+def test_invalid_rules_are_reported_and_skipped():
+    table = RuleTable(["re:(unclosed", "OK"])
+    assert table.choose(("OK",)) == "OK"
+    assert len(table.errors) == 1 and "re:(unclosed" in table.errors[0]
+    assert not RuleTable(["re:["])
+
+
+def test_process_rules_override_buttons_and_targets(tmp_path, desktop):
+    helper = make_helper(tmp_path, desktop, auto_deny=True,
+                         process_rules={"Xcode": {"allow": True, "buttons": ["Trust", "glob:Open*"]},
+                                        "Terminal": {"allow": False}})
+    rules = helper.snapshot.rules
+    dialog = DialogWindow("iTerm2", "Confirm", 1, ("Cancel", "Continue"))
+    assert rules.choose(dialog) == "Continue"
+    assert rules.choose(dialog._replace(buttons=("cancel ",))) == "cancel "
+    assert rules.choose(DialogWindow("Xcode", "Trust", 1, ("Don't Trust", "Open anyway"))) == "Open anyway"
+    assert rules.targets(["Terminal", "iTerm2"]) == ["iTerm2", "Xcode"]
+
+
+@pytest.mark.parametrize("batch_scope", ["tick", "process"])
+def test_batched_mode_snapshot_scans_processes_with_pattern_rules(tmp_path, desktop, monkeypatch, batch_scope):
+    desktop.launch("Xcode")
+    helper = make_helper(tmp_path, desktop, scan_mode="batched", batch_scope=batch_scope,
+                         process_rules={"Xcode": {"allow": True, "buttons": ["Trust", "glob:Open*"]}})
+    helper.is_running = True
+    batched = []
+    click_first = desktop.click_first
+    monkeypatch.setattr(desktop, "click_first",
+                        lambda names, buttons: batched.extend(names) or click_first(names, buttons))
+
+    desktop.open_window("Xcode", "Open project?", ["Cancel", "Open anyway"])
+    desktop.open_window("Terminal", "Run command?", ["Cancel", "Continue"])
+    assert helper.run_tick() == 2
+    assert sorted(clicked_titles(desktop)) == ["Open project?", "Run command?"]
+    assert "Terminal" in batched and "Xcode" not in batched
+
+
+def test_decisions_expire_after_their_ttl():
+    clock = SimClock()
+    cache = DecisionCache(ttl=300.0, click_ttl=2.0, clock=clock)
+    ignored = DialogWindow("Terminal", "Log", 1, ("Help", "Details"))
+    clicked = DialogWindow("Terminal", "Run command?", 2, ("Cancel", "Continue"))
+    cache.record(ignored, DecisionCache.IGNORE)
+    cache.record(clicked, DecisionCache.CLICKED)
+    assert cache.is_ignored(ignored) and not cache.is_ignored(clicked)
+
+    clock.now = 2.0
+    assert cache.get(clicked) is None
+    assert cache.get(ignored) == DecisionCache.IGNORE
+    clock.now = 300.0
+    assert not cache.is_ignored(ignored)
+    assert cache.get(ignored) is None
+    assert cache.stats()["expirations"] == 2
+
+
+def test_decisions_are_keyed_by_process_title_and_button_set():
+    cache = DecisionCache(clock=SimClock())
+    window = DialogWindow("Terminal", "Log", 1, ("Help", "Details"))
+    cache.record(window, DecisionCache.IGNORE)
+    assert cache.get(window._replace(index=3, buttons=("Details", "Help"))) == DecisionCache.IGNORE
+    assert cache.get(window._replace(title="Log 2")) is None
+    assert cache.get(window._replace(process="iTerm2")) is None
+    assert cache.get(window._replace(buttons=("Help", "Details", "OK"))) is None
+
+
+def test_least_recently_used_decisions_are_evicted_over_capacity():
+    cache = DecisionCache(capacity=2, clock=SimClock())
+    first, second, third = (DialogWindow("Terminal", f"Window {i}", 1, ("Help",)) for i in range(3))
+    cache.record(first, DecisionCache.IGNORE)
+    cache.record(second, DecisionCache.IGNORE)
+    assert cache.get(first) == DecisionCache.IGNORE  # second is now the least recently used
+    cache.record(third, DecisionCache.IGNORE)
+    assert cache.get(second) is None
+    assert cache.get(first) == DecisionCache.IGNORE and cache.get(third) == DecisionCache.IGNORE
+    assert cache.stats()["evictions"] == 1 and cache.stats()["entries"] == 2
+
+
+def test_zero_capacity_or_ttl_disables_the_cache():
+    window = DialogWindow("Terminal", "Log", 1, ("Help",))
+    for cache in (DecisionCache(capacity=0), DecisionCache(click_ttl=0.0)):
+        cache.record(window, DecisionCache.CLICKED)
+        assert cache.get(window) is None
+
+
+def test_reconfigure_forgets_every_decision():
+    clock = SimClock()
+    cache = DecisionCache(clock=clock)
+    window = DialogWindow("Terminal", "Log", 1, ("Help",))
+    cache.record(window, DecisionCache.IGNORE)
+    cache.reconfigure({"decision_cache_size": 10, "decision_cache_ttl": 60.0, "click_dedup_ttl": 1.0})
+    assert cache.get(window) is None
+    assert (cache.capacity, cache.ttl, cache.click_ttl, cache.clock) == (10, 60.0, 1.0, clock)
+
+
+@pytest.fixture
+def audit_clock():
+    return SimClock(1_700_000_000.0)
+
+
+@pytest.fixture
+def audit_store(tmp_path, audit_clock):
+    store = AuditStore(str(tmp_path / "audit.db"), retention_days=0, flush_interval=60.0, batch_size=1000,
+                       clock=audit_clock)
+    yield store
+    store.close()
+
+
+def test_audit_rows_wait_for_one_batched_commit(audit_store, audit_clock):
+    audit_store.record("501", "Terminal", "Run command?", ("Cancel", "Continue"), "Continue", True, 0.25)
+    audit_clock.advance(1.0)
+    audit_store.record("501", "iTerm2", "Allow?", None, "Allow", False, None)
+    assert audit_store.written == 0 and audit_store.stats()["pending"] == 2
+
+    assert audit_store.flush()
+    assert (audit_store.written, audit_store.batches) == (2, 1)
+    connection = open_audit(audit_store.path)
+    rows = query_audit(connection)
+    connection.close()
+    assert [(row["process"], row["buttons"], row["clicked"], row["latency"]) for row in rows] == [
+        ("iTerm2", None, False, None), ("Terminal", ["Cancel", "Continue"], True, 0.25)]
+
+
+def test_a_full_audit_batch_is_committed_without_waiting(tmp_path):
+    store = AuditStore(str(tmp_path / "audit.db"), flush_interval=60.0, batch_size=3)
+    try:
+        for _ in range(3):
+            store.record("501", "Terminal", "Run command?", ("OK",), "OK", True, 0.1)
+        deadline = time.monotonic() + 5.0
+        while store.written < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert store.written == 3
+    finally:
+        store.close()
+
+
+def test_audit_rows_over_max_pending_are_dropped(tmp_path):
+    store = AuditStore(str(tmp_path / "audit.db"), flush_interval=60.0, batch_size=100, max_pending=5)
+    try:
+        for _ in range(8):
+            store.record("501", "Terminal", "Run command?", ("OK",), "OK", True, 0.1)
+        assert store.dropped == 3
+        assert store.flush() and store.written == 5
+    finally:
+        store.close()
+
+
+def test_audit_rollup_matches_the_raw_rows(audit_store, audit_clock):
+    for i in range(30):
+        audit_store.record("501", ("Terminal", "Xcode")[i % 2], "Run command?", ("Cancel", "Continue"), "Continue",
+                           i % 3 != 0, 0.1 * i)
+        audit_clock.advance(600.0)
+    assert audit_store.flush()
+    connection = open_audit(audit_store.path)
+    rolled = aggregate_audit(connection, "process")
+    raw = aggregate_audit(connection, "process", title="*")
+    connection.close()
+    assert [(g["key"], g["decisions"], g["clicked"]) for g in rolled] == [("Terminal", 15, 10), ("Xcode", 15, 10)]
+    assert [(g["key"], g["decisions"], g["clicked"]) for g in raw] == [("Terminal", 15, 10), ("Xcode", 15, 10)]
+    assert all(abs(a["avg_latency"] - b["avg_latency"]) < 1e-9 for a, b in zip(rolled, raw))
+
+
+def test_audit_pruning_deletes_rows_and_whole_hours_past_retention(audit_store, audit_clock):
+    start = audit_clock.now // 3600 * 3600
+    audit_clock.now = start
+    for _ in range(48):
+        audit_store.record("501", "Terminal", "Run command?", ("OK",), "OK", True, 0.1)
+        audit_clock.advance(3600.0)
+    assert audit_store.flush()
+
+    # A day's retention from 30 minutes into the last recorded hour
+    audit_store.retention_days = 1
+    audit_clock.now = start + 47 * 3600 + 1800
+    assert audit_store.prune() == 24
+    connection = open_audit(audit_store.path)
+    left = connection.execute("SELECT COUNT(*), MIN(ts) FROM decisions").fetchone()
+    buckets = connection.execute("SELECT MIN(bucket) FROM decision_rollup").fetchone()[0]
+    connection.close()
+    assert left[0] == 24 and left[1] == start + 24 * 3600
+    # The hour the cutoff falls in keeps its totals
+    assert buckets == start + 23 * 3600
+
+
+def test_closing_the_audit_store_commits_what_is_queued(tmp_path):
+    store = AuditStore(str(tmp_path / "audit.db"), flush_interval=60.0)
+    store.record("501", "Terminal", "Run command?", ("OK",), "OK", True, 0.1)
+    store.close()
+    assert store.written == 1
+
+
+def test_histogram_counts_each_value_in_the_first_bucket_at_or_above_it():
+    histogram = Histogram()
+    for value in (0.0001, Histogram.BOUNDS[0], Histogram.BOUNDS[3], 0.0004, 60.0):
+        histogram.observe(value)
+    assert histogram.counts[0] == 2
+    assert histogram.counts[2] == 1
+    assert histogram.counts[3] == 1
+    assert histogram.counts[-1] == 1
+    assert (histogram.count, histogram.max) == (5, 60.0)
+    assert histogram.sum == pytest.approx(0.0001 + Histogram.BOUNDS[0] + Histogram.BOUNDS[3] + 0.0004 + 60.0)
+
+
+def test_histogram_percentiles_stay_inside_the_observed_range():
+    histogram = Histogram()
+    for n in range(1, 101):
+        histogram.observe(n / 1000)
+    assert histogram.percentile(0.5) == pytest.approx(0.05, rel=0.2)
+    assert histogram.percentile(0.99) <= histogram.max == 0.1
+    assert Histogram().percentile(0.5) == 0.0
+
+
+def exposition_samples(text):
+    """Sample lines of a Prometheus exposition, by metric name and labels"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = value
+    return samples
+
+
+def test_rendered_exposition_has_cumulative_buckets_sums_and_counts():
+    metrics = Metrics(enabled=True)
+    metrics.count("ticks_total", amount=1_234_567)
+    metrics.count("clicks_total", 'Visual "Studio" Code')
+    for seconds in (0.0002, 0.001, 0.001, 20.0):
+        metrics.observe("tick_seconds", seconds)
+    text = metrics.render()
+    samples = exposition_samples(text)
+    assert "# TYPE copilot_helper_tick_seconds histogram" in text
+    assert samples["copilot_helper_ticks_total"] == "1234567"
+    assert samples['copilot_helper_clicks_total{process="Visual \\"Studio\\" Code"}'] == "1"
+    buckets = [(name, int(value)) for name, value in samples.items()
+               if name.startswith("copilot_helper_tick_seconds_bucket")]
+    assert len(buckets) == len(Histogram.BOUNDS) + 1
+    assert buckets[0] == ('copilot_helper_tick_seconds_bucket{le="0.00025"}', 1)
+    assert [count for _, count in buckets] == sorted(count for _, count in buckets)
+    assert buckets[-1] == ('copilot_helper_tick_seconds_bucket{le="+Inf"}', 4)
+    assert buckets[-2][1] == 3
+    assert samples["copilot_helper_tick_seconds_count"] == "4"
+    assert float(samples["copilot_helper_tick_seconds_sum"]) == pytest.approx(20.0022)
+    assert 'copilot_helper_child_cpu_seconds_total{mode="user"}' in samples
+
+
+def test_disabled_metrics_record_nothing(tmp_path):
+    metrics = Metrics()
+    metrics.count("ticks_total")
+    metrics.observe("tick_seconds", 0.1)
+    path = tmp_path / "metrics" / "copilot_helper.prom"
+    metrics.write(str(path))
+    samples = exposition_samples(path.read_text())
+    assert not any(name.startswith(("copilot_helper_ticks", "copilot_helper_tick_")) for name in samples)
+    assert os.listdir(str(path.parent)) == ["copilot_helper.prom"]
+
+
+def log_record(message, *args, level=logging.WARNING):
+    return logging.LogRecord("copilot_helper", level, __file__, 1, message, args, None)
+
+
+def test_repeats_within_the_window_are_counted_on_the_next_logged_message():
+    clock = SimClock()
+    repeats = RepeatFilter(window=10.0, clock=clock)
+    assert repeats.filter(log_record("Probe of %s failed", "Terminal"))
+    clock.advance(1.0)
+    assert not repeats.filter(log_record("Probe of %s failed", "Terminal"))
+    assert not repeats.filter(log_record("Probe of %s failed", "Terminal"))
+    assert repeats.filter(log_record("Probe of %s failed", "Code"))
+    assert repeats.suppressed == 2
+    clock.advance(10.0)
+    record = log_record("Probe of %s failed", "Terminal")
+    assert repeats.filter(record)
+    assert record.getMessage() == "Probe of Terminal failed (repeated 2 more times)"
+
+
+def test_repeats_are_keyed_by_level_and_a_zero_window_keeps_everything():
+    repeats = RepeatFilter(window=10.0, clock=SimClock())
+    assert repeats.filter(log_record("Slow tick", level=logging.INFO))
+    assert repeats.filter(log_record("Slow tick", level=logging.WARNING))
+    repeats.window = 0
+    assert repeats.filter(log_record("Slow tick", level=logging.INFO))
+    assert repeats.suppressed == 0
+
+
+def test_repeat_filter_tracks_at_most_max_keys_messages():
+    clock = SimClock()
+    repeats = RepeatFilter(window=10.0, max_keys=2, clock=clock)
+    for n in range(3):
+        repeats.filter(log_record("Message %d", n))
+    assert len(repeats._seen) <= 2
+    clock.advance(10.0)
+    repeats.filter(log_record("Message %d", 3))
+    repeats.filter(log_record("Message %d", 4))
+    assert list(repeats._seen) == [(logging.WARNING, "Message 3"), (logging.WARNING, "Message 4")]
+
+
+class CollectingHandler(logging.Handler):
+    """Handler that keeps the messages it is handed, and whether it was closed"""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.closed = False
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+
+class CountingArgument:
+    """Log argument that counts how often it is formatted"""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return "argument"
+
+
+@pytest.fixture
+def pipeline():
+    handler = CollectingHandler()
+    pipeline = LogPipeline([handler], repeat_window=10.0)
+    logger = logging.getLogger("copilot_helper.test_pipeline")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    pipeline.start(logger)
+    yield pipeline, handler, logger
+    pipeline.stop()
+
+
+def test_stopping_the_pipeline_writes_out_everything_queued(pipeline):
+    pipeline, handler, logger = pipeline
+    for n in range(100):
+        logger.info("Tick %d", n)
+    pipeline.stop()
+    assert handler.messages == ["Tick %d" % n for n in range(100)]
+    assert handler.closed
+    assert pipeline.handler not in logger.handlers
+    pipeline.stop()
+
+
+def test_pipeline_drops_repeats_before_queueing_them(pipeline):
+    pipeline, handler, logger = pipeline
+    for _ in range(5):
+        logger.warning("Accessibility query timed out")
+    pipeline.stop()
+    assert handler.messages == ["Accessibility query timed out"]
+    assert pipeline.repeats.suppressed == 4
+
+
+def test_records_below_the_log_level_are_never_formatted(pipeline):
+    pipeline, handler, logger = pipeline
+    argument = CountingArgument()
+    logger.debug("Snapshot: %s", argument)
+    assert argument.formatted == 0
+    logger.info("Clicked %s", argument)
+    pipeline.stop()
+    assert handler.messages == ["Clicked argument"]
+
+
+def write_config_file(path, config, mtime_ns):
+    path.write_text(json.dumps(config))
+    os.utime(str(path), ns=(mtime_ns, mtime_ns))
+
+
+def test_config_file_is_parsed_again_only_when_it_changes(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    write_config_file(path, {"check_interval": 0.5}, 1_000_000_000)
+    parses = []
+    load = json.load
+    monkeypatch.setattr(copilot_helper.json, "load", lambda f: parses.append(f.name) or load(f))
+
+    config = read_config_cached(str(path))
+    config["check_interval"] = 9.0
+    assert read_config_cached(str(path)) == {"check_interval": 0.5}
+    assert len(parses) == 1
+
+    # Same size, new mtime: an editor saving a one-character change
+    write_config_file(path, {"check_interval": 0.7}, 2_000_000_000)
+    assert read_config_cached(str(path)) == {"check_interval": 0.7}
+    assert len(parses) == 2
+
+
+def test_unreadable_config_files_are_reported(tmp_path):
+    with pytest.raises(OSError):
+        read_config_cached(str(tmp_path / "missing.json"))
+    path = tmp_path / "list.json"
+    path.write_text("[]")
+    with pytest.raises(ValueError, match="not a JSON object"):
+        read_config_cached(str(path))
+
+
+def test_lazy_modules_are_imported_on_first_use(tmp_path, monkeypatch):
+    (tmp_path / "lazy_probe_module.py").write_text("VALUE = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(copilot_helper, "lazy_probe_module", _LazyModule("lazy_probe_module"), raising=False)
+    assert "lazy_probe_module" not in sys.modules
+    try:
+        assert copilot_helper.lazy_probe_module.VALUE == 42
+        assert copilot_helper.lazy_probe_module is sys.modules["lazy_probe_module"]
+    finally:
+        sys.modules.pop("lazy_probe_module", None)
+
+
+def test_importing_the_helper_leaves_heavy_modules_unloaded():
+    probe = ("import sys, copilot_helper; "
+             "print(sorted(name for name in ('asyncio', 'multiprocessing', 'sqlite3', 'subprocess') "
+             "if name in sys.modules))")
+    result = copilot_helper.subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True,
+                                           cwd=os.path.dirname(copilot_helper.__file__), timeout=30)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def edit_config(helper, mtime, **changes):
+    """Rewrite the helper's config file as an editor would, stamping it with a distinct mtime"""
+    with open(helper.config_file) as f:
+        config = json.load(f)
+    config.update(changes)
+    with open(helper.config_file, "w") as f:
+        json.dump(config, f)
+    os.utime(helper.config_file, (mtime, mtime))
+
+
+def test_config_file_edit_swaps_in_a_new_snapshot_between_ticks(tmp_path, desktop):
+    clock = SimClock()
+    helper = make_helper(tmp_path, desktop, clock=clock, config_watch_interval=1.0)
+    helper.is_running = True
+    first = helper.poll_config()
+    assert first.generation == 1
+
+    edit_config(helper, 1_000_000, auto_deny=True)
+    # At most one stat() per config_watch_interval
+    assert helper.poll_config() is first
+    clock.advance(1.0)
+    second = helper.poll_config()
+    assert second.generation == 2 and second.config["auto_deny"] is True
+    assert "Cancel" in second.buttons and helper.config["auto_deny"] is True
+    clock.advance(1.0)
+    assert helper.poll_config() is second
+
+
+def test_button_list_is_recomputed_only_when_the_config_changes(tmp_path, desktop, monkeypatch):
+    clock = SimClock()
+    helper = make_helper(tmp_path, desktop, clock=clock, config_watch_interval=1.0)
+    helper.is_running = True
+    calls = []
+    compute = helper.get_all_buttons_to_click
+    monkeypatch.setattr(helper, "get_all_buttons_to_click", lambda config=None: calls.append(1) or compute(config))
+
+    def tick():
+        # As the monitor loop does: adopt any new config between ticks
+        clock.advance(1.0)
+        return helper.run_tick(helper.poll_config())
+
+    desktop.open_window("Terminal", "Run command?", ["Cancel", "Continue"])
+    assert sum(tick() for _ in range(5)) == 1
+    assert calls == []
+
+    edit_config(helper, 1_000_000, custom_positive_buttons=["Trust"])
+    desktop.open_window("Terminal", "Trust this folder?", ["Don't Trust", "Trust"])
+    assert tick() + tick() == 1
+    assert calls == [1] and "Trust" in helper.snapshot.buttons
+
+
+def test_configure_on_a_running_helper_applies_without_a_restart(tmp_path, desktop, monkeypatch, capsys):
+    helper = make_helper(tmp_path, desktop)
+    helper.is_running = True
+    monkeypatch.setattr(helper, "start", lambda *args: pytest.fail("configure restarted the helper"))
+    monkeypatch.setattr(helper, "stop", lambda: pytest.fail("configure stopped the helper"))
+
+    helper.configure("auto_deny", "true")
+    # Pending until the monitor loop reaches its next tick boundary
+    assert helper.snapshot.generation == 1 and helper.config["auto_deny"] is False
+    desktop.open_window("Terminal", "Delete file?", ["Cancel"])
+    assert helper.run_tick(helper.poll_config()) == 1
+    assert helper.is_running and helper.snapshot.generation == 2
+    assert "Configuration updated: auto_deny = True" in capsys.readouterr().out
+
+
+class BusyProbes:
+    """Drive a governor in simulated time, each admitted probe costing `cost` CPU seconds"""
+
+    TARGETS = ["Terminal", "iTerm2", "osascript", "SecurityAgent", "loginwindow"]
+
+    def __init__(self, cost=0.1, **budgets):
+        self.clock = SimClock()
+        self.cpu = 0.0
+        self.cost = cost
+        self.governor = BudgetGovernor(priority=["Terminal"], clock=self.clock, cpu_clock=lambda: self.cpu,
+                                       **budgets)
+        self.states = [self.governor.state]
+
+    def run(self, seconds, load=1.0):
+        usage = []
+        started = self.clock.now
+        while self.clock.now - started < seconds:
+            self.cpu += self.cost * len(self.governor.admit(self.TARGETS)) * load
+            self.clock.advance(self.governor.stretch_interval(0.5))
+            self.governor.sample()
+            usage.append((self.clock.now - started, self.governor.cpu_usage()))
+            if self.governor.state != self.states[-1]:
+                self.states.append(self.governor.state)
+        return usage
+
+
+def test_governor_sheds_then_stretches_and_relaxes_in_reverse():
+    probes = BusyProbes(cpu_percent=10.0, window=20.0, max_stretch=20.0)
+    assert probes.governor.admit(probes.TARGETS) == probes.TARGETS
+
+    probes.run(6.0)
+    assert probes.states == [BudgetGovernor.OK, BudgetGovernor.SHEDDING]
+    assert probes.governor.admit(probes.TARGETS) == ["Terminal"]
+    assert probes.governor.stretch_interval(0.5) == 0.5
+    assert probes.governor.dropped_probes > 0
+
+    probes.run(5.0)
+    assert probes.governor.state == BudgetGovernor.STRETCHING
+    assert 0.5 < probes.governor.stretch_interval(0.5) <= 0.5 * 20.0
+
+    probes.run(300.0, load=0.0)
+    assert probes.states == [BudgetGovernor.OK, BudgetGovernor.SHEDDING, BudgetGovernor.STRETCHING,
+                             BudgetGovernor.SHEDDING, BudgetGovernor.OK]
+    assert probes.governor.stretch_interval(0.5) == 0.5
+    assert probes.governor.admit(probes.TARGETS) == probes.TARGETS
+
+
+def test_governed_cpu_settles_within_the_budget():
+    # Ungoverned, five probes every half second would use 100% of a core
+    probes = BusyProbes(cpu_percent=10.0, window=20.0, max_stretch=20.0)
+    settled = [usage for at, usage in probes.run(300.0) if at > 150.0]
+    assert max(settled) <= 10.0 * 1.25
+
+
+def test_stretch_is_capped_by_max_stretch():
+    probes = BusyProbes(cost=1.0, cpu_percent=1.0, window=20.0, max_stretch=3.0)
+    probes.run(120.0)
+    assert probes.governor.stretch == 3.0
+    probes.governor.reconfigure({"cpu_budget_percent": 1.0, "budget_max_stretch": 2.0})
+    assert probes.governor.stretch_interval(0.5) == 1.0
+
+
+def test_budgets_are_off_by_default(tmp_path, desktop):
+    helper = make_helper(tmp_path, desktop)
+    assert not helper.governor.enabled
+    for _ in range(1000):
+        helper.governor.record_spawn()
+    helper.governor.sample()
+    assert helper.governor.state == BudgetGovernor.OK
+    assert helper.governor.admit(["Terminal", "Xcode"]) == ["Terminal", "Xcode"]
+
+
+class FakePsutil:
+    """psutil stand-in listing canned process names (None for processes it could not read)"""
+
+    def __init__(self, names):
+        self.names = names
+
+    def process_iter(self, attrs):
+        assert attrs == ["name"]
+        return [type("Process", (), {"info": {"name": name}})() for name in self.names]
+
+
+def fake_proc(root, processes):
+    """A /proc tree under root: pid -> (cmdline bytes, comm bytes)"""
+    for pid, (cmdline, comm) in processes.items():
+        entry = root / str(pid)
+        entry.mkdir(parents=True)
+        (entry / "cmdline").write_bytes(cmdline)
+        (entry / "comm").write_bytes(comm)
+    (root / "self").mkdir()
+    (root / "meminfo").write_text("MemTotal: 1 kB\n")
+    return root
+
+
+def refusing_runner(cmd, **kwargs):
+    raise AssertionError(f"unexpected command {cmd}")
+
+
+def test_process_table_prefers_psutil(tmp_path, monkeypatch):
+    psutil = FakePsutil(["Code", "Terminal", None, ""])
+    monkeypatch.setattr(copilot_helper, "optional_import", lambda name: psutil if name == "psutil" else None)
+    monkeypatch.setattr(ProcessTable, "PROC_ROOT", str(fake_proc(tmp_path / "proc", {1: (b"/sbin/launchd\0", b"")})))
+    table = ProcessTable(command_runner=refusing_runner)
+    assert table.snapshot() == {"Code", "Terminal"}
+    assert table.snapshots == 1
+
+
+def test_process_table_reads_proc_without_psutil(tmp_path, monkeypatch):
+    monkeypatch.setattr(copilot_helper, "optional_import", lambda name: None)
+    root = fake_proc(tmp_path / "proc", {
+        1: (b"/usr/lib/systemd/systemd\0--user\0", b"systemd\n"),
+        42: (b"/opt/Cursor/Cursor\0--type=renderer\0", b"Cursor\n"),
+        43: (b"", b"kworker/0:1\n"),
+        44: (b"Code Helper\0", b"Code Helper\n"),
+    })
+    (root / "45").mkdir()  # Exited between listdir() and open()
+    monkeypatch.setattr(ProcessTable, "PROC_ROOT", str(root))
+    table = ProcessTable(command_runner=refusing_runner)
+    assert table.snapshot() == {"systemd", "Cursor", "kworker/0:1", "Code Helper"}
+
+
+def test_process_table_falls_back_to_one_ps_listing(tmp_path, monkeypatch):
+    monkeypatch.setattr(copilot_helper, "optional_import", lambda name: None)
+    monkeypatch.setattr(ProcessTable, "PROC_ROOT", str(tmp_path / "no-proc"))
+    listings = []
+
+    def run(cmd, **kwargs):
+        listings.append(cmd)
+        listing = "/sbin/launchd\n/Applications/Cursor.app/Contents/MacOS/Cursor\n  \nTerminal\n"
+        return copilot_helper.subprocess.CompletedProcess(cmd, 0, stdout=listing, stderr="")
+
+    assert ProcessTable(command_runner=run).snapshot() == {"launchd", "Cursor", "Terminal"}
+    assert listings == [["ps", "-axo", "comm="]]
+
+
+def test_failed_ps_listing_raises(tmp_path, monkeypatch):
+    monkeypatch.setattr(copilot_helper, "optional_import", lambda name: None)
+    monkeypatch.setattr(ProcessTable, "PROC_ROOT", str(tmp_path / "no-proc"))
+    table = ProcessTable(command_runner=lambda cmd, **kwargs: copilot_helper.subprocess.CompletedProcess(
+        cmd, 1, stdout="", stderr="ps: permission denied\n"))
+    with pytest.raises(OSError, match="ps failed: ps: permission denied"):
+        table.snapshot()
+
+
+def test_process_table_listings_are_not_charged_to_the_spawn_budget(tmp_path, monkeypatch):
+    # macOS without psutil: the prefilter runs `ps` on every tick
+    monkeypatch.setattr(copilot_helper, "optional_import", lambda name: None)
+    monkeypatch.setattr(ProcessTable, "PROC_ROOT", str(tmp_path / "no-proc"))
+    listings = []
+
+    def run(cmd, **kwargs):
+        listings.append(cmd)
+        return copilot_helper.subprocess.CompletedProcess(cmd, 0, stdout="/usr/libexec/Cursor\n", stderr="")
+
+    clock = SimClock()
+    helper = make_helper(tmp_path, None, clock=clock, command_runner=run, ui_backend="applescript",
+                         process_prefilter=True, spawn_budget_per_minute=120.0)
+    helper.common_processes = ["Terminal", "Cursor"]
+    while clock.now < 60.0:
+        assert helper.tick_targets() == ["Cursor"]
+        clock.advance(0.1)
+        helper.governor.sample()
+    assert len(listings) == 600
+    assert helper.governor.spawn_rate() == 0.0 and helper.governor.state == BudgetGovernor.OK
+
+
+STAND_IN_HOST = r'''
+import json, sys, time
+
+# Answers each request with its script; "exit" kills the host and "sleep N" hangs it
+for line in sys.stdin:
+    request = json.loads(line)
+    script = request.get("script") or " ".join(request.get("args", []))
+    if script == "exit":
+        sys.stderr.write("host crashed\n")
+        sys.exit(3)
+    if script.startswith("sleep "):
+        time.sleep(float(script.split()[1]))
+    sys.stdout.write(json.dumps({"id": request["id"], "ok": True, "output": script}) + "\n")
+    sys.stdout.flush()
+'''
+
+
+@pytest.fixture
+def host_command(tmp_path):
+    path = tmp_path / "stand_in_host.py"
+    path.write_text(STAND_IN_HOST)
+    return [sys.executable, str(path)]
+
+
+def test_script_host_answers_requests_from_one_process(host_command):
+    worker = ScriptHostWorker(host_command, timeout=5.0)
+    try:
+        assert worker.request("first") == (True, "first")
+        assert worker.request("ignored", args=["second", "call"]) == (True, "ignored")
+        assert worker.request(None, args=["by", "argv"]) == (True, "by argv")
+        assert worker.spawns == 1 and worker.alive
+    finally:
+        worker.stop()
+    assert not worker.alive
+
+
+def test_script_host_that_dies_is_respawned_by_the_next_request(host_command):
+    worker = ScriptHostWorker(host_command, timeout=5.0)
+    try:
+        success, output = worker.request("exit")
+        assert not success and output.startswith("Script host exited") and "host crashed" in output
+        assert (worker.crashes, worker.consecutive_crashes) == (1, 1)
+        assert worker.request("after crash") == (True, "after crash")
+        assert worker.spawns == 2 and worker.consecutive_crashes == 0
+    finally:
+        worker.stop()
+
+
+def test_script_host_that_keeps_dying_is_reported_unhealthy(host_command):
+    worker = ScriptHostWorker(host_command, timeout=5.0, max_consecutive_crashes=2)
+    try:
+        worker.request("exit")
+        assert worker.healthy
+        worker.request("exit")
+        assert not worker.healthy
+    finally:
+        worker.stop()
+
+
+def test_hung_script_host_is_killed_and_replaced(host_command):
+    worker = ScriptHostWorker(host_command, timeout=0.3)
+    try:
+        started = time.monotonic()
+        assert worker.request("sleep 30") == (False, TIMEOUT_MESSAGE)
+        assert time.monotonic() - started < 5.0
+        assert worker.timeouts == 1 and worker.crashes == 0 and not worker.alive
+        assert worker.request("after timeout") == (True, "after timeout")
+        assert worker.spawns == 2
+    finally:
+        worker.stop()
+
+
+class SpawnRunner:
+    """Stand-in for spawning osascript: echoes the -e script"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, cmd, **kwargs):
+        self.calls.append(cmd)
+        return copilot_helper.subprocess.CompletedProcess(cmd, 0, stdout=cmd[cmd.index("-e") + 1], stderr="")
+
+
+def host_helper(tmp_path, desktop, host_command, timeout, **config):
+    runner = SpawnRunner()
+    helper = make_helper(tmp_path, desktop, command_runner=runner,
+                         session_resolver=PinnedSessionResolver(GUISession("tester", "501")),
+                         script_host_factory=lambda uid: ScriptHostWorker(host_command, timeout=timeout,
+                                                                          max_consecutive_crashes=1),
+                         script_host="worker", **config)
+    return helper, runner
+
+
+def test_helper_runs_scripts_in_the_host_and_spawns_once_it_is_down(tmp_path, desktop, host_command):
+    helper, runner = host_helper(tmp_path, desktop, host_command, timeout=5.0)
+    try:
+        assert helper.run_applescript_as_user("probe") == (True, "probe")
+        assert runner.calls == []
+
+        # The crash costs that request its host; it is spawned instead
+        assert helper.run_applescript_as_user("exit") == (True, "exit")
+        assert len(runner.calls) == 1 and runner.calls[0][:4] == ["launchctl", "asuser", "501", "/usr/bin/osascript"]
+        # With the host disabled after repeated crashes every script is spawned
+        assert helper.run_applescript_as_user("probe") == (True, "probe")
+        assert len(runner.calls) == 2 and helper.script_host.spawns == 1
+    finally:
+        helper.stop_script_host()
+
+
+def test_helper_reports_a_hung_host_request_and_replaces_the_host(tmp_path, desktop, host_command):
+    helper, runner = host_helper(tmp_path, desktop, host_command, timeout=0.3)
+    try:
+        assert helper.run_applescript_as_user("sleep 30") == (False, TIMEOUT_MESSAGE)
+        # Spawning the same script would hang just as long, so it is not retried
+        assert runner.calls == []
+        assert helper.run_applescript_as_user("probe") == (True, "probe")
+        assert helper.script_host.spawns == 2 and runner.calls == []
+    finally:
+        helper.stop_script_host()
+
+
+class FakeWorkerProcess:
+    """Stand-in for a session worker's multiprocessing.Process"""
+
+    pids = iter(range(10_000, 20_000))
+
+    def __init__(self, target, name, args, daemon):
+        self.session = args[1]
+        self.pid = next(self.pids)
+        self.exitcode = None
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def is_alive(self):
+        return self.running
+
+    def exit(self, code):
+        self.running, self.exitcode = False, code
+
+    def terminate(self):
+        self.exit(-15)
+
+    def kill(self):
+        self.exit(-9)
+
+    def join(self, timeout=None):
+        pass
+
+
+class FakeWorkerContext:
+    """multiprocessing context whose worker processes are FakeWorkerProcess objects"""
+
+    def __init__(self):
+        self.processes = []
+
+    def Process(self, **kwargs):
+        process = FakeWorkerProcess(**kwargs)
+        self.processes.append(process)
+        return process
+
+    def Queue(self):
+        return queue.Queue()
+
+
+@pytest.fixture
+def supervised(tmp_path):
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({"enabled": True}))
+    source = FakeSessionSource([GUISession("alice", "501"), GUISession("bob", "502")])
+    clock = SimClock()
+    context = FakeWorkerContext()
+    supervisor = SessionSupervisor(str(config_file), source, restart_delay=1.0, max_restart_delay=8.0,
+                                   clock=clock, context=context)
+    return supervisor, source, clock, context
+
+
+def running_sessions(supervisor):
+    return {uid: entry["process"].session.user for uid, entry in supervisor.workers.items()
+            if entry["process"] is not None and entry["process"].is_alive()}
+
+
+def test_supervisor_runs_one_worker_per_session(supervised):
+    supervisor, source, clock, context = supervised
+    supervisor.poll()
+    assert running_sessions(supervisor) == {"501": "alice", "502": "bob"}
+    clock.advance(1.0)
+    supervisor.poll()
+    assert supervisor.started == 2 and len(context.processes) == 2
+
+    source.login("carol", "503")
+    supervisor.poll()
+    assert running_sessions(supervisor) == {"501": "alice", "502": "bob", "503": "carol"}
+
+
+def test_worker_stops_when_its_session_ends(supervised):
+    supervisor, source, clock, context = supervised
+    supervisor.poll()
+    bob = supervisor.workers["502"]["process"]
+    source.logout("502")
+    supervisor.poll()
+    assert running_sessions(supervisor) == {"501": "alice"}
+    assert bob.exitcode == -15 and "502" not in supervisor.workers
+
+    supervisor.stop()
+    assert not any(process.is_alive() for process in context.processes)
+
+
+def test_crashed_worker_is_restarted_after_a_doubling_delay(supervised):
+    supervisor, source, clock, context = supervised
+    supervisor.poll()
+    bob = supervisor.workers["502"]["process"]
+    for delay in (1.0, 2.0, 4.0):
+        crashed = supervisor.workers["501"]["process"]
+        crashed.exit(1)
+        supervisor.poll()
+        assert "501" not in running_sessions(supervisor)
+        clock.advance(delay - 0.1)
+        supervisor.poll()
+        assert "501" not in running_sessions(supervisor)
+        clock.advance(0.1)
+        supervisor.poll()
+        assert running_sessions(supervisor)["501"] == "alice"
+        assert supervisor.workers["501"]["process"] is not crashed
+    assert supervisor.restarts == 3 and supervisor.workers["501"]["restarts"] == 3
+    # The other session's worker was left alone throughout
+    assert supervisor.workers["502"]["process"] is bob and bob.is_alive()
+
+
+def test_session_discovery_reads_loginwindow_owners_from_ps(monkeypatch):
+    monkeypatch.setattr(copilot_helper, "optional_import", lambda name: None)
+    loginwindow = "/System/Library/CoreServices/loginwindow.app/Contents/MacOS/loginwindow"
+    listing = "\n".join([
+        f"  0 root     {loginwindow}",  # The login screen, not a session
+        f"502 bob      {loginwindow}",
+        f"501 alice    {loginwindow}",
+        "501 alice    /System/Applications/Utilities/Terminal.app/Contents/MacOS/Terminal",
+        "503 carol    /usr/libexec/loginwindowhelper",
+        "garbage",
+    ]) + "\n"
+    commands = []
+
+    def run(cmd, **kwargs):
+        commands.append(cmd)
+        return copilot_helper.subprocess.CompletedProcess(cmd, 0, stdout=listing, stderr="")
+
+    assert LoginWindowSessionSource(run).sessions() == [GUISession("alice", "501"), GUISession("bob", "502")]
+    assert commands == [["ps", "-axo", "uid=,user=,comm="]]
+
+    failing = LoginWindowSessionSource(
+        lambda cmd, **kwargs: copilot_helper.subprocess.CompletedProcess(cmd, 1, stdout="", stderr="denied"))
+    with pytest.raises(OSError, match="denied"):
+        failing.sessions()
+
+
+class HangingDesktop(SimulatedDesktop):
+    """Simulated desktop whose async probes of `hung` processes never return"""
+
+    def __init__(self, hung):
+        super().__init__()
+        self.hung = set(hung)
+        self.cancelled = []
+
+    async def snapshot_async(self, process_names, timeout):
+        if self.hung.intersection(process_names):
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                self.cancelled.extend(process_names)
+                raise
+        return self.snapshot(process_names)
+
+    async def click_async(self, window, button_name, timeout):
+        return self.click(window, button_name)
+
+
+def test_async_engine_cancels_a_hung_probe_at_the_tick_deadline(tmp_path):
+    desktop = HangingDesktop(["Hung App"])
+    desktop.launch("Terminal")
+    desktop.launch("Hung App")
+    helper = make_helper(tmp_path, desktop, circuit_timeout_threshold=2, process_rules={"Hung App": {"allow": True}})
+    engine = AsyncMonitorEngine(helper, tick_deadline=0.1)
+    desktop.open_window("Terminal", "Run command?", ["Cancel", "Continue"])
+
+    # The healthy process is still served within the tick
+    assert asyncio.run(engine.run_tick()) == 1
+    assert desktop.cancelled == ["Hung App"] and engine.cancelled_probes == 1
+    assert helper.health.snapshot()["Hung App"]["total_timeouts"] == 1
+    assert helper.health.state("Terminal") == ProcessHealthTracker.CLOSED
+
+    # A second cancelled probe opens the circuit; later ticks no longer wait on the process
+    asyncio.run(engine.run_tick())
+    assert engine.cancelled_probes == 2
+    assert helper.health.state("Hung App") == ProcessHealthTracker.OPEN
+    assert asyncio.run(engine.run_tick()) == 0
+    assert engine.cancelled_probes == 2 and desktop.cancelled == ["Hung App", "Hung App"]
+
+
+@pytest.fixture
+def schedule_clock():
+    return SimClock(1_700_000_000.0)
+
+
+def make_schedule(clock, path=None):
+    return FrequencyScheduler(enabled=True, hot_hits=1.0, half_life=100.0, max_staleness=5.0, base_interval=0.5,
+                              path=path, clock=clock)
+
+
+def test_hits_decay_with_the_half_life(schedule_clock):
+    schedule = make_schedule(schedule_clock)
+    schedule.record_hit("Xcode")
+    assert schedule.score("Xcode") == 1.0 and schedule.interval("Xcode") == 0.0
+    schedule_clock.advance(100.0)
+    assert schedule.score("Xcode") == pytest.approx(0.5)
+    assert schedule.interval("Xcode") == pytest.approx(1.0)
+    schedule_clock.advance(100.0)
+    assert schedule.interval("Xcode") == pytest.approx(2.0)
+    schedule_clock.advance(1000.0)
+    assert schedule.interval("Xcode") == 5.0
+
+    # A new hit makes the process hot again at once
+    schedule.record_hit("Xcode")
+    assert schedule.interval("Xcode") == 0.0
+
+
+def test_every_target_is_scanned_until_something_is_learned(schedule_clock):
+    schedule = make_schedule(schedule_clock)
+    targets = ["Terminal", "Xcode"]
+    assert schedule.due(targets) == targets and schedule.due(targets) == targets
+    schedule.enabled = False
+    schedule.record_hit("Xcode")
+    assert schedule.due(targets) == targets
+
+
+def test_no_target_goes_longer_than_max_staleness_unscanned(schedule_clock):
+    schedule = make_schedule(schedule_clock)
+    schedule.record_hit("Xcode")
+    scans = {"Xcode": [], "Terminal": [], "Slack": []}
+    started = schedule_clock.now
+    while schedule_clock.now - started < 60.0:
+        for name in schedule.due(list(scans), horizon=0.5):
+            scans[name].append(schedule_clock.now)
+        schedule_clock.advance(0.5)
+
+    assert len(scans["Xcode"]) == 120  # Hot: every tick
+    for name in ("Terminal", "Slack"):
+        assert scans[name][0] == started  # Never scanned before: due at once
+        gaps = [b - a for a, b in zip(scans[name], scans[name][1:])]
+        assert max(gaps) <= 5.0 and len(scans[name]) < 20
+    assert schedule.skipped > 0
+
+
+def test_learned_counts_survive_a_restart(tmp_path, schedule_clock):
+    path = str(tmp_path / "schedule.json")
+    schedule = make_schedule(schedule_clock, path)
+    schedule.record_hit("Xcode")
+    schedule.maybe_save()
+    assert json.loads((tmp_path / "schedule.json").read_text())["processes"]["Xcode"]["hits"] == 1.0
+
+    # Later changes wait for SAVE_INTERVAL unless forced
+    schedule.record_hit("Terminal")
+    schedule.maybe_save()
+    assert "Terminal" not in json.loads((tmp_path / "schedule.json").read_text())["processes"]
+    schedule.maybe_save(force=True)
+
+    schedule_clock.advance(100.0)
+    restarted = make_schedule(schedule_clock, path)
+    restarted.load()
+    assert restarted.score("Xcode") == pytest.approx(0.5)
+    assert restarted.score("Terminal") == pytest.approx(0.5)
+
+
+def test_unreadable_schedule_file_starts_from_scratch(tmp_path, schedule_clock, caplog):
+    path = tmp_path / "schedule.json"
+    path.write_text('{"processes": ["not", "a", "mapping"]}')
+    schedule = make_schedule(schedule_clock, str(path))
+    schedule.load()
+    assert schedule.snapshot()["processes"] == {}
+    assert "Ignoring unreadable scan schedule" in caplog.text
+
+    missing = make_schedule(schedule_clock, str(tmp_path / "missing.json"))
+    missing.load()
+    assert missing.snapshot()["processes"] == {}
+
+
+def test_frequency_schedule_is_off_by_default(tmp_path, desktop):
+    config_file = tmp_path / "config.json"
+    config_file.write_text("{}")
+    assert not CopilotHelper(str(config_file), backend=desktop).frequency.enabled
+
+
+class RecordedDesktop:
+    """Window lists per process replayed frame by frame, logging what the scanner deep-scans"""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.frame = {}
+        self.deep_scanned = []
+
+    def show(self, number):
+        self.frame = self.frames[number]
+        self.deep_scanned.append(set())
+
+    def list_titles(self, process_names):
+        return {name: [title for title, _ in self.frame[name]] for name in process_names if name in self.frame}
+
+    def deep_scan(self, wanted):
+        windows = []
+        for name, indexes in wanted.items():
+            for index in indexes:
+                self.deep_scanned[-1].add((name, index))
+                title, buttons = self.frame[name][index - 1]
+                if buttons:
+                    windows.append(DialogWindow(name, title, index, buttons))
+        return windows
+
+    def truth(self):
+        return {DialogWindow(name, title, index, buttons) for name, windows in self.frame.items()
+                for index, (title, buttons) in enumerate(windows, 1) if buttons}
+
+
+RUN = ("Run command?", ("Cancel", "Continue"))
+LOG = ("Log", ())
+TRUST = ("Trust?", ("Don't Trust", "Trust"))
+
+# Recorded frames, with the (process, index) pairs each one must deep-scan
+WINDOW_SEQUENCE = [
+    ({"Terminal": [RUN], "Xcode": []}, {("Terminal", 1)}),
+    ({"Terminal": [RUN], "Xcode": []}, set()),
+    ({"Terminal": [RUN, LOG], "Xcode": []}, {("Terminal", 2)}),
+    # Closing the first window renumbers the second, which is then a new fingerprint
+    ({"Terminal": [LOG], "Xcode": []}, {("Terminal", 1)}),
+    ({"Terminal": [LOG], "Xcode": [TRUST]}, {("Xcode", 1)}),
+    ({"Terminal": [LOG], "Xcode": [TRUST, RUN]}, {("Xcode", 2)}),
+    ({"Terminal": [LOG, RUN], "Xcode": [RUN]}, {("Terminal", 2), ("Xcode", 1)}),
+    ({"Terminal": [LOG, RUN], "Xcode": [RUN]}, set()),
+]
+
+
+def test_incremental_scanner_rescans_only_new_windows_and_misses_none():
+    clock = SimClock()
+    desktop = RecordedDesktop([frame for frame, _ in WINDOW_SEQUENCE])
+    scanner = IncrementalScanner(desktop.list_titles, desktop.deep_scan, max_age=30.0, clock=clock)
+    for number, (_, rescanned) in enumerate(WINDOW_SEQUENCE):
+        desktop.show(number)
+        assert set(scanner.scan(["Terminal", "Xcode"])) == desktop.truth(), f"frame {number}"
+        assert desktop.deep_scanned[-1] == rescanned, f"frame {number}"
+        clock.advance(0.5)
+    assert scanner.deep_scans == 6 and scanner.stats()["tracked_windows"] == 3
+
+
+def test_incremental_scanner_refreshes_windows_older_than_max_age():
+    clock = SimClock()
+    desktop = RecordedDesktop([{"Terminal": [LOG]}, {"Terminal": [("Log", ("OK",))]}])
+    scanner = IncrementalScanner(desktop.list_titles, desktop.deep_scan, max_age=30.0, clock=clock)
+    desktop.show(0)
+    assert list(scanner.scan(["Terminal"])) == []
+
+    # Buttons appearing under an unchanged title are only seen once the cached result is max_age old
+    desktop.show(1)
+    clock.advance(29.0)
+    assert list(scanner.scan(["Terminal"])) == []
+    clock.advance(1.0)
+    assert list(scanner.scan(["Terminal"])) == [DialogWindow("Terminal", "Log", 1, ("OK",))]
+
+
+class StubCompiler:
+    """Stand-in for osacompile that copies the source to the output file, or fails like a missing binary"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self, cmd, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise FileNotFoundError(cmd[0])
+        shutil.copyfile(cmd[-1], cmd[cmd.index("-o") + 1])
+        return copilot_helper.subprocess.CompletedProcess(cmd, 0, stdout="", stderr="")
+
+
+PROBE = ScriptTemplate("probe", "AppleScript", 'on run argv\n    return item 1 of argv\nend run\n')
+
+
+def test_script_cache_key_changes_with_the_version_and_the_source(tmp_path):
+    cache = CompiledScriptCache(str(tmp_path), version="1.0", compiler=StubCompiler())
+    assert cache.key(PROBE) == CompiledScriptCache(str(tmp_path), version="1.0").key(PROBE)
+    assert cache.key(PROBE) != CompiledScriptCache(str(tmp_path), version="1.1").key(PROBE)
+    assert cache.key(PROBE) != cache.key(PROBE._replace(source=PROBE.source + "-- edited\n"))
+    assert cache.key(PROBE) != cache.key(PROBE._replace(language="JavaScript"))
+
+
+def test_compiled_scripts_are_reused_across_restarts(tmp_path):
+    compiler = StubCompiler()
+    cache = CompiledScriptCache(str(tmp_path), version="1.0", compiler=compiler)
+    path = cache.lookup(PROBE)
+    assert path == cache.path_for(PROBE) and os.path.basename(path).startswith("probe-")
+    assert cache.lookup(PROBE) == path and compiler.calls == 1
+    with open(path) as f:
+        assert f.read() == PROBE.source
+
+    restarted = StubCompiler()
+    assert CompiledScriptCache(str(tmp_path), version="1.0", compiler=restarted).lookup(PROBE) == path
+    assert restarted.calls == 0
+
+
+def test_compiling_a_new_version_prunes_the_old_files(tmp_path):
+    CompiledScriptCache(str(tmp_path), version="1.0", compiler=StubCompiler()).lookup(PROBE)
+    other = ScriptTemplate("probe_all", "AppleScript", PROBE.source)
+    other_path = CompiledScriptCache(str(tmp_path), version="1.0", compiler=StubCompiler()).lookup(other)
+
+    upgraded = CompiledScriptCache(str(tmp_path), version="2.0", compiler=StubCompiler())
+    path = upgraded.lookup(PROBE)
+    # Only the template's own older file goes, not probe_all-*, which merely shares the prefix
+    assert sorted(os.listdir(str(tmp_path))) == sorted([os.path.basename(path), os.path.basename(other_path)])
+    assert upgraded.prune(PROBE) == 0
+
+
+def test_failed_compile_falls_back_to_source_without_retrying(tmp_path):
+    compiler = StubCompiler(fail=True)
+    cache = CompiledScriptCache(str(tmp_path), compiler=compiler)
+    assert cache.lookup(PROBE) is None and cache.lookup(PROBE) is None
+    assert compiler.calls == 1 and cache.failures == 1
+    assert os.listdir(str(tmp_path)) == []
+
+    rejected = CompiledScriptCache(str(tmp_path / "rejected"), compiler=lambda cmd, **kwargs: (
+        copilot_helper.subprocess.CompletedProcess(cmd, 1, stdout="", stderr="syntax error")))
+    assert rejected.lookup(PROBE) is None
+
+
+def test_helper_runs_templates_from_source_when_osacompile_fails(tmp_path, desktop):
+    cache = CompiledScriptCache(str(tmp_path / "scripts"), compiler=StubCompiler(fail=True))
+    helper = make_helper(tmp_path, desktop, script_cache=cache)
+    template = SCRIPT_TEMPLATES["click_button"]
+    command = helper.build_template_command("501", "click_button", ["Terminal", 1, "Run command?", "Continue"])
+    assert command[4:7] == ["-l", template.language, "-e"] and command[7] == template.source
+    assert command[8:] == ["Terminal", "1", "Run command?", "Continue"]
+
+    compiled = make_helper(tmp_path, desktop, script_cache=CompiledScriptCache(str(tmp_path / "ok"),
+                                                                               compiler=StubCompiler()))
+    command = compiled.build_template_command("501", "click_button", ["Terminal", 1, "Run command?", "Continue"])
+    assert command[4].endswith(".scpt") and command[5:] == ["Terminal", "1", "Run command?", "Continue"]
+
+
+class FakeConsoleResolver(SessionResolver):
+    """Session resolver over a console device whose owner the test sets"""
+
+    def __init__(self, owner, **kwargs):
+        super().__init__(**kwargs)
+        self.owner = owner
+
+    def _read_console_owner(self):
+        return self.owner
+
+    def lookup_user(self):
+        # The path taken without PyObjC, whichever platform runs the tests
+        return self._lookup_user_console()
+
+
+class FakePasswordDatabase:
+    """Stand-in for the pwd module with a fixed set of users"""
+
+    def __init__(self, users):
+        self.users = users
+
+    def getpwuid(self, uid):
+        if uid not in self.users:
+            raise KeyError(uid)
+        return type("passwd", (), {"pw_name": self.users[uid], "pw_uid": uid})
+
+    def getpwnam(self, name):
+        for uid, user in self.users.items():
+            if user == name:
+                return self.getpwuid(uid)
+        raise KeyError(name)
+
+
+class FallbackRunner:
+    """Stand-in for the subprocesses the resolver falls back to"""
+
+    def __init__(self, console_user="", ids=None):
+        self.console_user = console_user
+        self.ids = ids or {}
+        self.calls = []
+
+    def __call__(self, cmd, **kwargs):
+        self.calls.append(cmd[0])
+        if cmd[0] == "id":
+            uid = self.ids.get(cmd[-1])
+            return copilot_helper.subprocess.CompletedProcess(cmd, 0 if uid else 1, stdout=f"{uid}\n", stderr="")
+        return copilot_helper.subprocess.CompletedProcess(cmd, 0, stdout=self.console_user + "\n", stderr="")
+
+
+@pytest.fixture
+def users(monkeypatch):
+    database = FakePasswordDatabase({0: "root", 501: "alice", 502: "bob"})
+    monkeypatch.setattr(copilot_helper, "pwd", database)
+    return database
+
+
+def test_session_is_cached_for_its_ttl(users):
+    clock = SimClock()
+    resolver = FakeConsoleResolver(501, ttl=30.0, clock=clock)
+    assert resolver.resolve() == ("alice", "501")
+    clock.advance(29.9)
+    assert resolver.resolve() == ("alice", "501") and resolver.resolutions == 1
+    clock.advance(0.1)
+    assert resolver.resolve() == ("alice", "501") and resolver.resolutions == 2
+
+
+def test_console_owner_change_is_picked_up_at_once(users):
+    clock = SimClock()
+    resolver = FakeConsoleResolver(501, ttl=30.0, clock=clock)
+    resolver.resolve()
+    # Fast user switching: the console changes hands well within the TTL
+    resolver.owner = 502
+    assert resolver.resolve() == ("bob", "502") and resolver.resolutions == 2
+
+
+def test_login_window_means_no_user_and_is_rechecked_sooner(users):
+    clock = SimClock()
+    resolver = FakeConsoleResolver(0, ttl=30.0, negative_ttl=2.0, clock=clock)
+    assert resolver.resolve() == ("", "")
+    clock.advance(2.0)
+    resolver.resolve()
+    assert resolver.resolutions == 2
+
+
+def test_unknown_console_owner_falls_back_to_pyobjc_and_id(users):
+    runner = FallbackRunner(console_user="carol", ids={"carol": "503"})
+    resolver = FakeConsoleResolver(503, command_runner=runner, clock=SimClock())
+    assert resolver.resolve() == ("carol", "503")
+    assert runner.calls == ["python3", "id"]
+
+    # PyObjC reporting the login window also means no user
+    runner = FallbackRunner(console_user="")
+    resolver = FakeConsoleResolver(None, command_runner=runner, clock=SimClock())
+    assert resolver.resolve() == ("", "") and runner.calls == ["python3"]
+
+
+def test_failed_asuser_invalidates_the_cached_session(tmp_path, desktop, users):
+    clock = SimClock()
+    resolver = FakeConsoleResolver(501, ttl=30.0, clock=clock)
+    failures = []
+
+    def run(cmd, **kwargs):
+        if failures:
+            return copilot_helper.subprocess.CompletedProcess(cmd, 1, stdout="", stderr=failures.pop())
+        return copilot_helper.subprocess.CompletedProcess(cmd, 0, stdout="ok", stderr="")
+
+    helper = make_helper(tmp_path, desktop, command_runner=run, session_resolver=resolver, script_host="spawn")
+    assert helper.run_applescript_as_user("probe") == (True, "ok")
+
+    # An AppleScript error keeps the session; launchctl refusing the UID drops it
+    failures.append("execution error: System Events got an error (-1719)")
+    helper.run_applescript_as_user("probe")
+    assert resolver.cached() == ("alice", "501")
+    failures.append("Could not switch to audit session 0x1234: launchctl asuser failed")
+    helper.run_applescript_as_user("probe")
+    assert resolver.cached() is None
+
+    helper.run_applescript_as_user("probe")
+    assert resolver.resolutions == 2
@@ -4,11 +4,23 @@ Test Dialog Generator for Copilot Helper
 
 This script creates various types of dialogs to test the helper's functionality.
 Run this while the helper is running to see auto-clicking in action.
+
+With --load it becomes a load generator: dialogs with mixed button sets are
+opened at a target rate, several at once, and the time from creation to
+dismissal is measured for each. On Linux (or with --source simulated) the
+dialogs go to an in-process helper watching a simulated desktop.
 """
 
 import subprocess
 import time
 import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
 
 
 def create_applescript_dialog(message, buttons, default_button=None):
@@ -113,15 +125,258 @@ def create_system_dialog():
         return f"Error: {e}"
 
 
+# Button sets for load runs, with the button the default configuration
+# (auto_approve on, auto_deny off) should press; None means leave it open
+LOAD_MIX = [
+    (["Cancel", "Continue"], "Continue"),
+    (["Deny", "Allow"], "Allow"),
+    (["Decline", "Accept"], "Accept"),
+    (["Skip", "Install"], "Install"),
+    (["OK"], "OK"),
+    (["Don't Save", "Cancel", "Save"], None),
+    (["Cancel", "Delete"], None),
+]
+
+
+class MacDialogSource:
+    """Real dialogs from osascript, which the helper sees as the osascript process
+    
+    A dialog's creation time is taken just before osascript launches, so
+    latencies include its start-up (typically around 0.1 s).
+    """
+    
+    name = "mac"
+    
+    def show(self, title, buttons, timeout):
+        """Show a dialog until it is dismissed or gives up; return (button, dismissed_at)"""
+        buttons_str = ', '.join(f'"{btn}"' for btn in buttons)
+        script = (f'display dialog "{title}" buttons {{{buttons_str}}} '
+                  f'giving up after {max(1, math.ceil(timeout))}')
+        try:
+            result = subprocess.run(['osascript', '-e', script],
+                                    capture_output=True, text=True, timeout=timeout + 5)
+        except subprocess.TimeoutExpired:
+            return None, None
+        dismissed_at = time.monotonic()
+        # "button returned:Continue, gave up:false"
+        fields = dict(part.split(":", 1) for part in result.stdout.strip().split(", ") if ":" in part)
+        # A "Cancel" button is the dialog's cancel button: clicking it fails the script with -128
+        if result.returncode != 0 and ("-128" in result.stderr or "User canceled" in result.stderr):
+            return "Cancel", dismissed_at
+        if result.returncode != 0 or fields.get("gave up") == "true":
+            return None, None
+        return fields.get("button returned") or None, dismissed_at
+    
+    def close(self):
+        pass
+
+
+class SimulatedDialogSource:
+    """Dialogs on a simulated desktop, dismissed by a helper running in this process"""
+    
+    name = "simulated"
+    
+    def __init__(self, overrides=None, latency=0.02, process="osascript"):
+        from copilot_helper import CopilotHelper, SimulatedDesktop
+        
+        self.process = process
+        self.workdir = tempfile.mkdtemp(prefix="copilot_helper_load_")
+        config = CopilotHelper.isolated_config(self.workdir)
+        config.update({
+            "enabled": True,
+            "ui_backend": "simulated",
+            "log_level": "WARNING",
+            # The helper shares this process with the load generator, whose CPU is not its own
+            "cpu_budget_percent": 0
+        })
+        config.update(overrides or {})
+        config_file = os.path.join(self.workdir, "config.json")
+        with open(config_file, "w") as f:
+            json.dump(config, f)
+        
+        self.desktop = SimulatedDesktop(latency=latency)
+        self.desktop.launch(process)
+        self.helper = CopilotHelper(config_file, backend=self.desktop)
+        self._clicked = {}
+        self._seen = 0
+        self._lock = threading.Lock()
+        self.helper.start()
+    
+    def _take_click(self, title):
+        """Pop the (button, time) the helper clicked in the titled window, if it has"""
+        with self._lock:
+            clicks = self.desktop.clicks
+            for clicked_at, _, clicked_title, button in clicks[self._seen:]:
+                self._clicked[clicked_title] = (button, clicked_at)
+            self._seen = len(clicks)
+            return self._clicked.pop(title, (None, None))
+    
+    def show(self, title, buttons, timeout):
+        """Show a dialog until it is dismissed or times out; return (button, dismissed_at)"""
+        self.desktop.open_window(self.process, title, buttons)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            button, clicked_at = self._take_click(title)
+            if button is not None:
+                return button, clicked_at
+            time.sleep(0.001)
+        if self.desktop.close_window(self.process, title):
+            return None, None
+        return self._take_click(title)
+    
+    def close(self):
+        if self.helper.is_running:
+            self.helper.stop()
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_load(source, count, rate, concurrency, timeout, seed=0):
+    """Open count dialogs at rate per second, at most concurrency at once
+    
+    Returns one record per dialog: the buttons shown, the expected and the
+    pressed button, and creation and dismissal times (time.monotonic()).
+    """
+    rng = random.Random(seed)
+    slots = threading.Semaphore(concurrency)
+    results = []
+    results_lock = threading.Lock()
+    
+    def dialog(serial, buttons, expected):
+        try:
+            created = time.monotonic()
+            button, dismissed = source.show(f"Load test dialog {serial}", buttons, timeout)
+            with results_lock:
+                results.append({
+                    "serial": serial, "buttons": buttons, "expected": expected, "button": button,
+                    "created": created, "dismissed": dismissed
+                })
+        finally:
+            slots.release()
+    
+    workers = []
+    started = time.monotonic()
+    for serial in range(count):
+        # Open-loop arrivals; a full set of open dialogs delays the next one
+        delay = started + serial / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        slots.acquire()
+        buttons, expected = rng.choice(LOAD_MIX)
+        worker = threading.Thread(target=dialog, args=(serial, buttons, expected), daemon=True)
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()
+    return sorted(results, key=lambda result: result["serial"])
+
+
+def summarize_load(results):
+    """Dismissal latency percentiles, throughput, missed dialogs and wrong clicks"""
+    latencies = [r["dismissed"] - r["created"] for r in results if r["button"] is not None]
+    first = min((r["created"] for r in results), default=0.0)
+    last = max((r["dismissed"] or r["created"] for r in results), default=0.0)
+    elapsed = last - first
+    summary = {
+        "dialogs": len(results),
+        "dismissed": len(latencies),
+        "missed": sum(1 for r in results if r["expected"] and r["button"] is None),
+        "wrong": sum(1 for r in results if r["button"] is not None and r["button"] != r["expected"]),
+        "left_alone": sum(1 for r in results if r["expected"] is None and r["button"] is None),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "latency": None
+    }
+    if latencies:
+        summary["latency"] = {
+            "p50": percentile(latencies, 0.5), "p90": percentile(latencies, 0.9),
+            "p95": percentile(latencies, 0.95), "p99": percentile(latencies, 0.99), "max": max(latencies)
+        }
+    return summary
+
+
+def print_load_summary(summary):
+    print(f"Dialogs: {summary['dialogs']} opened, {summary['dismissed']} dismissed, "
+          f"{summary['left_alone']} correctly left open")
+    print(f"Missed: {summary['missed']}   Wrong button: {summary['wrong']}")
+    print(f"Throughput: {summary['throughput']:.2f} dismissals/s over {summary['elapsed']:.1f}s")
+    latency = summary["latency"]
+    if latency:
+        print(f"Time to dismiss: p50 {latency['p50'] * 1000:.0f} ms, p90 {latency['p90'] * 1000:.0f} ms, "
+              f"p95 {latency['p95'] * 1000:.0f} ms, p99 {latency['p99'] * 1000:.0f} ms, "
+              f"max {latency['max'] * 1000:.0f} ms")
+
+
+def load_test(args):
+    """Run the load generator and exit non-zero on missed or wrong clicks or a blown p95 budget"""
+    source_name = args.source or ("mac" if sys.platform == "darwin" else "simulated")
+    if source_name == "mac":
+        source = MacDialogSource()
+        print("Make sure the helper is running: copilot-helper start")
+    else:
+        overrides = {}
+        for setting in args.set or []:
+            key, _, value = setting.partition("=")
+            try:
+                overrides[key] = json.loads(value)
+            except ValueError:
+                overrides[key] = value
+        if args.check_interval is not None:
+            overrides["check_interval"] = args.check_interval
+        source = SimulatedDialogSource(overrides)
+    
+    print(f"🚦 Load test: {args.count} dialogs at {args.rate}/s, up to {args.concurrency} open "
+          f"({source.name} desktop)")
+    try:
+        results = run_load(source, args.count, args.rate, args.concurrency, args.timeout, args.seed)
+    finally:
+        source.close()
+    
+    summary = summarize_load(results)
+    if args.json:
+        print(json.dumps({"summary": summary, "dialogs": results}, indent=2))
+    else:
+        print_load_summary(summary)
+    
+    failed = summary["missed"] or summary["wrong"]
+    if args.max_p95 is not None and summary["latency"] and summary["latency"]["p95"] > args.max_p95:
+        print(f"❌ p95 time to dismiss above {args.max_p95}s")
+        failed = True
+    return 1 if failed else 0
+
+
 def main():
     parser = argparse.ArgumentParser(description="Test dialogs for Copilot Helper")
     parser.add_argument("--test-type", choices=["positive", "negative", "mixed", "system", "all"], 
                        default="all", help="Type of dialogs to test")
     parser.add_argument("--delay", type=float, default=3.0, 
                        help="Delay between dialogs (seconds)")
+    parser.add_argument("--load", action="store_true",
+                       help="Generate load and report time to dismiss instead of the interactive tests")
+    parser.add_argument("--source", choices=["mac", "simulated"],
+                       help="Where load dialogs appear (default: mac on macOS, simulated elsewhere)")
+    parser.add_argument("--count", type=int, default=50, help="Dialogs to open in a load run")
+    parser.add_argument("--rate", type=float, default=1.0, help="Dialogs opened per second in a load run")
+    parser.add_argument("--concurrency", type=int, default=4, help="Most dialogs open at once in a load run")
+    parser.add_argument("--timeout", type=float, default=5.0,
+                       help="Seconds before an undismissed load dialog counts as missed")
+    parser.add_argument("--check-interval", type=float,
+                       help="check_interval of the simulated helper (default: the helper's default)")
+    parser.add_argument("--set", action="append", metavar="KEY=VALUE",
+                       help="Other setting of the simulated helper, value as JSON (repeatable)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the button mix")
+    parser.add_argument("--max-p95", type=float, help="Fail if p95 time to dismiss exceeds this (seconds)")
+    parser.add_argument("--json", action="store_true", help="Print the load report and every dialog as JSON")
     
     args = parser.parse_args()
     
+    if args.load:
+        sys.exit(load_test(args))
+    
     print("🧪 Copilot Helper Dialog Tester")
     print("=================================")
     print()